@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+SharePoint Change Index
+Remembers, per driveItem ID, the version a file had when it was last classified (or
+embedded) together with the result, so unchanged files are skipped without being
+downloaded. Versions compare on content first: quickXorHash + size, then cTag, and the
+eTag only as a last resort, because writing classification metadata back changes the
+eTag but not the content. The hash also finds identical files elsewhere in the library,
+whose result can be reused instead of recomputed.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = Path(__file__).parent.parent / "data" / "sync" / "change_index.db"
+
+# What a result is for; each scope is tracked separately
+CLASSIFY = "classify"
+EMBED = "embed"
+
+# Check outcomes
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+DUPLICATE = "duplicate"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    scope TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    name TEXT,
+    etag TEXT,
+    ctag TEXT,
+    size INTEGER,
+    quick_xor_hash TEXT,
+    result TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (scope, item_id)
+);
+CREATE INDEX IF NOT EXISTS idx_items_content ON items (scope, quick_xor_hash, size);
+"""
+
+
+@dataclass
+class Fingerprint:
+    """Version of a driveItem as listed by Graph."""
+    etag: Optional[str] = None
+    ctag: Optional[str] = None
+    size: Optional[int] = None
+    quick_xor_hash: Optional[str] = None
+
+    @classmethod
+    def from_item(cls, item: Dict) -> "Fingerprint":
+        hashes = (item.get("file") or {}).get("hashes") or {}
+        return cls(item.get("eTag"), item.get("cTag"), item.get("size"), hashes.get("quickXorHash"))
+
+    def same_content(self, other: "Fingerprint") -> bool:
+        if self.quick_xor_hash and other.quick_xor_hash:
+            sizes_known = self.size is not None and other.size is not None
+            return self.quick_xor_hash == other.quick_xor_hash and (not sizes_known or self.size == other.size)
+        if self.ctag and other.ctag:
+            return self.ctag == other.ctag
+        if self.etag and other.etag:
+            return self.etag == other.etag
+        return False
+
+
+@dataclass
+class ChangeCheck:
+    """What the index knows about a listed file."""
+    status: str                          # NEW, CHANGED, UNCHANGED or DUPLICATE
+    result: Optional[Dict] = None        # stored result for UNCHANGED / DUPLICATE
+    source_item_id: Optional[str] = None # the identical file a DUPLICATE's result came from
+
+
+class ChangeIndex:
+    """Per-item version and result store for skipping unchanged SharePoint files."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Args:
+            db_path: SQLite database path (env CHANGE_INDEX_DB)
+        """
+        self.db_path = Path(db_path or os.getenv("CHANGE_INDEX_DB", str(DEFAULT_DB_PATH)))
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30,
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def check(self, scope: str, item: Dict) -> ChangeCheck:
+        """
+        Compare a listed driveItem against what was recorded for it.
+
+        Args:
+            scope: CLASSIFY or EMBED
+            item: driveItem JSON (needs id; eTag/cTag/size/file.hashes when available)
+        """
+        current = Fingerprint.from_item(item)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, ctag, size, quick_xor_hash, result FROM items WHERE scope = ? AND item_id = ?",
+                (scope, item["id"])
+            ).fetchone()
+            if row is not None and Fingerprint(*row[:4]).same_content(current):
+                return ChangeCheck(UNCHANGED, json.loads(row[4]) if row[4] else None)
+
+            if current.quick_xor_hash:
+                twin = self._conn.execute(
+                    "SELECT item_id, size, result FROM items WHERE scope = ? AND quick_xor_hash = ? "
+                    "AND item_id != ? ORDER BY updated_at DESC LIMIT 1",
+                    (scope, current.quick_xor_hash, item["id"])
+                ).fetchone()
+                if twin is not None and (current.size is None or twin[1] is None or twin[1] == current.size):
+                    return ChangeCheck(DUPLICATE, json.loads(twin[2]) if twin[2] else None, twin[0])
+
+        return ChangeCheck(NEW if row is None else CHANGED)
+
+    def record(self, scope: str, item: Dict, result: Optional[Dict] = None):
+        """Store the version a file was just processed at, with its result."""
+        fp = Fingerprint.from_item(item)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO items (scope, item_id, name, etag, ctag, size, quick_xor_hash, result, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (scope, item_id) DO UPDATE SET name = excluded.name, etag = excluded.etag, "
+                "ctag = excluded.ctag, size = excluded.size, quick_xor_hash = excluded.quick_xor_hash, "
+                "result = excluded.result, updated_at = excluded.updated_at",
+                (scope, item["id"], item.get("name"), fp.etag, fp.ctag, fp.size, fp.quick_xor_hash,
+                 json.dumps(result) if result is not None else None, time.time())
+            )
+
+    def forget(self, item_ids: Iterable[str]) -> int:
+        """Drop deleted items from every scope."""
+        ids = list(item_ids)
+        with self._lock:
+            removed = self._conn.executemany("DELETE FROM items WHERE item_id = ?", ((i,) for i in ids)).rowcount
+        if ids:
+            logger.info(f"🗑️ Forgot {len(ids)} deleted items in the change index")
+        return removed
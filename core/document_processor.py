@@ -5,7 +5,9 @@ Simple Document Processor for testing the enhanced classification system.
 
 import os
 import PyPDF2
-from typing import Optional
+from typing import Iterator, Optional
+
+from core.extraction_cache import get_extraction_cache
 
 class DocumentProcessor:
     """Simple document processor for testing purposes."""
@@ -13,18 +15,25 @@ class DocumentProcessor:
     def __init__(self):
         pass
     
+    def _read_pdf_pages(self, file_path: str) -> Iterator[str]:
+        """Extract text from each PDF page, one page at a time."""
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            
+            for page in pdf_reader.pages:
+                yield page.extract_text()
+    
+    def iter_pdf_pages(self, file_path: str) -> Iterator[str]:
+        """Yield PDF page text lazily so callers can stop after the pages they need."""
+        cache = get_extraction_cache()
+        if cache is None:
+            return self._read_pdf_pages(file_path)
+        return cache.iter_or_extract(file_path, "pypdf2", None, lambda: self._read_pdf_pages(file_path))
+    
     def extract_text_from_pdf(self, file_path: str) -> str:
         """Extract text from PDF file."""
         try:
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text += page.extract_text() + "\n"
-            
-            return text.strip()
+            return "\n".join(self.iter_pdf_pages(file_path)).strip()
             
         except Exception as e:
             return f"Error extracting text from PDF: {str(e)}"
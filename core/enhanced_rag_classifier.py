@@ -480,8 +480,12 @@ class EnhancedRAGClassifier:
         except Exception as e:
             logger.error(f"Error adding classification examples: {e}")
     
-    def store_processed_document(self, text: str, filename: str, doc_type: str, doc_category: str, confidence: str):
-        """Store processed document in vector database for future RAG context."""
+    def store_processed_document(self, text: str, filename: str, doc_type: str, doc_category: str, confidence: str,
+                                 item_id: Optional[str] = None):
+        """Store processed document in vector database for future RAG context.
+
+        `item_id` (the SharePoint driveItem ID) lets delta sync remove the point when the file is deleted.
+        """
         try:
             # Create document hash for ID
             doc_hash = hashlib.md5(f"{filename}_{text[:100]}".encode()).hexdigest()
@@ -500,7 +504,8 @@ class EnhancedRAGClassifier:
                     "doc_type": doc_type,
                     "doc_category": doc_category,
                     "confidence": confidence,
-                    "type": "processed_document"
+                    "type": "processed_document",
+                    **({"item_id": item_id} if item_id else {})
                 }
             )
             
@@ -614,7 +619,7 @@ class EnhancedRAGClassifier:
             print(f"❌ Error getting RAG context: {e}")
             return [], []
     
-    def classify_with_rag(self, document_text: str, filename: str) -> Dict:
+    def classify_with_rag(self, document_text: str, filename: str, item_id: Optional[str] = None) -> Dict:
         """
         NEW 3-MODEL CLASSIFICATION PIPELINE:
         1. Get RAG context from Qdrant vector database (preserve existing logic)
@@ -622,6 +627,9 @@ class EnhancedRAGClassifier:
         3. If primary fails/low confidence, try FALLBACK CLASSIFIER: Mistral
         4. Validate result with BART-MNLI zero-shot classifier
         5. Return enhanced result with confidence scoring
+
+        `item_id` is the SharePoint driveItem ID, stored with the document point so delta
+        sync can remove it when the file is deleted.
         """
         logger.info(f"🚀 Starting 3-Model RAG Classification Pipeline for {filename}")
         
@@ -673,7 +681,8 @@ class EnhancedRAGClassifier:
                 self.store_processed_document(
                     document_text, filename,
                     enhanced_result["doc_type"], enhanced_result["doc_category"],
-                    enhanced_result.get("confidence", "Medium")
+                    enhanced_result.get("confidence", "Medium"),
+                    item_id=item_id
                 )
             
             logger.info(f"🎯 3-Model classification complete: {enhanced_result.get('doc_type')} | {enhanced_result.get('doc_category')} | Confidence: {enhanced_result.get('confidence')}")
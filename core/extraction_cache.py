@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Content-addressed Extraction Cache
+Caches page-level extraction/OCR output keyed by the SHA-256 of the file bytes plus the
+extractor name, version and settings. Entries are zlib-compressed shards on disk with a
+SQLite index and size-based LRU eviction, so re-running a file costs a hash and a read.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bump when extraction output changes so stale entries are never served
+EXTRACTOR_VERSION = "1"
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / "data" / "cache" / "extraction"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(content_digest: str, extractor: str, settings: Optional[Dict] = None) -> str:
+    """Cache key for a file digest under a given extractor configuration."""
+    material = json.dumps(
+        [content_digest, extractor, EXTRACTOR_VERSION, settings or {}],
+        sort_keys=True
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """Disk cache of extracted pages."""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = Path(cache_dir or os.getenv("EXTRACTION_CACHE_DIR", str(DEFAULT_CACHE_DIR)))
+        self.max_bytes = max_bytes or int(os.getenv("EXTRACTION_CACHE_MAX_MB", "2048")) * 1024 * 1024
+        self.shard_dir = self.cache_dir / "shards"
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    def _db(self) -> sqlite3.Connection:
+        # Connections must not cross a fork (OCR/extraction pools)
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(str(self.cache_dir / "index.db"), timeout=30,
+                                   check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _shard_path(self, key: str) -> Path:
+        return self.shard_dir / key[:2] / f"{key}.json.z"
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a cached entry ({"pages": [...], "meta": {...}}) or None."""
+        path = self._shard_path(key)
+        try:
+            with open(path, "rb") as fh:
+                entry = json.loads(zlib.decompress(fh.read()).decode("utf-8"))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache shard {path.name}: {e}")
+            self.delete(key)
+            return None
+
+        with self._lock:
+            self._db().execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        return entry
+
+    def put(self, key: str, pages: List[str], meta: Optional[Dict] = None):
+        """Store extracted pages under a key."""
+        payload = zlib.compress(json.dumps({"pages": pages, "meta": meta or {}}).encode("utf-8"), 6)
+        path = self._shard_path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as fh:
+            fh.write(payload)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO entries (key, size, created, last_access) VALUES (?, ?, ?, ?)",
+                (key, len(payload), now, now)
+            )
+        self._evict()
+
+    def delete(self, key: str):
+        self._shard_path(key).unlink(missing_ok=True)
+        with self._lock:
+            self._db().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._db().execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its limit."""
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+
+        target = int(self.max_bytes * 0.9)
+        with self._lock:
+            rows = self._db().execute("SELECT key, size FROM entries ORDER BY last_access").fetchall()
+        evicted = 0
+        for key, size in rows:
+            if total <= target:
+                break
+            self.delete(key)
+            total -= size
+            evicted += 1
+        logger.info(f"🧹 Evicted {evicted} extraction cache entries ({total} bytes remain)")
+
+    def get_or_extract(self, file_path: str, extractor: str, settings: Optional[Dict],
+                       extract_fn: Callable[[], Tuple[List[str], Dict]],
+                       digest: Optional[str] = None) -> Dict:
+        """
+        Return cached pages for a file, running `extract_fn` on a miss.
+
+        Args:
+            file_path: File being extracted
+            extractor: Extractor name
+            settings: Extractor settings that affect output
+            extract_fn: Produces (page_texts, metadata) on a cache miss; results with
+                metadata {"incomplete": True} are returned but not cached
+            digest: Precomputed SHA-256 of the file, if the caller already has one
+
+        Returns:
+            {"pages": [...], "meta": {...}}
+        """
+        key = make_key(digest or file_digest(file_path), extractor, settings)
+        entry = self.get(key)
+        if entry is not None:
+            logger.info(f"♻️ Extraction cache hit for {os.path.basename(file_path)} ({extractor})")
+            return entry
+
+        pages, meta = extract_fn()
+        if meta.get("incomplete"):
+            logger.warning(f"Not caching incomplete extraction of {os.path.basename(file_path)}")
+        else:
+            self.put(key, pages, meta)
+        return {"pages": pages, "meta": meta}
+
+    def iter_or_extract(self, file_path: str, extractor: str, settings: Optional[Dict],
+                        iter_fn: Callable[[], Iterable[str]],
+                        digest: Optional[str] = None) -> Iterator[str]:
+        """
+        Yield cached pages for a file, or stream them from `iter_fn` on a miss.
+
+        Streamed pages are stored only once `iter_fn` is exhausted, so a consumer that
+        stops early never leaves a truncated entry behind.
+        """
+        key = make_key(digest or file_digest(file_path), extractor, settings)
+        entry = self.get(key)
+        if entry is not None:
+            logger.info(f"♻️ Extraction cache hit for {os.path.basename(file_path)} ({extractor})")
+            yield from entry["pages"]
+            return
+
+        pages = []
+        for page in iter_fn():
+            pages.append(page)
+            yield page
+        self.put(key, pages)
+
+
+_cache_instance = None
+
+
+def get_extraction_cache() -> Optional[ExtractionCache]:
+    """Process-wide cache, or None when disabled with EXTRACTION_CACHE=off."""
+    global _cache_instance
+    if os.getenv("EXTRACTION_CACHE", "on").lower() in ("0", "off", "false", "no"):
+        return None
+    if _cache_instance is None:
+        _cache_instance = ExtractionCache()
+    return _cache_instance
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Server-side File Extraction Service
+Streams uploads to temp files and runs text extraction/OCR in a process pool.
+Extracted text is served from the content-addressed extraction cache by upload hash.
+"""
+
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional, Tuple
+
+from scripts.utils.extract_all import FULL_MODE, cached_text_for_digest
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".jpg", ".jpeg", ".png"}
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+
+def _extract_in_worker(file_path: str, digest: str, mode: str) -> str:
+    """Process pool entry point; imports the extraction stack inside the worker."""
+    from scripts.utils.extract_all import extract_text_from_file
+    try:
+        return extract_text_from_file(file_path, digest=digest, mode=mode)
+    except ValueError:
+        raise
+    except Exception as e:
+        # Some extractor exceptions (e.g. pytesseract's) cannot be unpickled in the
+        # parent and would break the pool, so re-raise as a plain error
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+
+async def spool_upload(upload, max_bytes: int, suffix: str = "") -> Tuple[str, str, int]:
+    """
+    Stream an UploadFile to a named temp file, hashing on the fly.
+
+    The extractors need a real path, so the body is written once, straight to disk;
+    the caller removes the file.
+
+    Returns:
+        (temp_path, sha256_hex, size_in_bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        with tmp:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"Upload exceeds {max_bytes // (1024 * 1024)} MB limit")
+                digest.update(chunk)
+                tmp.write(chunk)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+    return tmp.name, digest.hexdigest(), size
+
+
+class FileExtractionService:
+    """Runs the extraction/OCR pipeline in a process pool backed by the extraction cache."""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 2)))
+        self.max_upload_bytes = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+        self._pool = self._new_pool()
+        logger.info(f"✅ File extraction service ready with {self.max_workers} worker process(es)")
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # Spawned (not forked): the API process already runs scheduler/queue threads, may
+        # hold models, and its lock files must not outlive it in orphaned workers
+        return ProcessPoolExecutor(max_workers=self.max_workers,
+                                   mp_context=multiprocessing.get_context("spawn"))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def extract_upload(self, upload, filename: str, mode: str = FULL_MODE) -> Tuple[str, str, bool]:
+        """
+        Extract text from an uploaded file.
+        
+        Args:
+            upload: FastAPI UploadFile
+            filename: Original filename (used for the file type)
+            mode: "full", or "classify" to stop once there is enough text to classify
+
+        Returns:
+            (text, sha256_hex, cache_hit)
+        """
+        suffix = Path(filename).suffix.lower()
+        if suffix not in SUPPORTED_EXTENSIONS:
+            raise ValueError(f"Unsupported file type: {suffix or filename}")
+
+        tmp_path, digest, size = await spool_upload(upload, self.max_upload_bytes, suffix)
+        try:
+            cached = cached_text_for_digest(digest, mode)
+            if cached is not None:
+                logger.info(f"♻️ Extraction cache hit for {filename} ({digest[:12]})")
+                return cached, digest, True
+
+            logger.info(f"🔄 Extracting {filename} ({size} bytes) in process pool")
+            loop = asyncio.get_running_loop()
+            text = await loop.run_in_executor(self._pool, _extract_in_worker, tmp_path, digest, mode)
+        except BrokenProcessPool:
+            logger.error("❌ Extraction worker died; restarting process pool")
+            self._pool = self._new_pool()
+            raise RuntimeError(f"Extraction worker crashed while processing {filename}")
+        finally:
+            os.unlink(tmp_path)
+
+        return text, digest, False
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Microsoft Graph Client
+One shared, thread-safe Graph client for every SharePoint caller. It keeps a pooled
+keep-alive session, caches the app-only token and renews it before it expires, retries
+429/503/504 honouring Retry-After (with jitter so workers do not retry in lockstep), and
+caps the number of requests in flight per tenant, since Graph throttles per app+tenant.
+"""
+
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from msal import ConfidentialClientApplication
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+GRAPH_ROOT = "https://graph.microsoft.com/v1.0"
+GRAPH_SCOPES = ["https://graph.microsoft.com/.default"]
+
+GRAPH_MAX_CONCURRENCY = int(os.getenv("GRAPH_MAX_CONCURRENCY", "8"))
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "5"))
+GRAPH_TIMEOUT = float(os.getenv("GRAPH_TIMEOUT", "60"))
+# Renew the token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = int(os.getenv("GRAPH_TOKEN_REFRESH_MARGIN", "300"))
+MAX_BACKOFF = 60.0
+
+RETRY_STATUSES = (429, 503, 504)
+
+
+class GraphAuthError(RuntimeError):
+    """Raised when no access token could be acquired."""
+
+
+def retry_delay(attempt: int, retry_after: Optional[str] = None, base: float = 1.0) -> float:
+    """
+    Seconds to wait before retry number `attempt` (0-based).
+
+    Retry-After (seconds or an HTTP date) is a floor, stretched by up to 20% so that
+    workers throttled together do not come back together; without it the wait is
+    full-jitter exponential backoff.
+    """
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            delay = max(0.0, delay)
+            return min(MAX_BACKOFF, delay * random.uniform(1.0, 1.2))
+    return random.uniform(0, min(MAX_BACKOFF, base * 2 ** attempt))
+
+
+class _TenantLimiter:
+    """Concurrency cap and shared throttling pause for one tenant."""
+
+    def __init__(self, max_concurrency: int):
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.resume_at = 0.0
+
+    def pause(self, seconds: float):
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    def wait(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class GraphClient:
+    """Pooled Microsoft Graph client with token caching and throttling support."""
+
+    _limiters: Dict[str, _TenantLimiter] = {}
+    _limiters_lock = threading.Lock()
+
+    def __init__(self, tenant_id: str, client_id: str, client_secret: str,
+                 max_concurrency: int = GRAPH_MAX_CONCURRENCY, graph_root: str = GRAPH_ROOT,
+                 timeout: float = GRAPH_TIMEOUT, max_retries: int = GRAPH_MAX_RETRIES,
+                 backoff_base: float = 1.0, app=None):
+        """
+        Args:
+            tenant_id: Azure AD tenant ID
+            client_id: App registration client ID
+            client_secret: App registration secret
+            max_concurrency: Requests in flight per tenant, shared by every client of the tenant
+            graph_root: Graph base URL (overridable for tests)
+            timeout: Per-request timeout in seconds
+            max_retries: Retries on throttling or transient errors
+            backoff_base: First exponential backoff step in seconds
+            app: MSAL client application to use instead of building one
+        """
+        self.tenant_id = tenant_id
+        self.graph_root = graph_root.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.stats = {"requests": 0, "throttled": 0, "token_refreshes": 0}
+
+        self._app = app or ConfidentialClientApplication(
+            client_id,
+            authority=f"https://login.microsoftonline.com/{tenant_id}",
+            client_credential=client_secret
+        )
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+        with GraphClient._limiters_lock:
+            self._limiter = GraphClient._limiters.setdefault(tenant_id, _TenantLimiter(max_concurrency))
+
+        # Keep-alive pool sized to the concurrency cap; retries are handled here, not by urllib3
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, max_concurrency), max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    # ------------------------------------------------------------------ tokens
+
+    def access_token(self) -> str:
+        """Return a cached token, renewing it once it is within the refresh margin."""
+        if self._token and time.time() < self._expires_at - TOKEN_REFRESH_MARGIN:
+            return self._token
+        with self._token_lock:
+            if self._token and time.time() < self._expires_at - TOKEN_REFRESH_MARGIN:
+                return self._token
+            if self._token:
+                # MSAL would hand back the nearly expired token from its cache
+                self._app.remove_tokens_for_client()
+            result = self._app.acquire_token_for_client(scopes=GRAPH_SCOPES)
+            if not result or "access_token" not in result:
+                error_msg = (result or {}).get("error_description", "Unknown error")
+                raise GraphAuthError(f"Token acquisition failed: {error_msg}")
+            self._token = result["access_token"]
+            self._expires_at = time.time() + int(result.get("expires_in", 3600))
+            self.stats["token_refreshes"] += 1
+            logger.info("🔑 Acquired Microsoft Graph access token")
+            return self._token
+
+    @property
+    def limiter(self) -> _TenantLimiter:
+        """This tenant's concurrency cap and throttling pause (shared with async callers)."""
+        return self._limiter
+
+    def invalidate_token(self):
+        """Drop the cached token so the next request fetches a new one."""
+        with self._token_lock:
+            self._token = None
+            self._expires_at = 0.0
+            self._app.remove_tokens_for_client()
+
+    # ------------------------------------------------------------------ requests
+
+    def url(self, path: str) -> str:
+        return path if path.startswith("http") else f"{self.graph_root}/{path.lstrip('/')}"
+
+    def request(self, method: str, path: str, headers: Optional[Dict] = None,
+                auth: bool = True, **kwargs) -> requests.Response:
+        """
+        Send a request, retrying throttling and transient failures.
+
+        Args:
+            method: HTTP method
+            path: Absolute URL or a path relative to the Graph root
+            headers: Extra headers
+            auth: Send the bearer token (off for pre-authenticated download URLs)
+            **kwargs: Passed to requests (json, params, stream, timeout, ...)
+
+        Returns:
+            The final response; non-retryable error statuses are returned, not raised
+        """
+        url = self.url(path)
+        kwargs.setdefault("timeout", self.timeout)
+        reauthenticated = False
+        attempt = 0
+        while True:
+            request_headers = dict(headers or {})
+            if auth:
+                request_headers["Authorization"] = f"Bearer {self.access_token()}"
+            self._limiter.wait()
+            try:
+                with self._limiter.slots:
+                    self.stats["requests"] += 1
+                    response = self.session.request(method, url, headers=request_headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = retry_delay(attempt, base=self.backoff_base)
+                logger.warning(f"⚠️ Graph {method} failed ({type(e).__name__}); retrying in {delay:.1f}s")
+                attempt += 1
+                time.sleep(delay)
+                continue
+
+            if response.status_code == 401 and auth and not reauthenticated:
+                # Revoked or rotated credentials: one retry with a fresh token
+                reauthenticated = True
+                response.close()
+                self.invalidate_token()
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                delay = retry_delay(attempt, response.headers.get("Retry-After"), base=self.backoff_base)
+                self.stats["throttled"] += 1
+                # Throttling is per tenant, so every caller of the tenant waits it out
+                self._limiter.pause(delay)
+                logger.warning(f"⏳ Graph returned {response.status_code}; backing off {delay:.1f}s")
+                response.close()
+                attempt += 1
+                continue
+            return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", path, **kwargs)
+
+    def get_json(self, path: str, **kwargs) -> Dict:
+        """GET and decode the body, raising for error statuses."""
+        response = self.get(path, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_pages(self, path: str, **kwargs) -> Iterator[Dict]:
+        """Yield every item of a collection, following @odata.nextLink."""
+        url = path
+        while url:
+            data = self.get_json(url, **kwargs)
+            yield from data.get("value", [])
+            url = data.get("@odata.nextLink")
+
+    def close(self):
+        self.session.close()
+
+
+_shared_client: Optional[GraphClient] = None
+_shared_lock = threading.Lock()
+
+
+def get_graph_client() -> GraphClient:
+    """
+    Process-wide GraphClient built from TENANT_ID / CLIENT_ID / CLIENT_SECRET
+    (falling back to the AZURE_* names).
+    """
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            tenant_id = os.getenv("TENANT_ID") or os.getenv("AZURE_TENANT_ID")
+            client_id = os.getenv("CLIENT_ID") or os.getenv("AZURE_CLIENT_ID")
+            client_secret = os.getenv("CLIENT_SECRET") or os.getenv("AZURE_CLIENT_SECRET")
+            if not all([tenant_id, client_id, client_secret]):
+                raise GraphAuthError("Missing Graph credentials (TENANT_ID, CLIENT_ID, CLIENT_SECRET)")
+            _shared_client = GraphClient(tenant_id, client_id, client_secret)
+        return _shared_client
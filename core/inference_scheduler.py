@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Priority Inference Scheduler
+Single executor in front of the classifier models. Interactive requests and bulk work
+(batch endpoint, queued jobs) wait in separate queues and share the model by weight:
+each class is charged the model time it used divided by its weight, and the class with
+the least charged time runs next. A bulk batch is split into one task per document, so
+an interactive request never waits for more than the document already on the model.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Priority classes
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+INFERENCE_WEIGHTS = {
+    INTERACTIVE: float(os.getenv("INFERENCE_INTERACTIVE_WEIGHT", "8")),
+    BULK: float(os.getenv("INFERENCE_BULK_WEIGHT", "1")),
+}
+# Latency samples kept per class for the percentiles
+LATENCY_WINDOW = 1000
+
+
+@dataclass
+class _Task:
+    fn: Callable
+    args: tuple
+    kwargs: Dict
+    future: Future
+    priority: str
+    enqueued_at: float
+
+
+@dataclass
+class _ClassState:
+    weight: float
+    queue: Deque[_Task] = field(default_factory=deque)
+    vtime: float = 0.0                 # model seconds used / weight
+    running: int = 0
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    wait: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    latency: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+
+
+def _percentile(samples: List[float], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))], 4)
+
+
+class InferenceScheduler:
+    """Weighted-fair, priority-aware executor for model calls."""
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None,
+                 num_workers: int = INFERENCE_WORKERS, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            weights: Share of model time per class (defaults to INFERENCE_WEIGHTS)
+            num_workers: Concurrent model calls (1 for a single model instance)
+            clock: Time source (monotonic seconds)
+        """
+        weights = weights or INFERENCE_WEIGHTS
+        self.classes = {name: _ClassState(weight) for name, weight in weights.items()}
+        # Ties go to the heaviest class, so an idle interactive queue wins on arrival
+        self._order = sorted(self.classes, key=lambda name: -self.classes[name].weight)
+        self.num_workers = max(1, num_workers)
+        self.clock = clock
+        self._vclock = 0.0
+        self._cond = threading.Condition()
+        self._stop = False
+        self._workers: List[threading.Thread] = []
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def start(self):
+        self._stop = False
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"inference-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        shares = ", ".join(f"{name}={state.weight:g}" for name, state in self.classes.items())
+        logger.info(f"✅ Inference scheduler started with {self.num_workers} worker(s) ({shares})")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the workers after the calls in progress; queued tasks are cancelled."""
+        with self._cond:
+            self._stop = True
+            for state in self.classes.values():
+                while state.queue:
+                    state.queue.popleft().future.cancel()
+                    state.cancelled += 1
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        self._workers = []
+
+    # ------------------------------------------------------------------ public API
+
+    def submit(self, fn: Callable, *args, priority: str = INTERACTIVE, **kwargs) -> Future:
+        """Queue a model call and return its Future."""
+        if priority not in self.classes:
+            raise ValueError(f"Unknown priority class: {priority}")
+        task = _Task(fn, args, kwargs, Future(), priority, self.clock())
+        with self._cond:
+            if self._stop:
+                raise RuntimeError("Inference scheduler is stopped")
+            state = self.classes[priority]
+            if not state.queue and not state.running:
+                # A class returning from idle does not get credit for the time it was away
+                state.vtime = max(state.vtime, self._vclock)
+            state.queue.append(task)
+            state.submitted += 1
+            self._cond.notify()
+        return task.future
+
+    def run(self, fn: Callable, *args, priority: str = INTERACTIVE, **kwargs):
+        """Blocking call from a worker thread (e.g. the job queue)."""
+        return self.submit(fn, *args, priority=priority, **kwargs).result()
+
+    async def run_async(self, fn: Callable, *args, priority: str = INTERACTIVE, **kwargs):
+        """Await a model call from the event loop without blocking it."""
+        return await asyncio.wrap_future(self.submit(fn, *args, priority=priority, **kwargs))
+
+    def metrics(self) -> Dict[str, Dict]:
+        """Per-class counters and queue wait / end-to-end latency percentiles (seconds)."""
+        report = {}
+        with self._cond:
+            for name, state in self.classes.items():
+                wait, latency = list(state.wait), list(state.latency)
+                report[name] = {
+                    "weight": state.weight,
+                    "queued": len(state.queue),
+                    "running": state.running,
+                    "submitted": state.submitted,
+                    "completed": state.completed,
+                    "failed": state.failed,
+                    "cancelled": state.cancelled,
+                    "wait_p50": _percentile(wait, 50),
+                    "wait_p95": _percentile(wait, 95),
+                    "latency_p50": _percentile(latency, 50),
+                    "latency_p95": _percentile(latency, 95),
+                    "latency_max": round(max(latency), 4) if latency else None,
+                }
+        return report
+
+    # ------------------------------------------------------------------ workers
+
+    def _next_task(self) -> Optional[_Task]:
+        """Pop the head of the backlogged class with the least charged model time."""
+        with self._cond:
+            while not self._stop:
+                backlogged = [name for name in self._order if self.classes[name].queue]
+                if backlogged:
+                    name = min(backlogged, key=lambda n: self.classes[n].vtime)
+                    state = self.classes[name]
+                    self._vclock = state.vtime
+                    state.running += 1
+                    return state.queue.popleft()
+                self._cond.wait()
+            return None
+
+    def _worker_loop(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            if not task.future.set_running_or_notify_cancel():
+                # Cancelled while queued: it never used the model, so no charge and no samples
+                with self._cond:
+                    state = self.classes[task.priority]
+                    state.running -= 1
+                    state.cancelled += 1
+                continue
+
+            started = self.clock()
+            failed = False
+            try:
+                task.future.set_result(task.fn(*task.args, **task.kwargs))
+            except BaseException as e:
+                failed = True
+                task.future.set_exception(e)
+            finished = self.clock()
+
+            with self._cond:
+                state = self.classes[task.priority]
+                state.running -= 1
+                # Preemption happens here: the next pick sees the updated charge
+                state.vtime += (finished - started) / state.weight
+                state.wait.append(started - task.enqueued_at)
+                state.latency.append(finished - task.enqueued_at)
+                if failed:
+                    state.failed += 1
+                else:
+                    state.completed += 1
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Persistent Classification Job Queue
+SQLite-backed queue for long-running classification jobs (bulk backfills).
+Jobs survive client disconnects and API restarts; workers pick up pending items on startup.
+Running items are leased to the queue instance processing them and kept alive by a
+heartbeat, so several processes can share the database: an item is only picked up again
+once its owner stops renewing the lease (crash or shutdown).
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = Path(__file__).parent.parent / "data" / "jobs" / "job_queue.db"
+# A running item whose owner has not renewed it for this long is picked up again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+
+# Item states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    total INTEGER NOT NULL,
+    cancelled INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    lease_expires REAL,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (status);
+"""
+
+# Columns added after the first release; created on open for older databases
+_ADDED_COLUMNS = {"owner": "TEXT", "lease_expires": "REAL"}
+
+
+class JobQueue:
+    """
+    Persistent job queue processed by background worker threads.
+
+    Each job is a list of work items. An item is either raw text
+    ({"kind": "text", "text": ..., "filename": ...}) or a SharePoint list item
+    ({"kind": "sharepoint", "item_id": ...}) that is resolved to text by `resolve_fn`.
+    `classify_fn` receives the item's SharePoint driveItem ID (or None) with the text.
+    SharePoint items queued with "update_metadata": true are passed to `writeback_fn`
+    (item, result) once classified; a failed write-back fails the item.
+    """
+
+    def __init__(self,
+                 classify_fn: Callable[[str, str, Optional[str]], Dict],
+                 resolve_fn: Optional[Callable[[str], Tuple[str, str, Optional[str]]]] = None,
+                 writeback_fn: Optional[Callable[[Dict, Dict], None]] = None,
+                 db_path: Optional[str] = None,
+                 num_workers: int = 1,
+                 poll_interval: float = 0.5,
+                 lease_seconds: float = JOB_LEASE_SECONDS):
+        self.classify_fn = classify_fn
+        self.resolve_fn = resolve_fn
+        self.writeback_fn = writeback_fn
+        self.db_path = Path(db_path or os.getenv("JOB_QUEUE_DB", str(DEFAULT_DB_PATH)))
+        self.num_workers = max(1, num_workers)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        # Lease holder name: unique per queue instance, readable in the database
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30,
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(job_items)")}
+        for column, kind in _ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE job_items ADD COLUMN {column} {kind}")
+
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._workers: List[threading.Thread] = []
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def start(self):
+        """
+        Start the workers and the lease heartbeat. Items left running by a crashed
+        process are picked up once their lease expires; live owners keep theirs.
+        """
+        self._stop.clear()
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        self._workers.append(heartbeat)
+        logger.info(f"✅ Job queue started with {self.num_workers} worker(s) as {self.owner} ({self.db_path})")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the workers and hand back the items this queue still holds."""
+        self._stop.set()
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        self._workers = []
+        # Released now instead of at lease expiry; a worker that outlived the join
+        # cannot record a result any more (see _finish). Items of jobs cancelled
+        # meanwhile end as cancelled rather than going back to the queue.
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE job_items SET owner = NULL, lease_expires = NULL, status = CASE "
+                "WHEN job_id IN (SELECT id FROM jobs WHERE cancelled = 1) THEN ? ELSE ? END "
+                "WHERE status = ? AND owner = ?", (CANCELLED, PENDING, RUNNING, self.owner)
+            )
+        if cur.rowcount:
+            logger.info(f"🔄 Released {cur.rowcount} unfinished job items")
+
+    def close(self):
+        self.stop()
+        self._conn.close()
+
+    # ------------------------------------------------------------------ public API
+
+    def submit(self, items: List[Dict]) -> str:
+        """Persist a new job and return its ID."""
+        if not items:
+            raise ValueError("A job needs at least one item")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        rows = []
+        for seq, item in enumerate(items):
+            kind = item.get("kind", "text")
+            if kind not in ("text", "sharepoint"):
+                raise ValueError(f"Unsupported item kind: {kind}")
+            rows.append((job_id, seq, kind, json.dumps(item), PENDING))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, created_at, updated_at, total) VALUES (?, ?, ?, ?)",
+                    (job_id, now, now, len(items))
+                )
+                self._conn.executemany(
+                    "INSERT INTO job_items (job_id, seq, kind, payload, status) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        self._wakeup.set()
+        logger.info(f"📥 Queued job {job_id} with {len(items)} items")
+        return job_id
+
+    def get_job(self, job_id: str, offset: int = 0, limit: int = 100) -> Optional[Dict]:
+        """Return job progress and one page of finished results, or None if unknown."""
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT created_at, updated_at, total, cancelled FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+            rows = self._conn.execute(
+                "SELECT seq, status, result, error FROM job_items "
+                "WHERE job_id = ? AND status IN (?, ?) ORDER BY seq LIMIT ? OFFSET ?",
+                (job_id, DONE, FAILED, limit, offset)
+            ).fetchall()
+
+        created_at, updated_at, total, cancelled = job
+        progress = {state: counts.get(state, 0) for state in (PENDING, RUNNING, DONE, FAILED, CANCELLED)}
+        finished = progress[DONE] + progress[FAILED] + progress[CANCELLED]
+
+        results = []
+        for seq, status, result, error in rows:
+            entry = json.loads(result) if result else {}
+            entry["index"] = seq
+            entry["success"] = status == DONE
+            if error:
+                entry["error"] = error
+            results.append(entry)
+
+        return {
+            "job_id": job_id,
+            "status": self._job_status(progress, total, bool(cancelled)),
+            "total": total,
+            "completed": finished,
+            "progress": progress,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "offset": offset,
+            "limit": limit,
+            "results": results
+        }
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel pending items of a job. Items already running are allowed to finish."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET cancelled = 1, updated_at = ? WHERE id = ?", (time.time(), job_id)
+            )
+            if cur.rowcount == 0:
+                return False
+            self._conn.execute(
+                "UPDATE job_items SET status = ? WHERE job_id = ? AND status = ?",
+                (CANCELLED, job_id, PENDING)
+            )
+        logger.info(f"⏹️ Cancelled job {job_id}")
+        return True
+
+    # ------------------------------------------------------------------ workers
+
+    @staticmethod
+    def _job_status(progress: Dict[str, int], total: int, cancelled: bool) -> str:
+        if cancelled:
+            return "cancelled" if progress[RUNNING] == 0 else "cancelling"
+        if progress[DONE] + progress[FAILED] == total:
+            return "completed"
+        if progress[RUNNING] or progress[DONE] or progress[FAILED]:
+            return "running"
+        return "queued"
+
+    def _claim_next(self) -> Optional[Tuple[str, int, str, Dict]]:
+        """Atomically lease the oldest pending item, or a running one whose lease expired."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # An abandoned item of a cancelled job is not resumed
+                self._conn.execute(
+                    "UPDATE job_items SET status = ?, owner = NULL, lease_expires = NULL "
+                    "WHERE status = ? AND (lease_expires IS NULL OR lease_expires < ?) "
+                    "AND job_id IN (SELECT id FROM jobs WHERE cancelled = 1)",
+                    (CANCELLED, RUNNING, now)
+                )
+                row = self._conn.execute(
+                    "SELECT i.job_id, i.seq, i.kind, i.payload, i.status FROM job_items i "
+                    "JOIN jobs j ON j.id = i.job_id "
+                    "WHERE j.cancelled = 0 AND (i.status = ? OR "
+                    "(i.status = ? AND (i.lease_expires IS NULL OR i.lease_expires < ?))) "
+                    "ORDER BY j.created_at, i.seq LIMIT 1",
+                    (PENDING, RUNNING, now)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE job_items SET status = ?, owner = ?, lease_expires = ? WHERE job_id = ? AND seq = ?",
+                        (RUNNING, self.owner, now + self.lease_seconds, row[0], row[1])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        if row[4] == RUNNING:
+            logger.info(f"🔄 Resuming job {row[0]} item {row[1]} after its lease expired")
+        return row[0], row[1], row[2], json.loads(row[3])
+
+    def _renew_leases(self) -> int:
+        """Extend the leases of every item this queue is running."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE job_items SET lease_expires = ? WHERE status = ? AND owner = ?",
+                (time.time() + self.lease_seconds, RUNNING, self.owner)
+            )
+        return cur.rowcount
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self._renew_leases()
+            except Exception as e:
+                logger.error(f"❌ Job lease renewal failed: {e}")
+
+    def _finish(self, job_id: str, seq: int, status: str, result: Optional[Dict], error: Optional[str]):
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE job_items SET status = ?, result = ?, error = ?, owner = NULL, lease_expires = NULL "
+                "WHERE job_id = ? AND seq = ? AND status = ? AND owner = ?",
+                (status, json.dumps(result) if result is not None else None, error,
+                 job_id, seq, RUNNING, self.owner)
+            )
+            if cur.rowcount == 0:
+                # Lease lost (expired or released): the item's new owner records the outcome
+                logger.warning(f"⚠️ Job {job_id} item {seq} is no longer leased to this worker; result dropped")
+                return
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def _process_item(self, kind: str, item: Dict) -> Dict:
+        if kind == "sharepoint":
+            if self.resolve_fn is None:
+                raise RuntimeError("SharePoint items are not supported by this queue")
+            text, filename, drive_item_id = self.resolve_fn(item["item_id"])
+            result = self.classify_fn(text, item.get("filename") or filename, drive_item_id)
+            result["item_id"] = item["item_id"]
+            if item.get("update_metadata") and self.writeback_fn is not None:
+                self.writeback_fn(item, result)
+            return result
+        return self.classify_fn(item["text"], item.get("filename", "document.pdf"), item.get("item_id"))
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self._claim_next()
+            except Exception as e:
+                logger.error(f"❌ Job queue claim failed: {e}")
+                claimed = None
+
+            if claimed is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id, seq, kind, item = claimed
+            try:
+                result = self._process_item(kind, item)
+                self._finish(job_id, seq, DONE, result, None)
+            except Exception as e:
+                logger.error(f"❌ Job {job_id} item {seq} failed: {e}")
+                self._finish(job_id, seq, FAILED, None, str(e))
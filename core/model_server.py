@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Shared Model Server
+Keeps the classifier models (SentenceTransformer, SaulLM, Mistral, BART) resident in one
+process and serves them to any number of API worker processes over a Unix socket. Every
+worker's requests land in the same priority scheduler, so interactive and bulk work is
+ordered across workers, not per worker. Workers keep one multiplexed connection each;
+requests carry an ID and replies come back as they finish.
+
+    python -m core.model_server          # listens on MODEL_SERVER_SOCKET
+    MODEL_SERVER_SOCKET=... uvicorn main:app --workers 4
+
+Frames are a 4-byte big-endian length followed by a UTF-8 JSON object.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from core.inference_scheduler import BULK, INTERACTIVE, InferenceScheduler
+
+logger = logging.getLogger(__name__)
+
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET", "/tmp/rag_model_server.sock")
+MODEL_SERVER_TIMEOUT = float(os.getenv("MODEL_SERVER_TIMEOUT", "600"))
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+_HEADER = struct.Struct(">I")
+
+
+class ModelServerError(RuntimeError):
+    """Raised when the model server is unreachable or a request failed on it."""
+
+
+def encode_frame(message: Dict) -> bytes:
+    # Classifier results may hold numpy scalars and similar; they travel as strings
+    payload = json.dumps(message, default=str).encode("utf-8")
+    if len(payload) > MAX_FRAME_BYTES:
+        raise ModelServerError(f"Message of {len(payload)} bytes exceeds the frame limit")
+    return _HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Dict]:
+    """Next message from a stream, or None at EOF."""
+    try:
+        header = await reader.readexactly(_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_FRAME_BYTES:
+        raise ModelServerError(f"Frame of {length} bytes exceeds the frame limit")
+    return json.loads(await reader.readexactly(length))
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks, remaining = [], size
+    while remaining:
+        chunk = sock.recv(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+class ModelServer:
+    """Unix socket front end for the in-process scheduler and classifier."""
+
+    def __init__(self, classify_fn: Callable[[str, str, Optional[str]], Dict],
+                 scheduler: Optional[InferenceScheduler] = None,
+                 socket_path: str = MODEL_SERVER_SOCKET):
+        """
+        Args:
+            classify_fn: (text, filename, item_id) -> classifier result, run on the scheduler
+            scheduler: Shared priority scheduler (created and started if omitted)
+            socket_path: Unix socket to listen on
+        """
+        self.classify_fn = classify_fn
+        self.scheduler = scheduler or InferenceScheduler()
+        self._owns_scheduler = scheduler is None
+        self.socket_path = socket_path
+        self.connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def _dispatch(self, request: Dict) -> Any:
+        op = request.get("op")
+        if op == "classify":
+            priority = request.get("priority", INTERACTIVE)
+            return await self.scheduler.run_async(
+                self.classify_fn, request["text"], request.get("filename", "document.pdf"),
+                request.get("item_id"), priority=priority
+            )
+        if op == "metrics":
+            return {"workers": self.scheduler.num_workers, "connections": self.connections,
+                    "classes": self.scheduler.metrics()}
+        if op == "ping":
+            return "pong"
+        raise ValueError(f"Unknown operation: {op}")
+
+    async def _answer(self, request: Dict, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        try:
+            reply = {"id": request.get("id"), "result": await self._dispatch(request)}
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            reply = {"id": request.get("id"), "error": str(e), "type": type(e).__name__}
+        async with write_lock:
+            writer.write(encode_frame(reply))
+            await writer.drain()
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self._handlers[asyncio.current_task()] = writer
+        write_lock = asyncio.Lock()
+        in_flight = set()
+        try:
+            while True:
+                request = await read_frame(reader)
+                if request is None:
+                    break
+                task = asyncio.ensure_future(self._answer(request, writer, write_lock))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+        except (ConnectionError, ModelServerError, ValueError) as e:
+            logger.warning(f"⚠️ Dropping model client connection: {e}")
+        finally:
+            # The worker went away: its queued model calls are cancelled, not run
+            for task in in_flight:
+                task.cancel()
+            self.connections -= 1
+            self._handlers.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        if self._owns_scheduler:
+            self.scheduler.start()
+        self._server = await asyncio.start_unix_server(self._serve_connection, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        logger.info(f"✅ Model server listening on {self.socket_path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Open worker connections are not closed by the listener; end them too
+            handlers = list(self._handlers)
+            for writer in self._handlers.values():
+                writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+        if self._owns_scheduler:
+            self.scheduler.stop()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+
+class ModelClient:
+    """
+    Thread-safe client used by API workers. One connection per process carries every
+    request; replies resolve Futures, so callers block (`classify`) or await (`classify_async`).
+    """
+
+    def __init__(self, socket_path: str = MODEL_SERVER_SOCKET, timeout: float = MODEL_SERVER_TIMEOUT):
+        """
+        Args:
+            socket_path: Model server socket
+            timeout: Seconds to wait for a reply
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._ids = itertools.count(1)
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise ModelServerError(f"Model server unavailable at {self.socket_path}: {e}") from e
+        threading.Thread(target=self._read_loop, args=(sock,), name="model-client", daemon=True).start()
+        return sock
+
+    def _read_loop(self, sock: socket.socket):
+        try:
+            while True:
+                header = _recv_exactly(sock, _HEADER.size)
+                if header is None:
+                    break
+                body = _recv_exactly(sock, _HEADER.unpack(header)[0])
+                if body is None:
+                    break
+                reply = json.loads(body)
+                with self._lock:
+                    future = self._pending.pop(reply.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in reply:
+                    future.set_exception(ModelServerError(f"{reply.get('type', 'Error')}: {reply['error']}"))
+                else:
+                    future.set_result(reply.get("result"))
+        except OSError:
+            pass
+        self._disconnected(sock)
+
+    def _disconnected(self, sock: socket.socket):
+        """Fail the requests that were waiting on this connection; the next call reconnects."""
+        with self._lock:
+            if self._sock is not sock:
+                return
+            self._sock = None
+            pending, self._pending = self._pending, {}
+        sock.close()
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ModelServerError("Connection to the model server was lost"))
+        if pending:
+            logger.warning(f"⚠️ Lost model server connection with {len(pending)} requests in flight")
+
+    def call(self, op: str, **params) -> Future:
+        """Send a request and return a Future for its result."""
+        future: Future = Future()
+        with self._lock:
+            if self._sock is None:
+                self._sock = self._connect()
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            sock = self._sock
+            try:
+                sock.sendall(encode_frame({"id": request_id, "op": op, **params}))
+            except OSError as e:
+                self._pending.pop(request_id, None)
+                failure = e
+            else:
+                failure = None
+        if failure is not None:
+            self._disconnected(sock)
+            raise ModelServerError(f"Could not reach the model server: {failure}")
+        return future
+
+    def submit_classification(self, text: str, filename: str, priority: str = INTERACTIVE,
+                              item_id: Optional[str] = None) -> Future:
+        return self.call("classify", text=text, filename=filename, priority=priority, item_id=item_id)
+
+    def classify(self, text: str, filename: str, priority: str = BULK, item_id: Optional[str] = None) -> Dict:
+        """Blocking classification (job queue threads)."""
+        return self.submit_classification(text, filename, priority, item_id).result(timeout=self.timeout)
+
+    async def classify_async(self, text: str, filename: str, priority: str = INTERACTIVE,
+                             item_id: Optional[str] = None) -> Dict:
+        """Awaitable classification (request handlers)."""
+        future = self.submit_classification(text, filename, priority, item_id)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+
+    def metrics(self) -> Dict:
+        return self.call("metrics").result(timeout=self.timeout)
+
+    def close(self):
+        with self._lock:
+            sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._disconnected(sock)
+
+
+def main():
+    """Load the models once and serve them until interrupted."""
+    from core.enhanced_rag_classifier import EnhancedRAGClassifier
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Loading classifier models into the model server...")
+    classifier = EnhancedRAGClassifier()
+    server = ModelServer(classifier.classify_with_rag)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("🛑 Model server stopped")
+
+
+if __name__ == "__main__":
+    main()
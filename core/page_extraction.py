@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Per-page PDF Extraction Engine
+Classifies each page as text-layer, image-only or mixed, OCRs only the pages that need it,
+and picks the OCR render DPI per page from page size and glyph/image density.
+"""
+
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from core.page_render import PageRenderer, render_page_image
+
+logger = logging.getLogger(__name__)
+
+# Page kinds
+TEXT_LAYER = "text"
+IMAGE_ONLY = "image"
+MIXED = "mixed"
+
+# A page needs at least this much embedded text to skip OCR
+MIN_TEXT_CHARS = int(os.getenv("PAGE_MIN_TEXT_CHARS", "50"))
+# Pages with text but images covering this fraction of the page are treated as mixed
+MIXED_IMAGE_COVERAGE = 0.3
+
+MIN_DPI = 150
+DEFAULT_DPI = 200
+MAX_DPI = 400
+# Cap on rendered pixels so oversized pages (11x17, plans) don't explode memory
+MAX_RENDER_PIXELS = 16_000_000
+# Fonts smaller than this (points) need a sharper render
+SMALL_FONT_PT = 9.0
+# Pages planned and OCR'd together when streaming, so OCR can still run page-parallel
+STREAM_WINDOW_PAGES = int(os.getenv("PAGE_STREAM_WINDOW", "8"))
+
+
+@dataclass
+class PagePlan:
+    """Extraction decision for one PDF page."""
+    page_num: int
+    kind: str
+    text: str
+    dpi: int = DEFAULT_DPI
+
+    @property
+    def needs_ocr(self) -> bool:
+        return self.kind != TEXT_LAYER
+
+
+def _image_coverage(page) -> Tuple[float, Optional[float]]:
+    """
+    Return (fraction of page area covered by images, highest native image DPI).
+    """
+    page_rect = page.rect
+    page_area = page_rect.width * page_rect.height
+    if page_area <= 0:
+        return 0.0, None
+
+    covered = 0.0
+    native_dpi = None
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info["bbox"]) & page_rect
+        if bbox.is_empty:
+            continue
+        covered += bbox.width * bbox.height
+        if info.get("width") and bbox.width > 0:
+            dpi = info["width"] / (bbox.width / 72.0)
+            native_dpi = max(native_dpi or 0.0, dpi)
+    return min(covered / page_area, 1.0), native_dpi
+
+
+def _median_font_size(page) -> Optional[float]:
+    """Median span font size of the page's text layer, if any."""
+    sizes = []
+    for block in page.get_text("dict").get("blocks", []):
+        for line in block.get("lines", []):
+            for span in line.get("spans", []):
+                if span.get("text", "").strip():
+                    sizes.append(span.get("size", 0.0))
+    if not sizes:
+        return None
+    sizes.sort()
+    return sizes[len(sizes) // 2]
+
+
+def choose_dpi(page, native_dpi: Optional[float] = None, font_size: Optional[float] = None) -> int:
+    """
+    Pick a render DPI for OCR.
+
+    Scanned images are rendered at (about) their native resolution since anything above
+    adds no detail, small glyphs get a sharper render, and the page size caps the total
+    pixel count.
+    """
+    dpi = float(DEFAULT_DPI)
+    if native_dpi:
+        dpi = native_dpi
+    if font_size is not None and font_size < SMALL_FONT_PT:
+        dpi = max(dpi, 300.0)
+
+    width_in = page.rect.width / 72.0
+    height_in = page.rect.height / 72.0
+    if width_in > 0 and height_in > 0:
+        dpi = min(dpi, math.sqrt(MAX_RENDER_PIXELS / (width_in * height_in)))
+
+    return int(max(MIN_DPI, min(MAX_DPI, dpi)))
+
+
+def analyze_page(page) -> PagePlan:
+    """Classify a page and choose its OCR DPI."""
+    text = page.get_text()
+    chars = len(text.strip())
+    coverage, native_dpi = _image_coverage(page)
+
+    if chars >= MIN_TEXT_CHARS and coverage < MIXED_IMAGE_COVERAGE:
+        return PagePlan(page.number, TEXT_LAYER, text)
+    if chars >= MIN_TEXT_CHARS:
+        kind = MIXED
+    elif coverage > 0:
+        kind = IMAGE_ONLY
+    else:
+        # No images and (almost) no text: blank or vector-only page, nothing to OCR
+        return PagePlan(page.number, TEXT_LAYER, text)
+
+    font_size = _median_font_size(page) if kind == MIXED else None
+    return PagePlan(page.number, kind, text, choose_dpi(page, native_dpi, font_size))
+
+
+def plan_document(doc) -> List[PagePlan]:
+    """Analyze every page of an open PyMuPDF document."""
+    return [analyze_page(page) for page in doc]
+
+
+def render_page(page, dpi: int, grayscale: bool = True) -> Image.Image:
+    """Render a page to a PIL image (grayscale by default) for OCR."""
+    return render_page_image(page, dpi, grayscale)
+
+
+def tesseract_ocr_pages(doc, plans: List[PagePlan]) -> Dict[int, str]:
+    """Sequential Tesseract OCR of the planned pages."""
+    import pytesseract
+
+    renderer = PageRenderer()
+    results = {}
+    for plan in plans:
+        image = renderer.render(doc.load_page(plan.page_num), plan.dpi)
+        results[plan.page_num] = pytesseract.image_to_string(image)
+    return results
+
+
+def merge_page_text(plan: PagePlan, ocr_text: Optional[str]) -> str:
+    """Combine embedded and OCR text for a page."""
+    if not plan.needs_ocr or not ocr_text:
+        return plan.text
+    # Mixed pages: the OCR pass also reads the rendered text layer, so prefer it
+    # unless it recovered less than the embedded text
+    if plan.kind == MIXED and len(ocr_text.strip()) < len(plan.text.strip()):
+        return plan.text
+    return ocr_text
+
+
+def iter_pdf_pages(pdf_path: str, ocr_pages: Callable = tesseract_ocr_pages,
+                   window: int = STREAM_WINDOW_PAGES) -> Iterator[Tuple[PagePlan, str]]:
+    """
+    Yield (plan, text) per page in page order, OCRing only image-only and mixed pages.
+
+    Pages are planned and OCR'd a window at a time, so a consumer that stops early
+    never pays for rendering or OCR of the pages it did not read.
+
+    Args:
+        pdf_path: Path to PDF file
+        ocr_pages: Callable (doc, plans) -> {page_num: text} used for pages that need OCR
+        window: Pages per planning/OCR window
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        page_count = len(doc)
+        for start in range(0, page_count, max(1, window)):
+            plans = [analyze_page(doc.load_page(n)) for n in range(start, min(start + window, page_count))]
+            to_ocr = [plan for plan in plans if plan.needs_ocr]
+            ocr_results = {}
+            if to_ocr:
+                logger.info(f"OCR needed for {len(to_ocr)}/{len(plans)} pages "
+                            f"({start + 1}-{start + len(plans)} of {page_count}) of {pdf_path}")
+                ocr_results = ocr_pages(doc, to_ocr)
+            for plan in plans:
+                yield plan, merge_page_text(plan, ocr_results.get(plan.page_num))
+    finally:
+        doc.close()
+
+
+def extract_pdf_pages(pdf_path: str,
+                      ocr_pages: Callable = tesseract_ocr_pages) -> List[Tuple[PagePlan, str]]:
+    """
+    Extract text per page, OCRing only image-only and mixed pages.
+
+    Args:
+        pdf_path: Path to PDF file
+        ocr_pages: Callable (doc, plans) -> {page_num: text} used for pages that need OCR
+
+    Returns:
+        List of (plan, text) in page order
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        plans = plan_document(doc)
+        to_ocr = [plan for plan in plans if plan.needs_ocr]
+        ocr_results = {}
+        if to_ocr:
+            logger.info(f"OCR needed for {len(to_ocr)}/{len(plans)} pages of {pdf_path}")
+            ocr_results = ocr_pages(doc, to_ocr)
+        return [(plan, merge_page_text(plan, ocr_results.get(plan.page_num))) for plan in plans]
+    finally:
+        doc.close()
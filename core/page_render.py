@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Page Rendering for OCR
+Renders PDF pages straight from PyMuPDF pixmap samples to PIL images or NumPy arrays,
+without PNG encode/decode round-trips. Pages are rendered in grayscale by default and
+a PageRenderer hands out views of the pixmap samples instead of copying them.
+"""
+
+import logging
+from typing import Optional
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Pixmap channel count -> PIL mode
+PIL_MODES = {1: "L", 3: "RGB", 4: "RGBA"}
+
+
+def render_pixmap(page, dpi: int, grayscale: bool = True) -> "fitz.Pixmap":
+    """
+    Render a page to a pixmap without an alpha channel.
+
+    Rendering in grayscale happens inside MuPDF, so the samples are a third of the
+    RGB size and no conversion pass is needed afterwards.
+    """
+    colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+    return page.get_pixmap(dpi=dpi, colorspace=colorspace, alpha=False)
+
+
+def image_from_samples(samples, width: int, height: int, channels: int,
+                       stride: Optional[int] = None) -> Image.Image:
+    """
+    Wrap raw pixmap samples as a PIL image without copying.
+
+    The image shares memory with `samples`, so the buffer must outlive it.
+    """
+    mode = PIL_MODES[channels]
+    return Image.frombuffer(mode, (width, height), samples, "raw", mode, stride or width * channels, 1)
+
+
+def render_page_image(page, dpi: int, grayscale: bool = True) -> Image.Image:
+    """Render a page to a standalone PIL image (one copy of the samples, no encoding)."""
+    pix = render_pixmap(page, dpi, grayscale)
+    return image_from_samples(pix.samples, pix.width, pix.height, pix.n, pix.stride)
+
+
+class PageRenderer:
+    """
+    Renders pages as zero-copy views of the pixmap samples.
+
+    Images and arrays returned by `render` / `render_array` share memory with the
+    last rendered pixmap, which the renderer keeps alive until the next render call;
+    use `.copy()` to keep one longer.
+    """
+
+    def __init__(self, grayscale: bool = True):
+        self.grayscale = grayscale
+        self._pix = None
+
+    def _render_pixmap(self, page, dpi: int):
+        # Replacing the reference frees the previous page's pixmap
+        self._pix = render_pixmap(page, dpi, self.grayscale)
+        return self._pix
+
+    def render(self, page, dpi: int) -> Image.Image:
+        """Render a page as a PIL image backed by the pixmap samples."""
+        pix = self._render_pixmap(page, dpi)
+        return image_from_samples(pix.samples_mv, pix.width, pix.height, pix.n, pix.stride)
+
+    def render_array(self, page, dpi: int) -> np.ndarray:
+        """Render a page as a (height, width[, channels]) uint8 array backed by the pixmap samples."""
+        pix = self._render_pixmap(page, dpi)
+        width, height, channels, stride = pix.width, pix.height, pix.n, pix.stride
+        array = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(height, stride)[:, :width * channels]
+        return array if channels == 1 else array.reshape(height, width, channels)
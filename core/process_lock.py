@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Inter-process File Lock
+Advisory `flock` on a lock file, shared by the uvicorn workers of one host. Used to elect
+the worker that runs background services (job queue workers, webhook subscription) and
+to serialize steps that must not run in two processes at once (delta rounds).
+The OS drops the lock when its holder exits, so a crashed leader is replaced on restart.
+"""
+
+import fcntl
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+
+class ProcessLock:
+    """Exclusive lock held across processes (flock) and threads of this process."""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Lock file; created if missing, its content is the holder's PID
+        """
+        self.path = Path(path)
+        self._thread_lock = threading.Lock()
+        self._fh = None
+
+    @property
+    def held(self) -> bool:
+        return self._fh is not None
+
+    def acquire(self, blocking: bool = True, timeout: Optional[float] = None) -> bool:
+        """
+        Take the lock.
+
+        Args:
+            blocking: Wait for the holder to release it
+            timeout: Longest wait for another thread of this process (None = forever)
+
+        Returns:
+            True if the lock is now held by this caller
+        """
+        if not self._thread_lock.acquire(blocking, -1 if timeout is None else timeout):
+            return False
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fh = open(self.path, "a+")
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                fh.close()
+                self._thread_lock.release()
+                return False
+            fh.truncate(0)
+            fh.write(str(os.getpid()))
+            fh.flush()
+            self._fh = fh
+            return True
+        except Exception:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        if self._fh is None:
+            return
+        fh, self._fh = self._fh, None
+        fcntl.flock(fh, fcntl.LOCK_UN)
+        fh.close()
+        self._thread_lock.release()
+
+    def __enter__(self) -> "ProcessLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+SharePoint Batch Metadata Writer
+Writes list-item field updates through the Graph JSON `$batch` endpoint: up to 20 PATCHes
+per round trip, several batches in flight at once (bounded by the Graph client's
+per-tenant cap). Each item gets its own result; throttled or transient per-item failures
+are re-packed into later batches, a whole batch that is throttled or cannot be sent is
+resent after backing off, and a batch rejected as invalid (4xx) is split in half until
+the offending item is isolated.
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.graph_client import GraphClient, get_graph_client, retry_delay
+
+logger = logging.getLogger(__name__)
+
+# Graph rejects batches with more than 20 requests
+MAX_BATCH_SIZE = 20
+METADATA_BATCH_CONCURRENCY = int(os.getenv("METADATA_BATCH_CONCURRENCY", "4"))
+METADATA_MAX_ATTEMPTS = int(os.getenv("METADATA_MAX_ATTEMPTS", "4"))
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+@dataclass
+class FieldUpdate:
+    """Field values to write to one list item."""
+    item_id: str
+    fields: Dict
+    filename: Optional[str] = None
+
+
+@dataclass
+class UpdateResult:
+    """Outcome of one FieldUpdate."""
+    item_id: str
+    success: bool
+    status: Optional[int] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    filename: Optional[str] = None
+
+
+@dataclass
+class _Pending:
+    update: FieldUpdate
+    index: int
+    attempts: int = 0
+    retry_after: Optional[str] = field(default=None, repr=False)
+
+
+def classification_fields(doc_type: str, doc_category: str) -> Dict:
+    """List columns holding a document's classification."""
+    return {
+        "Document_x0020_Type": doc_type,
+        "Document_x0020_Category": doc_category
+    }
+
+
+class MetadataWriter:
+    """Packs list-item field updates into concurrent Graph `$batch` requests."""
+
+    def __init__(self, site_id: Optional[str] = None, list_id: Optional[str] = None,
+                 graph: Optional[GraphClient] = None, batch_size: int = MAX_BATCH_SIZE,
+                 concurrency: int = METADATA_BATCH_CONCURRENCY,
+                 max_attempts: int = METADATA_MAX_ATTEMPTS):
+        """
+        Args:
+            site_id: SharePoint site ID (env SITE_ID)
+            list_id: Document library list ID (env LIST_ID)
+            graph: Graph client (defaults to the shared one)
+            batch_size: Updates per `$batch` request (at most 20)
+            concurrency: `$batch` requests in flight at once
+            max_attempts: Tries per item before it is reported as failed
+        """
+        self.site_id = site_id or os.getenv("SITE_ID")
+        self.list_id = list_id or os.getenv("LIST_ID")
+        if not all([self.site_id, self.list_id]):
+            raise ValueError("Missing SharePoint configuration (SITE_ID, LIST_ID)")
+        self.graph = graph or get_graph_client()
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.stats = {"batches": 0, "retried": 0, "split": 0}
+
+    def _item_url(self, item_id: str) -> str:
+        return f"/sites/{self.site_id}/lists/{self.list_id}/items/{item_id}/fields"
+
+    def _send(self, chunk: List[_Pending]) -> Tuple[Optional[Dict], Dict[str, Dict]]:
+        """
+        POST one `$batch`. Returns (batch-level failure or None, responses by request ID).
+        """
+        body = {"requests": [
+            {
+                "id": str(n),
+                "method": "PATCH",
+                "url": self._item_url(pending.update.item_id),
+                "headers": {"Content-Type": "application/json"},
+                "body": pending.update.fields
+            }
+            for n, pending in enumerate(chunk)
+        ]}
+        self.stats["batches"] += 1
+        try:
+            response = self.graph.post("$batch", json=body)
+        except Exception as e:
+            return {"status": None, "body": {"error": {"message": f"{type(e).__name__}: {e}"}}}, {}
+        if response.status_code != 200:
+            message = f"$batch returned {response.status_code}: {response.text[:200]}"
+            return {"status": response.status_code, "body": {"error": {"message": message}},
+                    "headers": {"Retry-After": response.headers.get("Retry-After")}}, {}
+        try:
+            replies = response.json().get("responses", [])
+        except ValueError as e:
+            # Truncated or non-JSON body: nothing is known per item, so resend the batch whole
+            return {"status": None, "body": {"error": {"message": f"Unreadable $batch response: {e}"}}}, {}
+        return None, {r.get("id"): r for r in replies}
+
+    def write(self, updates: Iterable[FieldUpdate]) -> List[UpdateResult]:
+        """
+        Apply every update.
+
+        Args:
+            updates: Field updates (one per item; a batch does not order its requests)
+
+        Returns:
+            One UpdateResult per update, in input order
+        """
+        updates = list(updates)
+        results: List[Optional[UpdateResult]] = [None] * len(updates)
+        pending = [_Pending(update, n) for n, update in enumerate(updates)]
+        chunks = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+
+        def finish(item: _Pending, success: bool, status: Optional[int], error: Optional[str] = None):
+            results[item.index] = UpdateResult(item.update.item_id, success, status, error,
+                                               item.attempts, item.update.filename)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while chunks:
+                retry: List[_Pending] = []
+                next_chunks: List[List[_Pending]] = []
+                for chunk, (batch_failure, responses) in zip(chunks, pool.map(self._send, chunks)):
+                    if batch_failure:
+                        status = batch_failure["status"]
+                        rejected = status is not None and 400 <= status < 500 and status not in RETRYABLE_STATUSES
+                        if rejected and len(chunk) > 1:
+                            # Rejected as invalid: halve it to isolate the offending update
+                            self.stats["split"] += 1
+                            middle = len(chunk) // 2
+                            next_chunks += [chunk[:middle], chunk[middle:]]
+                            continue
+                        # Throttled, transient or unreachable: every item backs off and is resent
+                        responses = {str(n): batch_failure for n in range(len(chunk))}
+                    for n, item in enumerate(chunk):
+                        item.attempts += 1
+                        reply = responses.get(str(n), {})
+                        status = reply.get("status")
+                        if status in (200, 204):
+                            finish(item, True, status)
+                            continue
+                        error = ((reply.get("body") or {}).get("error") or {}).get("message") or "no response"
+                        if (status is None or status in RETRYABLE_STATUSES) and item.attempts < self.max_attempts:
+                            item.retry_after = (reply.get("headers") or {}).get("Retry-After")
+                            retry.append(item)
+                        else:
+                            finish(item, False, status, error)
+
+                if retry:
+                    self.stats["retried"] += len(retry)
+                    attempt = max(item.attempts for item in retry) - 1
+                    delay = max(retry_delay(attempt, item.retry_after, base=self.graph.backoff_base)
+                                for item in retry)
+                    logger.warning(f"⏳ Retrying {len(retry)} metadata updates in {delay:.1f}s")
+                    time.sleep(delay)
+                    next_chunks += [retry[i:i + self.batch_size] for i in range(0, len(retry), self.batch_size)]
+                chunks = next_chunks
+
+        succeeded = sum(1 for result in results if result.success)
+        logger.info(f"🏷️ Metadata write-back: {succeeded}/{len(results)} updated "
+                    f"in {self.stats['batches']} batch requests")
+        return results
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+SharePoint Folder Crawler
+Breadth-first, concurrent walk of drive folders over Microsoft Graph. A bounded pool of
+workers lists folders level by level, follows @odata.nextLink pagination and hands files
+to the consumer as soon as they are listed instead of after the whole tree. Requests go
+through the shared GraphClient's token, per-tenant concurrency cap and throttling pause;
+folders that could not be listed are reported in `failed_folders`.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import aiohttp
+
+from core.graph_client import RETRY_STATUSES, GraphClient, retry_delay
+from core.sharepoint_listing import ListingFilter, children_url
+
+logger = logging.getLogger(__name__)
+
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "8"))
+# Unlimited unless set; the old walkers stopped at 2, 3 or 10 levels
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "0")) or None
+# Files found but not yet taken by the consumer; a slow consumer pauses the crawl
+FILE_BUFFER = 1000
+
+# A folder to crawl: (drive path, item ID), e.g. ("drives/b!abc", "01XYZ") or
+# ("sites/<site-id>/drive", "root")
+FolderRef = Tuple[str, str]
+
+_DONE = object()
+
+
+def drive_path(drive_id: str) -> str:
+    return f"drives/{drive_id}"
+
+
+class FolderCrawler:
+    """Concurrent breadth-first file discovery under one or more folders."""
+
+    def __init__(self, graph: GraphClient, concurrency: int = CRAWL_CONCURRENCY,
+                 max_depth: Optional[int] = CRAWL_MAX_DEPTH,
+                 listing_filter: Optional[ListingFilter] = None):
+        """
+        Args:
+            graph: Graph client providing the token, base URL, timeouts and tenant limiter
+            concurrency: Folder listings in flight at once (also bounded by the tenant cap)
+            max_depth: Deepest folder level to descend into below a root (None = no limit)
+            listing_filter: Only yield files it accepts (extension / modified date)
+        """
+        self.graph = graph
+        self.concurrency = max(1, concurrency)
+        self.max_depth = max_depth
+        self.listing_filter = listing_filter
+        # (folder, error) for every folder whose listing was given up on
+        self.failed_folders: List[Tuple[FolderRef, str]] = []
+        self.stats = {"folders": 0, "files": 0, "filtered": 0, "pages": 0, "throttled": 0, "errors": 0}
+
+    @property
+    def complete(self) -> bool:
+        """False if any folder could not be listed (its files are missing)."""
+        return not self.failed_folders
+
+    def _children_url(self, folder: FolderRef) -> str:
+        path, item_id = folder
+        return children_url(self.graph.graph_root, path, item_id)
+
+    async def _acquire_slot(self):
+        """Take one of the tenant's request slots without blocking the event loop."""
+        limiter = self.graph.limiter
+        while True:
+            # Throttling applies to the whole tenant, so every worker waits it out
+            delay = limiter.resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if limiter.slots.acquire(blocking=False):
+                return
+            await asyncio.sleep(0.05)
+
+    async def _get_page(self, session: aiohttp.ClientSession, url: str) -> Dict:
+        reauthenticated = False
+        attempt = 0
+        while True:
+            token = await asyncio.to_thread(self.graph.access_token)
+            delay = None
+            await self._acquire_slot()
+            try:
+                async with session.get(url, headers={"Authorization": f"Bearer {token}"}) as response:
+                    if response.status == 401 and not reauthenticated:
+                        # Expired or rotated token: one retry with a fresh one
+                        reauthenticated = True
+                        self.graph.invalidate_token()
+                        continue
+                    retryable = response.status in RETRY_STATUSES or response.status >= 500
+                    if not retryable or attempt >= self.graph.max_retries:
+                        response.raise_for_status()
+                        self.stats["pages"] += 1
+                        return await response.json()
+                    delay = retry_delay(attempt, response.headers.get("Retry-After"),
+                                        base=self.graph.backoff_base)
+                    if response.status in RETRY_STATUSES:
+                        self.stats["throttled"] += 1
+                        self.graph.limiter.pause(delay)
+                    logger.warning(f"⏳ Graph returned {response.status}; backing off {delay:.1f}s")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.graph.max_retries:
+                    raise
+                delay = retry_delay(attempt, base=self.graph.backoff_base)
+                logger.warning(f"⚠️ Retrying folder page after {type(e).__name__} in {delay:.1f}s")
+            finally:
+                self.graph.limiter.slots.release()
+            # Back off without holding a tenant slot
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _worker(self, session: aiohttp.ClientSession, folders: asyncio.Queue,
+                      files: asyncio.Queue, seen: Set[str]):
+        while True:
+            folder, depth = await folders.get()
+            try:
+                url = self._children_url(folder)
+                while url:
+                    page = await self._get_page(session, url)
+                    for child in page.get("value", []):
+                        if "file" in child:
+                            if self.listing_filter and not self.listing_filter.accepts(child):
+                                self.stats["filtered"] += 1
+                                continue
+                            self.stats["files"] += 1
+                            await files.put(child)
+                        elif "folder" in child and child["id"] not in seen:
+                            if self.max_depth is None or depth < self.max_depth:
+                                seen.add(child["id"])
+                                folders.put_nowait(((folder[0], child["id"]), depth + 1))
+                    url = page.get("@odata.nextLink")
+                self.stats["folders"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.failed_folders.append((folder, f"{type(e).__name__}: {e}"))
+                logger.error(f"❌ Error listing folder {folder[1]}: {e}")
+            finally:
+                folders.task_done()
+
+    async def crawl(self, roots: Iterable[FolderRef]) -> AsyncIterator[Dict]:
+        """
+        Yield every file under `roots`, breadth-first, as it is discovered.
+
+        Args:
+            roots: Folders to start from
+        """
+        folders: asyncio.Queue = asyncio.Queue()
+        files: asyncio.Queue = asyncio.Queue(FILE_BUFFER)
+        seen: Set[str] = set()
+        for root in roots:
+            if root[1] not in seen:
+                seen.add(root[1])
+                folders.put_nowait((root, 0))
+
+        timeout = aiohttp.ClientTimeout(total=self.graph.timeout)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            workers = [asyncio.create_task(self._worker(session, folders, files, seen))
+                       for _ in range(self.concurrency)]
+
+            async def close_when_done():
+                await folders.join()
+                await files.put(_DONE)
+
+            closer = asyncio.create_task(close_when_done())
+            try:
+                while True:
+                    item = await files.get()
+                    if item is _DONE:
+                        break
+                    yield item
+            finally:
+                for task in workers + [closer]:
+                    task.cancel()
+                await asyncio.gather(*workers, closer, return_exceptions=True)
+        if self.failed_folders:
+            logger.error(f"❌ Listing incomplete: {len(self.failed_folders)} folders could not be listed")
+        logger.info(f"📁 Crawl finished: {self.stats}")
+
+    def iter_files(self, roots: Iterable[FolderRef]) -> Iterator[Dict]:
+        """
+        Synchronous view of crawl(): the crawl runs on a background event loop and files
+        are yielded as they arrive. Closing the iterator early stops the crawl.
+        """
+        roots = list(roots)
+        handoff: "queue.Queue" = queue.Queue(FILE_BUFFER)
+        stop = threading.Event()
+
+        def put(value) -> bool:
+            while not stop.is_set():
+                try:
+                    handoff.put(value, timeout=0.2)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        async def pump():
+            async for item in self.crawl(roots):
+                if not put(item):
+                    break
+
+        def run():
+            try:
+                asyncio.run(pump())
+            except Exception as e:
+                put(e)
+            finally:
+                put(_DONE)
+
+        thread = threading.Thread(target=run, name="sharepoint-crawl", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = handoff.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join(timeout=self.graph.timeout)
@@ -2,12 +2,15 @@
 """
 SharePoint metadata update utilities
 """
-import requests
 import json
 import os
-from msal import ConfidentialClientApplication
 from dotenv import load_dotenv
 import logging
+from dataclasses import asdict
+
+from core.graph_client import get_graph_client
+from core.sharepoint_batch import FieldUpdate, MetadataWriter, classification_fields
+from core.streaming_download import StreamingDownloader
 
 logger = logging.getLogger(__name__)
 
@@ -15,25 +18,9 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 def get_access_token():
-    """Get Microsoft Graph API access token"""
+    """Get Microsoft Graph API access token (cached by the shared Graph client)"""
     try:
-        app = ConfidentialClientApplication(
-            os.getenv("CLIENT_ID"),
-            authority=f"https://login.microsoftonline.com/{os.getenv('TENANT_ID')}",
-            client_credential=os.getenv("CLIENT_SECRET")
-        )
-        
-        result = app.acquire_token_for_client(["https://graph.microsoft.com/.default"])
-        
-        if result and "access_token" in result:
-            return result["access_token"]
-        else:
-            error_msg = "Unknown error"
-            if result and "error_description" in result:
-                error_msg = result["error_description"]
-            logger.error(f"Token acquisition failed: {error_msg}")
-            return None
-            
+        return get_graph_client().access_token()
     except Exception as e:
         logger.error(f"Authentication failed: {e}")
         return None
@@ -52,11 +39,6 @@ def update_metadata(item_id: str, filename: str, doc_type: str, doc_category: st
         bool: Success status
     """
     try:
-        token = get_access_token()
-        if not token:
-            logger.error("Failed to get access token")
-            return False
-        
         site_id = os.getenv("SITE_ID")
         list_id = os.getenv("LIST_ID")
         
@@ -65,19 +47,9 @@ def update_metadata(item_id: str, filename: str, doc_type: str, doc_category: st
             return False
         
         # Update metadata via Graph API
-        url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items/{item_id}/fields"
-        
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
+        url = f"sites/{site_id}/lists/{list_id}/items/{item_id}/fields"
         
-        data = {
-            "Document_x0020_Type": doc_type,
-            "Document_x0020_Category": doc_category
-        }
-        
-        response = requests.patch(url, json=data, headers=headers)
+        response = get_graph_client().patch(url, json=classification_fields(doc_type, doc_category))
         
         if response.status_code in [200, 204]:
             logger.info(f"Successfully updated metadata for {filename}: {doc_type} -> {doc_category}")
@@ -90,36 +62,72 @@ def update_metadata(item_id: str, filename: str, doc_type: str, doc_category: st
         logger.error(f"Metadata update failed: {e}")
         return False
 
+def download_list_item(item_id: str, dest_dir: str) -> tuple:
+    """
+    Download the file backing a SharePoint list item
+    
+    Args:
+        item_id: SharePoint list item ID
+        dest_dir: Directory to write the file into
+        
+    Returns:
+        tuple: (local_path, filename, drive_item_id)
+    """
+    site_id = os.getenv("SITE_ID")
+    list_id = os.getenv("LIST_ID")
+    if not all([site_id, list_id]):
+        raise RuntimeError("Missing SharePoint configuration (SITE_ID, LIST_ID)")
+    
+    graph = get_graph_client()
+    url = f"sites/{site_id}/lists/{list_id}/items/{item_id}/driveItem"
+    response = graph.get(url, timeout=30)
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to resolve item {item_id}: {response.status_code} - {response.text}")
+    
+    drive_item = response.json()
+    filename = drive_item.get("name", f"item_{item_id}")
+    download_url = drive_item.get("@microsoft.graph.downloadUrl")
+    if not download_url:
+        raise RuntimeError(f"No download URL for item {item_id}")
+    
+    local_path = os.path.join(dest_dir, f"{item_id}_{os.path.basename(filename)}")
+    # The download URL is pre-authenticated; it still goes through the pooled session
+    StreamingDownloader().download(download_url, local_path, session=graph.session)
+    
+    return local_path, filename, drive_item.get("id")
+
 def batch_update_metadata(updates: list) -> dict:
     """
-    Batch update multiple documents
+    Batch update multiple documents through Graph $batch requests (20 per request)
     
     Args:
         updates: List of update dictionaries with keys: item_id, filename, doc_type, doc_category
         
     Returns:
-        dict: Summary of results
+        dict: Summary of results, with per-item outcomes under "results"
     """
-    results = {"success": 0, "failed": 0, "errors": []}
+    results = {"success": 0, "failed": 0, "errors": [], "results": []}
     
-    for update in updates:
-        try:
-            success = update_metadata(
-                update["item_id"],
-                update["filename"], 
-                update["doc_type"],
-                update["doc_category"]
-            )
-            
-            if success:
-                results["success"] += 1
-            else:
-                results["failed"] += 1
-                results["errors"].append(f"Failed to update {update['filename']}")
-                
-        except Exception as e:
+    try:
+        writer = MetadataWriter(graph=get_graph_client())
+        outcomes = writer.write(
+            FieldUpdate(update["item_id"], classification_fields(update["doc_type"], update["doc_category"]),
+                        filename=update["filename"])
+            for update in updates
+        )
+    except Exception as e:
+        logger.error(f"Batch metadata update failed: {e}")
+        results["failed"] = len(updates)
+        results["errors"] = [f"Error updating {update['filename']}: {e}" for update in updates]
+        return results
+    
+    for outcome in outcomes:
+        results["results"].append(asdict(outcome))
+        if outcome.success:
+            results["success"] += 1
+        else:
             results["failed"] += 1
-            results["errors"].append(f"Error updating {update['filename']}: {e}")
+            results["errors"].append(f"Failed to update {outcome.filename}: {outcome.status} - {outcome.error}")
     
     return results
 
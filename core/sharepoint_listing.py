@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+SharePoint Listing Queries
+Graph listing URLs that request only the properties the processors read. Drive children
+and delta pages use one shared `$select`; list item queries select the needed columns
+and expand each item's driveItem (with its parentReference) in the same request instead
+of one `/driveItem` call per item. Modified-date and file-type filters run server-side on
+list item queries; the drive children endpoint cannot filter on SharePoint, so the
+same ListingFilter is applied to children as they are listed, before anything is queued
+or downloaded.
+"""
+
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterator, Optional, Sequence, Tuple
+
+# driveItem properties any processor reads (change detection, crawl, download, write-back)
+DRIVE_ITEM_SELECT = ("id,name,eTag,cTag,size,file,folder,deleted,parentReference,"
+                     "sharepointIds,lastModifiedDateTime,@microsoft.graph.downloadUrl")
+# Columns the case listings read
+CASE_FIELDS = ("FileLeafRef", "Title")
+PAGE_SIZE = 999
+
+# Non-indexed column filters are refused on large lists without this header
+_FILTER_PREFER = {"Prefer": "HonorNonIndexedQueriesWarningMayFailRandomly"}
+
+
+def _parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+@dataclass(frozen=True)
+class ListingFilter:
+    """Which files a listing should return."""
+    extensions: Optional[FrozenSet[str]] = None   # lower-case, with the dot
+    modified_since: Optional[datetime] = None
+
+    @classmethod
+    def from_env(cls) -> "ListingFilter":
+        """LISTING_EXTENSIONS (e.g. ".pdf,.docx") and LISTING_MODIFIED_SINCE (ISO 8601)."""
+        extensions = os.getenv("LISTING_EXTENSIONS")
+        since = os.getenv("LISTING_MODIFIED_SINCE")
+        return cls(
+            frozenset(f".{e.strip().lower().lstrip('.')}" for e in extensions.split(",") if e.strip())
+            if extensions else None,
+            _parse_timestamp(since) if since else None
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.extensions) or self.modified_since is not None
+
+    def accepts(self, item: Dict) -> bool:
+        """Client-side check for a driveItem; folders always pass so they can be walked."""
+        if "file" not in item:
+            return True
+        if self.extensions and Path(item.get("name", "")).suffix.lower() not in self.extensions:
+            return False
+        if self.modified_since and item.get("lastModifiedDateTime"):
+            return _parse_timestamp(item["lastModifiedDateTime"]) >= self.modified_since
+        return True
+
+    def odata_filter(self) -> Optional[str]:
+        """Equivalent `$filter` on list item columns, or None."""
+        clauses = []
+        if self.modified_since:
+            stamp = self.modified_since.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            clauses.append(f"fields/Modified ge '{stamp}'")
+        if self.extensions:
+            types = " or ".join(f"fields/File_x0020_Type eq '{ext.lstrip('.')}'" for ext in sorted(self.extensions))
+            clauses.append(f"({types})")
+        return " and ".join(clauses) or None
+
+
+def children_url(graph_root: str, drive: str, item_id: str, page_size: int = PAGE_SIZE) -> str:
+    """Children of a folder; `drive` is e.g. "drives/<id>" or "sites/<id>/drive"."""
+    return f"{graph_root}/{drive}/items/{item_id}/children?$select={DRIVE_ITEM_SELECT}&$top={page_size}"
+
+
+def list_items_query(site_id: str, list_id: str, fields: Sequence[str] = CASE_FIELDS,
+                     listing_filter: Optional[ListingFilter] = None,
+                     drive_item_select: str = "id,name,parentReference",
+                     page_size: int = PAGE_SIZE) -> Tuple[str, Dict[str, str]]:
+    """
+    Path and headers for listing a list's items with their driveItems expanded.
+
+    Args:
+        site_id: SharePoint site ID
+        list_id: List (document library) ID
+        fields: Columns to return under `fields`
+        listing_filter: Filter applied server-side on the Modified / File_x0020_Type columns
+        drive_item_select: driveItem properties to expand (empty to skip the expansion)
+        page_size: Items per page
+
+    Returns:
+        (path relative to the Graph root, extra request headers)
+    """
+    expand = [f"fields($select={','.join(fields)})"]
+    if drive_item_select:
+        expand.append(f"driveItem($select={drive_item_select})")
+    path = f"sites/{site_id}/lists/{list_id}/items?$select=id&$expand={','.join(expand)}&$top={page_size}"
+    odata_filter = listing_filter.odata_filter() if listing_filter else None
+    if odata_filter:
+        return f"{path}&$filter={odata_filter}", dict(_FILTER_PREFER)
+    return path, {}
+
+
+def iter_list_items(graph, site_id: str, list_id: str, **query) -> Iterator[Dict]:
+    """Yield every list item (see list_items_query for options), following nextLink."""
+    path, headers = list_items_query(site_id, list_id, **query)
+    yield from graph.iter_pages(path, headers=headers)
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+SharePoint Change Notifications
+Graph webhook receiver that replaces polling the whole library. Graph posts a
+notification whenever the document library changes; notifications carry no item
+details, so bursts of them (an upload fires several) are debounced into a single delta
+round, and only the files that actually changed are queued for classification. The
+change index drops our own metadata write-backs, which Graph reports as changes too.
+The drive subscription is created on startup and renewed before it expires.
+Every API worker can receive notifications: delta rounds and subscription checks take a
+lock shared across processes, and only one worker runs the renewal loop.
+"""
+
+import hmac
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.change_index import CLASSIFY, UNCHANGED, ChangeIndex
+from core.process_lock import ProcessLock
+from core.sharepoint_delta import DeltaSync
+from core.sharepoint_listing import ListingFilter
+
+logger = logging.getLogger(__name__)
+
+# Quiet period before a delta round, and the longest a notification waits during a burst
+WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", "5"))
+WEBHOOK_MAX_DELAY_SECONDS = float(os.getenv("WEBHOOK_MAX_DELAY_SECONDS", "30"))
+# driveItem subscriptions live at most 42300 minutes (just under 30 days)
+SUBSCRIPTION_MINUTES = int(os.getenv("WEBHOOK_SUBSCRIPTION_MINUTES", "42300"))
+SUBSCRIPTION_RENEW_MARGIN = float(os.getenv("WEBHOOK_RENEW_MARGIN_SECONDS", str(24 * 3600)))
+SUBSCRIPTION_CHECK_INTERVAL = float(os.getenv("WEBHOOK_CHECK_INTERVAL_SECONDS", "3600"))
+
+
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _format_timestamp(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+
+
+def verify_notifications(payload: Dict, client_state: str) -> Tuple[List[Dict], int]:
+    """
+    Split a notification POST into entries carrying our clientState and the rest.
+
+    Returns:
+        (valid notifications, number rejected)
+    """
+    valid, rejected = [], 0
+    for notification in payload.get("value") or []:
+        received = notification.get("clientState") or ""
+        if client_state and hmac.compare_digest(received.encode(), client_state.encode()):
+            valid.append(notification)
+        else:
+            rejected += 1
+    return valid, rejected
+
+
+class SubscriptionManager:
+    """Keeps one Graph change subscription for a resource alive."""
+
+    def __init__(self, graph, resource: str, notification_url: str, client_state: str,
+                 lifetime_minutes: int = SUBSCRIPTION_MINUTES,
+                 renew_margin: float = SUBSCRIPTION_RENEW_MARGIN, lock=None):
+        """
+        Args:
+            graph: GraphClient
+            resource: Subscribed resource, e.g. "sites/<id>/drive/root"
+            notification_url: Public HTTPS URL of the webhook endpoint
+            client_state: Secret echoed back in every notification
+            lifetime_minutes: Requested subscription lifetime
+            renew_margin: Renew when fewer than this many seconds remain
+            lock: Held while checking, so two processes never both create one
+        """
+        self.graph = graph
+        self.resource = resource
+        self.notification_url = notification_url
+        self.client_state = client_state
+        self.lifetime_minutes = lifetime_minutes
+        self.renew_margin = renew_margin
+        self.lock = lock or nullcontext()
+        self.subscription: Optional[Dict] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _expiry(self) -> str:
+        return _format_timestamp(datetime.now(timezone.utc) + timedelta(minutes=self.lifetime_minutes))
+
+    def _seconds_left(self, subscription: Dict) -> float:
+        expires = _parse_timestamp(subscription["expirationDateTime"])
+        return (expires - datetime.now(timezone.utc)).total_seconds()
+
+    def _find_existing(self) -> Optional[Dict]:
+        for subscription in self.graph.iter_pages("subscriptions"):
+            if (subscription.get("resource") == self.resource
+                    and subscription.get("notificationUrl") == self.notification_url):
+                return subscription
+        return None
+
+    def _create(self) -> Dict:
+        response = self.graph.post("subscriptions", json={
+            "changeType": "updated",
+            "notificationUrl": self.notification_url,
+            "lifecycleNotificationUrl": self.notification_url,
+            "resource": self.resource,
+            "expirationDateTime": self._expiry(),
+            "clientState": self.client_state,
+        })
+        if response.status_code != 201:
+            raise RuntimeError(f"Subscription create failed: {response.status_code} - {response.text}")
+        logger.info(f"📬 Subscribed to changes of {self.resource}")
+        return response.json()
+
+    def _renew(self, subscription: Dict) -> Optional[Dict]:
+        response = self.graph.patch(f"subscriptions/{subscription['id']}",
+                                    json={"expirationDateTime": self._expiry()})
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise RuntimeError(f"Subscription renewal failed: {response.status_code} - {response.text}")
+        logger.info(f"🔄 Renewed subscription {subscription['id']}")
+        return response.json()
+
+    def ensure(self, force_renew: bool = False) -> Dict:
+        """
+        Create, adopt or renew the subscription so it outlives the renewal margin.
+
+        Args:
+            force_renew: Renew regardless of the expiry (Graph asked for reauthorization)
+        """
+        with self.lock:
+            subscription = self.subscription or self._find_existing()
+            if subscription is not None and (force_renew or self._seconds_left(subscription) < self.renew_margin):
+                # A subscription that already expired (or was removed) is gone: create a new one
+                subscription = self._renew(subscription) if self._seconds_left(subscription) > 0 else None
+            if subscription is None:
+                subscription = self._create()
+            self.subscription = subscription
+            return subscription
+
+    def _loop(self, interval: float, retry_interval: float):
+        while not self._stop.is_set():
+            try:
+                self.ensure()
+                wait = interval
+            except Exception as e:
+                logger.error(f"❌ Subscription check failed: {e}")
+                wait = retry_interval
+            self._stop.wait(wait)
+
+    def start(self, interval: float = SUBSCRIPTION_CHECK_INTERVAL, retry_interval: float = 60.0):
+        """
+        Check the subscription in the background. Creating it makes Graph call the
+        endpoint for validation, so this must not block application startup.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval, retry_interval),
+                                         name="graph-subscription", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class ChangeFeed:
+    """Debounced delta rounds that queue changed files for classification."""
+
+    def __init__(self, delta: DeltaSync, enqueue_fn: Callable[[List[Dict]], str],
+                 change_index: Optional[ChangeIndex] = None,
+                 listing_filter: Optional[ListingFilter] = None,
+                 debounce: float = WEBHOOK_DEBOUNCE_SECONDS,
+                 max_delay: float = WEBHOOK_MAX_DELAY_SECONDS, lock=None):
+        """
+        Args:
+            delta: Delta reader for the subscribed drive (its saved token is advanced)
+            enqueue_fn: Submits job items and returns the job ID (JobQueue.submit)
+            change_index: Skips files whose content was already classified
+            listing_filter: Skips file types / dates that are never classified
+            debounce: Seconds without notifications before a round starts
+            max_delay: Upper bound on how long a burst can postpone a round
+            lock: Held for a whole round, so feeds in other processes start from the token it saved
+        """
+        self.delta = delta
+        self.enqueue_fn = enqueue_fn
+        self.change_index = change_index
+        self.listing_filter = listing_filter or ListingFilter()
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.lock = lock or nullcontext()
+        self.stats = {"notifications": 0, "rounds": 0, "queued": 0, "unchanged": 0, "filtered": 0}
+
+        self._cond = threading.Condition()
+        self._first: Optional[float] = None
+        self._last: Optional[float] = None
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def notify(self):
+        """Record a notification; the delta round follows once the burst settles."""
+        with self._cond:
+            now = time.monotonic()
+            self.stats["notifications"] += 1
+            if self._first is None:
+                self._first = now
+            self._last = now
+            self._cond.notify()
+
+    def _job_item(self, item: Dict) -> Optional[Dict]:
+        list_item_id = (item.get("sharepointIds") or {}).get("listItemId")
+        if not list_item_id:
+            return None
+        return {
+            "kind": "sharepoint",
+            "item_id": list_item_id,
+            "filename": item.get("name"),
+            "update_metadata": True,
+            # Version that was queued, recorded in the change index after the write-back
+            "drive_item": {key: item[key] for key in ("id", "name", "eTag", "cTag", "size", "file")
+                           if key in item},
+        }
+
+    def sync_once(self) -> Optional[str]:
+        """
+        Run one delta round and queue the changed files.
+
+        Returns:
+            The job ID, or None if nothing needed classifying
+        """
+        with self.lock:
+            return self._sync_locked()
+
+    def _sync_locked(self) -> Optional[str]:
+        changes = self.delta.fetch_changes()
+        items = []
+        for item in changes.changed:
+            if not self.listing_filter.accepts(item):
+                self.stats["filtered"] += 1
+                continue
+            if self.change_index is not None and self.change_index.check(CLASSIFY, item).status == UNCHANGED:
+                self.stats["unchanged"] += 1
+                continue
+            job_item = self._job_item(item)
+            if job_item is not None:
+                items.append(job_item)
+
+        job_id = self.enqueue_fn(items) if items else None
+        if self.change_index is not None and changes.deleted:
+            self.change_index.forget(changes.deleted)
+        # Only after the items are safely queued
+        if changes.delta_link:
+            self.delta.save_delta_link(changes.delta_link)
+
+        self.stats["rounds"] += 1
+        self.stats["queued"] += len(items)
+        if job_id:
+            logger.info(f"📥 Queued {len(items)} changed SharePoint files as job {job_id}")
+        return job_id
+
+    def _next_round(self) -> bool:
+        """Block until a debounced round is due; False once stopped."""
+        with self._cond:
+            while not self._stop:
+                if self._first is None:
+                    self._cond.wait()
+                    continue
+                due = min(self._last + self.debounce, self._first + self.max_delay)
+                remaining = due - time.monotonic()
+                if remaining <= 0:
+                    # Notifications arriving during the round start the next one
+                    self._first = self._last = None
+                    return True
+                self._cond.wait(remaining)
+            return False
+
+    def _loop(self):
+        while self._next_round():
+            try:
+                self.sync_once()
+            except Exception as e:
+                logger.error(f"❌ Delta round failed: {e}")
+
+    def start(self):
+        """
+        Start the round worker. Without a saved token the feed starts from "now": the
+        existing backlog belongs to the batch scripts, not to the webhook.
+        """
+        with self.lock:
+            if self.delta.saved_delta_link() is None:
+                self.delta.skip_to_latest()
+        self._stop = False
+        self._thread = threading.Thread(target=self._loop, name="sharepoint-change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class WebhookReceiver:
+    """Validated notifications in, debounced delta rounds out, subscription kept alive."""
+
+    def __init__(self, feed: ChangeFeed, subscriptions: SubscriptionManager, client_state: str):
+        self.feed = feed
+        self.subscriptions = subscriptions
+        self.client_state = client_state
+
+    @classmethod
+    def from_env(cls, graph, enqueue_fn: Callable[[List[Dict]], str],
+                 change_index: Optional[ChangeIndex] = None) -> "WebhookReceiver":
+        """
+        Build a receiver for the site's default library from SITE_ID,
+        WEBHOOK_NOTIFICATION_URL and WEBHOOK_CLIENT_STATE. Receivers sharing the delta
+        state file also share a lock file next to it.
+        """
+        site_id = os.getenv("SITE_ID")
+        notification_url = os.getenv("WEBHOOK_NOTIFICATION_URL")
+        client_state = os.getenv("WEBHOOK_CLIENT_STATE")
+        if not all([site_id, notification_url, client_state]):
+            raise RuntimeError("Missing webhook configuration (SITE_ID, WEBHOOK_NOTIFICATION_URL, "
+                               "WEBHOOK_CLIENT_STATE)")
+        delta = DeltaSync(site_id, access_token="", session=graph, graph_root=graph.graph_root,
+                          state_path=os.getenv("WEBHOOK_DELTA_STATE_PATH"))
+        lock = ProcessLock(str(delta.state_path.with_suffix(".lock")))
+        feed = ChangeFeed(delta, enqueue_fn, change_index=change_index,
+                          listing_filter=ListingFilter.from_env(), lock=lock)
+        subscriptions = SubscriptionManager(graph, f"{delta.drive_key}/root",
+                                            notification_url, client_state, lock=lock)
+        return cls(feed, subscriptions, client_state)
+
+    def handle(self, payload: Dict) -> int:
+        """
+        Process one notification POST.
+
+        Returns:
+            Number of notifications accepted (0 means none carried our clientState)
+        """
+        notifications, rejected = verify_notifications(payload, self.client_state)
+        if rejected:
+            logger.warning(f"⚠️ Rejected {rejected} notifications with an unexpected clientState")
+        for notification in notifications:
+            lifecycle_event = notification.get("lifecycleEvent")
+            if lifecycle_event:
+                logger.info(f"📬 Subscription lifecycle event: {lifecycle_event}")
+                if lifecycle_event == "subscriptionRemoved":
+                    self.subscriptions.subscription = None
+                # Missed changes are still in the delta feed, so every event also triggers a round
+                threading.Thread(target=self._ensure_quietly, daemon=True,
+                                 args=(lifecycle_event == "reauthorizationRequired",)).start()
+            self.feed.notify()
+        return len(notifications)
+
+    def _ensure_quietly(self, force_renew: bool = False):
+        try:
+            self.subscriptions.ensure(force_renew=force_renew)
+        except Exception as e:
+            logger.error(f"❌ Subscription check failed: {e}")
+
+    def start(self, manage_subscription: bool = True):
+        """
+        Args:
+            manage_subscription: Run the renewal loop (one process per deployment)
+        """
+        self.feed.start()
+        if manage_subscription:
+            self.subscriptions.start()
+
+    def stop(self):
+        self.subscriptions.stop()
+        self.feed.stop()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Streaming File Downloads
+Downloads SharePoint files straight to disk in fixed-size chunks, hashing them (SHA-256,
+the extraction cache key) as the bytes arrive, so a multi-hundred-MB PDF never sits in
+memory. Enforces a maximum size and total/idle timeouts, resumes interrupted transfers
+with HTTP Range requests, and retries throttling using Retry-After. A synchronous
+`download()` serves one-off callers; `fetch_all()` runs many downloads on a bounded
+async pool.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import aiohttp
+import requests
+
+from core.graph_client import retry_delay
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_MAX_BYTES = int(os.getenv("DOWNLOAD_MAX_BYTES", str(1024 ** 3)))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "900"))
+# Longest wait for the next chunk before the connection is treated as dead
+DOWNLOAD_IDLE_TIMEOUT = float(os.getenv("DOWNLOAD_IDLE_TIMEOUT", "60"))
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "8"))
+DOWNLOAD_MAX_RETRIES = 3
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class DownloadError(RuntimeError):
+    """Raised when a file could not be downloaded."""
+
+
+class DownloadTooLarge(DownloadError):
+    """Raised when a file exceeds the size limit; never retried."""
+
+
+@dataclass
+class DownloadResult:
+    """A completed download."""
+    path: Path
+    size: int
+    sha256: str
+    resumed: int = 0        # times the transfer continued from a byte offset
+
+
+class _Sink:
+    """Appends chunks to `<dest>.part`, hashing and counting as it goes."""
+
+    def __init__(self, dest: Path, max_bytes: int):
+        self.dest = Path(dest)
+        self.part = self.dest.with_name(self.dest.name + ".part")
+        self.max_bytes = max_bytes
+        self.validator: Optional[str] = None   # ETag/Last-Modified of the bytes written so far
+        self.resumed = 0
+        self.reset()
+
+    def reset(self):
+        self.dest.parent.mkdir(parents=True, exist_ok=True)
+        self.fh = open(self.part, "wb")
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def range_headers(self) -> Dict[str, str]:
+        if not self.size:
+            return {}
+        headers = {"Range": f"bytes={self.size}-"}
+        if self.validator:
+            # Only continue if the file is still the version we started on
+            headers["If-Range"] = self.validator
+        return headers
+
+    def start(self, status: int, headers) -> None:
+        """Check a response before its body is read; restart if the server ignored Range."""
+        if self.size and status == 206:
+            if not headers.get("Content-Range", "").startswith(f"bytes {self.size}-"):
+                raise DownloadError(f"Unexpected Content-Range {headers.get('Content-Range')}")
+            self.resumed += 1
+            logger.info(f"↩️ Resuming {self.dest.name} at {self.size} bytes")
+        elif self.size:
+            self.fh.close()
+            self.reset()
+        expected = headers.get("Content-Length")
+        if expected is not None and self.size + int(expected) > self.max_bytes:
+            raise DownloadTooLarge(f"{self.dest.name} is {self.size + int(expected)} bytes "
+                                   f"(limit {self.max_bytes})")
+        self.validator = headers.get("ETag") or headers.get("Last-Modified")
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise DownloadTooLarge(f"{self.dest.name} exceeded {self.max_bytes} bytes")
+        self.hasher.update(chunk)
+        self.fh.write(chunk)
+
+    def commit(self) -> DownloadResult:
+        self.fh.close()
+        os.replace(self.part, self.dest)
+        return DownloadResult(self.dest, self.size, self.hasher.hexdigest(), self.resumed)
+
+    def discard(self):
+        self.fh.close()
+        self.part.unlink(missing_ok=True)
+
+
+class StreamingDownloader:
+    """Chunked, hashed, size- and time-limited downloads with Range resume."""
+
+    def __init__(self, max_bytes: int = DOWNLOAD_MAX_BYTES, timeout: float = DOWNLOAD_TIMEOUT,
+                 idle_timeout: float = DOWNLOAD_IDLE_TIMEOUT, concurrency: int = DOWNLOAD_CONCURRENCY,
+                 max_retries: int = DOWNLOAD_MAX_RETRIES, chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                 backoff_base: float = 1.0):
+        """
+        Args:
+            max_bytes: Largest file accepted
+            timeout: Total seconds allowed per file, across retries
+            idle_timeout: Seconds to wait for the next chunk
+            concurrency: Downloads in flight in fetch_all()
+            max_retries: Retries on throttling, server errors or dropped connections
+            chunk_size: Bytes read and written at a time
+            backoff_base: First exponential backoff step in seconds
+        """
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.chunk_size = chunk_size
+        self.backoff_base = backoff_base
+
+    def _check_deadline(self, deadline: float, sink: _Sink):
+        if time.monotonic() > deadline:
+            raise DownloadError(f"{sink.dest.name} did not finish within {self.timeout}s")
+
+    # ------------------------------------------------------------------ sync
+
+    def download(self, url: str, dest: Union[str, Path],
+                 session: Optional[requests.Session] = None) -> DownloadResult:
+        """
+        Download `url` to `dest` (written as `dest.part`, renamed when complete).
+
+        Args:
+            url: Pre-authenticated download URL
+            dest: Final file path
+            session: Session to reuse (e.g. the Graph client's pooled session)
+        """
+        http = session or requests
+        sink = _Sink(Path(dest), self.max_bytes)
+        deadline = time.monotonic() + self.timeout
+        try:
+            for attempt in range(self.max_retries + 1):
+                self._check_deadline(deadline, sink)
+                try:
+                    with http.get(url, headers=sink.range_headers(), stream=True,
+                                  timeout=(self.idle_timeout, self.idle_timeout)) as response:
+                        if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                            delay = retry_delay(attempt, response.headers.get("Retry-After"), self.backoff_base)
+                            logger.warning(f"⏳ Download of {sink.dest.name} got {response.status_code}; "
+                                           f"retrying in {delay:.1f}s")
+                            time.sleep(delay)
+                            continue
+                        response.raise_for_status()
+                        sink.start(response.status_code, response.headers)
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            sink.write(chunk)
+                            self._check_deadline(deadline, sink)
+                    return sink.commit()
+                except (requests.ConnectionError, requests.Timeout,
+                        requests.exceptions.ChunkedEncodingError) as e:
+                    if attempt == self.max_retries:
+                        raise DownloadError(f"{sink.dest.name}: {e}") from e
+                    logger.warning(f"⚠️ Download of {sink.dest.name} interrupted at {sink.size} bytes "
+                                   f"({type(e).__name__}); retrying")
+                    time.sleep(retry_delay(attempt, base=self.backoff_base))
+            raise DownloadError(f"Gave up on {sink.dest.name} after {self.max_retries} retries")
+        except BaseException:
+            sink.discard()
+            raise
+
+    # ------------------------------------------------------------------ async
+
+    async def fetch(self, session: aiohttp.ClientSession, url: str,
+                    dest: Union[str, Path]) -> DownloadResult:
+        """Async counterpart of download() on an aiohttp session."""
+        sink = _Sink(Path(dest), self.max_bytes)
+        deadline = time.monotonic() + self.timeout
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.idle_timeout)
+        try:
+            for attempt in range(self.max_retries + 1):
+                self._check_deadline(deadline, sink)
+                try:
+                    async with session.get(url, headers=sink.range_headers(), timeout=timeout) as response:
+                        if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                            delay = retry_delay(attempt, response.headers.get("Retry-After"), self.backoff_base)
+                            logger.warning(f"⏳ Download of {sink.dest.name} got {response.status}; "
+                                           f"retrying in {delay:.1f}s")
+                            await asyncio.sleep(delay)
+                            continue
+                        response.raise_for_status()
+                        sink.start(response.status, response.headers)
+                        async for chunk in response.content.iter_chunked(self.chunk_size):
+                            # Small local writes; a thread hop per chunk would cost more
+                            sink.write(chunk)
+                            self._check_deadline(deadline, sink)
+                    return sink.commit()
+                except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                    if attempt == self.max_retries:
+                        raise DownloadError(f"{sink.dest.name}: {type(e).__name__} {e}") from e
+                    logger.warning(f"⚠️ Download of {sink.dest.name} interrupted at {sink.size} bytes "
+                                   f"({type(e).__name__}); retrying")
+                    await asyncio.sleep(retry_delay(attempt, base=self.backoff_base))
+            raise DownloadError(f"Gave up on {sink.dest.name} after {self.max_retries} retries")
+        except BaseException:
+            sink.discard()
+            raise
+
+    async def fetch_all(self, jobs: Iterable[Tuple[str, Union[str, Path]]]
+                        ) -> List[Union[DownloadResult, Exception]]:
+        """
+        Download (url, dest) pairs with at most `concurrency` in flight.
+
+        Returns:
+            A DownloadResult or the exception raised, per job, in input order
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+
+        async with aiohttp.ClientSession(connector=connector) as session:
+            async def one(url, dest):
+                async with semaphore:
+                    return await self.fetch(session, url, dest)
+
+            return await asyncio.gather(*(one(url, dest) for url, dest in jobs), return_exceptions=True)
@@ -5,22 +5,130 @@ Implements transformer-based OCR as mentioned in PDF requirements for better acc
 """
 
 import torch
+import numpy as np
 import os
+import multiprocessing
+import multiprocessing.pool
+from collections import deque
 from transformers import TrOCRProcessor as HFTrOCRProcessor, VisionEncoderDecoderModel
 from PIL import Image
 import fitz  # PyMuPDF
-import io
 import logging
-from typing import List, Optional
+from typing import Dict, List, Optional
+
+from core.extraction_cache import get_extraction_cache
+from core.page_extraction import PagePlan, extract_pdf_pages, tesseract_ocr_pages
+from core.page_render import PageRenderer, image_from_samples, render_pixmap
 
 logger = logging.getLogger(__name__)
 
+# Engine used by OCR pool worker processes (set by _ocr_worker_init)
+_worker_engine = None
+_worker_trocr = None
+
+# Longest text expected on a single line crop
+MAX_LINE_TOKENS = 96
+# Padding (pixels) added around each line crop
+LINE_PADDING = 4
+
+def _tesseract_line_boxes(image: Image.Image) -> Optional[List[tuple]]:
+    """
+    Line boxes in reading order from Tesseract, or None if unavailable.
+
+    image_to_data runs full recognition to report line boxes, so this costs about one
+    extra Tesseract pass per page; it is opt-in for layouts the profile segmenter splits badly.
+    """
+    try:
+        import pytesseract
+        data = pytesseract.image_to_data(image, config="--psm 3", output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        logger.debug(f"Tesseract layout unavailable, using projection segmenter: {e}")
+        return None
+    
+    boxes = []
+    for i, level in enumerate(data["level"]):
+        if level == 4 and data["width"][i] > 0 and data["height"][i] > 0:  # text line
+            boxes.append((
+                (data["block_num"][i], data["par_num"][i], data["line_num"][i]),
+                (data["left"][i], data["top"][i],
+                 data["left"][i] + data["width"][i], data["top"][i] + data["height"][i])
+            ))
+    boxes.sort(key=lambda entry: entry[0])
+    return [box for _, box in boxes]
+
+def _projection_line_boxes(image: Image.Image, min_height: int = 6, max_gap: int = 2) -> List[tuple]:
+    """Line boxes from a horizontal projection profile of dark pixels, top to bottom."""
+    gray = np.asarray(image.convert("L"))
+    ink = gray < min(200, int(gray.mean() * 0.8))
+    rows = ink.sum(axis=1) > max(1, int(ink.shape[1] * 0.002))
+    
+    boxes = []
+    start = None
+    gap = 0
+    for y, has_ink in enumerate(rows):
+        if has_ink:
+            if start is None:
+                start = y
+            gap = 0
+        elif start is not None:
+            gap += 1
+            if gap > max_gap:
+                boxes.append((start, y - gap + 1))
+                start = None
+    if start is not None:
+        boxes.append((start, len(rows)))
+    
+    line_boxes = []
+    for top, bottom in boxes:
+        if bottom - top < min_height:
+            continue
+        columns = np.flatnonzero(ink[top:bottom].any(axis=0))
+        if columns.size:
+            line_boxes.append((int(columns[0]), top, int(columns[-1]) + 1, bottom))
+    return line_boxes
+
+def segment_text_lines(image: Image.Image, method: str = "projection") -> List[Image.Image]:
+    """
+    Split a page image into text-line crops in reading order.
+    
+    Args:
+        image: Page image
+        method: "projection" (profile segmenter) or "tesseract" (layout from a full
+            Tesseract pass, falling back to the profile segmenter)
+    
+    Returns:
+        List of RGB line crops
+    """
+    boxes = None
+    if method == "tesseract":
+        boxes = _tesseract_line_boxes(image)
+    if boxes is None:
+        boxes = _projection_line_boxes(image)
+    
+    width, height = image.size
+    crops = []
+    for left, top, right, bottom in boxes:
+        crops.append(image.crop((
+            max(0, left - LINE_PADDING), max(0, top - LINE_PADDING),
+            min(width, right + LINE_PADDING), min(height, bottom + LINE_PADDING)
+        )).convert("RGB"))
+    return crops
+
 class TrOCRProcessor:
-    def __init__(self):
+    def __init__(self, batch_size: Optional[int] = None, num_threads: Optional[int] = None,
+                 segmenter: Optional[str] = None):
         # Force CPU usage to avoid GPU memory conflicts with Mistral model
         self.device = "cpu"
         self.processor = None
         self.model = None
+        
+        # TrOCR is a line-level model: pages are split into line crops recognized in batches
+        self.batch_size = batch_size or int(os.getenv("TROCR_BATCH_SIZE", "16"))
+        self.num_threads = num_threads or int(os.getenv("TROCR_THREADS", "0"))
+        self.segmenter = segmenter or os.getenv("TROCR_SEGMENTER", "projection")
+        if self.num_threads > 0:
+            torch.set_num_threads(self.num_threads)
+        
         self._initialize_model()
     
     def _initialize_model(self):
@@ -45,29 +153,38 @@ class TrOCRProcessor:
         """Check if TrOCR is available for use."""
         return self.processor is not None and self.model is not None
     
-    def extract_text_from_image(self, image: Image.Image) -> str:
-        """Extract text from a PIL Image using TrOCR."""
+    def recognize_lines(self, crops: List[Image.Image]) -> List[str]:
+        """Run TrOCR on line crops in batches of `batch_size`."""
         if not self.is_available():
             raise RuntimeError("TrOCR model not available")
         
-        try:
-            # Ensure image is in RGB format
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Process image
-            pixel_values = self.processor(images=image, return_tensors="pt").pixel_values
+        texts = []
+        for start in range(0, len(crops), self.batch_size):
+            batch = crops[start:start + self.batch_size]
+            pixel_values = self.processor(images=batch, return_tensors="pt").pixel_values
             
             if self.device == "cuda":
                 pixel_values = pixel_values.to(self.device)
             
-            # Generate text
             with torch.no_grad():
-                generated_ids = self.model.generate(pixel_values, max_length=512)
+                generated_ids = self.model.generate(pixel_values, max_new_tokens=MAX_LINE_TOKENS)
+            
+            texts.extend(self.processor.batch_decode(generated_ids, skip_special_tokens=True))
+        return texts
+    
+    def extract_text_from_image(self, image: Image.Image) -> str:
+        """Extract text from a PIL Image (e.g. a full page) using batched line-level TrOCR."""
+        if not self.is_available():
+            raise RuntimeError("TrOCR model not available")
+        
+        try:
+            crops = segment_text_lines(image, self.segmenter)
+            if not crops:
+                return ""
             
-            # Decode text
-            text = self.processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
-            return text.strip()
+            # Lines come back in reading order
+            lines = self.recognize_lines(crops)
+            return "\n".join(line.strip() for line in lines if line.strip())
             
         except Exception as e:
             logger.error(f"TrOCR text extraction failed: {e}")
@@ -82,16 +199,10 @@ class TrOCRProcessor:
             doc = fitz.open(pdf_path)
             all_text = []
             
+            renderer = PageRenderer()
             for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                
-                # Render page as image
-                mat = fitz.Matrix(2.0, 2.0)  # 2x zoom for better OCR
-                pix = page.get_pixmap(matrix=mat)
-                img_data = pix.tobytes("png")
-                
-                # Convert to PIL Image
-                image = Image.open(io.BytesIO(img_data))
+                # Line crops are copied out of the page image, so the buffer can be reused
+                image = renderer.render(doc.load_page(page_num), 144)  # 2x zoom
                 
                 # Extract text using TrOCR
                 page_text = self.extract_text_from_image(image)
@@ -113,10 +224,20 @@ class HybridOCRProcessor:
     Falls back to Tesseract if TrOCR is not available.
     """
     
-    def __init__(self):
+    def __init__(self, parallel: Optional[bool] = None, max_workers: Optional[int] = None,
+                 max_in_flight: Optional[int] = None, page_timeout: Optional[float] = None):
         self.trocr = TrOCRProcessor()
         self.use_trocr = self.trocr.is_available()
         
+        # Page-parallel OCR settings
+        if parallel is None:
+            parallel = os.getenv("OCR_PARALLEL", "true").lower() in ("1", "true", "yes")
+        self.parallel = parallel
+        self.max_workers = max_workers or int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 2)))
+        self.max_in_flight = max_in_flight or int(os.getenv("OCR_MAX_IN_FLIGHT", str(self.max_workers * 2)))
+        self.page_timeout = page_timeout or float(os.getenv("OCR_PAGE_TIMEOUT", "120"))
+        self._pools: Dict[str, multiprocessing.pool.Pool] = {}
+        
         if self.use_trocr:
             logger.info("Hybrid OCR: TrOCR available, will use for primary OCR")
         else:
@@ -134,58 +255,171 @@ class HybridOCRProcessor:
             Extracted text
         """
         try:
-            # First try extracting embedded text
-            doc = fitz.open(pdf_path)
-            embedded_text = ""
-            for page in doc:
-                embedded_text += page.get_text()
-            doc.close()
+            engine = "trocr" if self.use_trocr and prefer_trocr else "tesseract"
             
-            # If we have substantial embedded text, use it
-            if len(embedded_text.strip()) > 100:
-                logger.info("Using embedded PDF text (no OCR needed)")
-                return embedded_text
+            def extract():
+                failed_pages = []
+                
+                def ocr(doc, plans):
+                    results = self._ocr_pages(doc, plans, engine)
+                    failed_pages.extend(plan.page_num for plan in plans if plan.page_num not in results)
+                    return results
+                
+                # Decide per page: keep the text layer where it exists, OCR the rest
+                pages = extract_pdf_pages(pdf_path, ocr_pages=ocr)
+                ocr_pages = [plan.page_num for plan, _ in pages if plan.needs_ocr]
+                # Pages that failed or timed out must not be cached as empty
+                return [text for _, text in pages], {"ocr_pages": ocr_pages, "incomplete": bool(failed_pages)}
             
-            # Need OCR - choose method
-            if self.use_trocr and prefer_trocr:
-                logger.info("Using TrOCR for PDF processing")
-                return self.trocr.extract_text_from_pdf_pages(pdf_path)
+            cache = get_extraction_cache()
+            if cache is None:
+                page_texts, meta = extract()
             else:
-                logger.info("Using Tesseract for PDF processing")
-                return self._tesseract_pdf_ocr(pdf_path)
+                entry = cache.get_or_extract(pdf_path, "hybrid_ocr", {"engine": engine}, extract)
+                page_texts, meta = entry["pages"], entry["meta"]
+            
+            if not meta.get("ocr_pages"):
+                logger.info("Using embedded PDF text (no OCR needed)")
+                return "".join(page_texts)
+            
+            return "\n\n".join(
+                f"[Page {page_num + 1}]\n{text}" for page_num, text in enumerate(page_texts) if text.strip()
+            )
                 
         except Exception as e:
             logger.error(f"Hybrid OCR failed: {e}")
             return ""
     
-    def _tesseract_pdf_ocr(self, pdf_path: str) -> str:
-        """Fallback to Tesseract OCR."""
-        try:
-            import pytesseract
-            doc = fitz.open(pdf_path)
-            all_text = []
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                mat = fitz.Matrix(2.0, 2.0)
-                pix = page.get_pixmap(matrix=mat)
-                img_data = pix.tobytes("png")
-                
-                image = Image.open(io.BytesIO(img_data))
-                page_text = pytesseract.image_to_string(image)
-                
-                if page_text.strip():
-                    all_text.append(f"[Page {page_num + 1}]\n{page_text}")
-            
-            doc.close()
-            return "\n\n".join(all_text)
+    def _ocr_pages(self, doc, plans: List[PagePlan], engine: str) -> Dict[int, str]:
+        """OCR the planned pages with the chosen engine, in parallel when enabled."""
+        if self.parallel and self.max_workers > 1 and len(plans) > 1:
+            logger.info(f"Using page-parallel {engine} OCR on {len(plans)} pages with {self.max_workers} workers")
+            return self._parallel_ocr_pages(doc, plans, engine)
+        
+        logger.info(f"Using {'TrOCR' if engine == 'trocr' else 'Tesseract'} on {len(plans)} pages")
+        if engine == "tesseract":
+            return self._tesseract_ocr_pages(doc, plans)
+        
+        renderer = PageRenderer()
+        results = {}
+        for plan in plans:
+            image = renderer.render(doc.load_page(plan.page_num), plan.dpi)
+            results[plan.page_num] = self.trocr.extract_text_from_image(image)
+        return results
+    
+    def _get_pool(self, engine: str) -> multiprocessing.pool.Pool:
+        """Return the worker pool for an engine, creating it on first use."""
+        pool = self._pools.get(engine)
+        if pool is None:
+            # Spawn, not fork: forking after torch has started its threads can deadlock
+            pool = multiprocessing.get_context("spawn").Pool(
+                processes=self.max_workers,
+                initializer=_ocr_worker_init,
+                initargs=(engine,)
+            )
+            self._pools[engine] = pool
+        return pool
+    
+    def _reset_pool(self, engine: str):
+        """Terminate an engine's pool (e.g. after a hung page); it is recreated on next use."""
+        pool = self._pools.pop(engine, None)
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    
+    def close(self):
+        """Shut down all OCR worker pools."""
+        for engine in list(self._pools):
+            self._reset_pool(engine)
+    
+    def _parallel_ocr_pages(self, doc, plans: List[PagePlan], engine: str) -> Dict[int, str]:
+        """
+        OCR planned pages in a process pool.
+        
+        Pages are rendered here at their planned DPI and handed to workers as raw
+        pixmap samples. At most `max_in_flight` rendered pages are outstanding and
+        results are collected in page order. A page that exceeds `page_timeout` is
+        skipped, and the pool is recycled right away so the pages queued behind the
+        hung worker are resubmitted instead of waiting out the document.
+        """
+        pool = self._get_pool(engine)
+        results = {}
+        pending = deque()
+        
+        def collect_oldest():
+            nonlocal pool
+            page_num, _, async_result = pending.popleft()
+            try:
+                results[page_num] = async_result.get(timeout=self.page_timeout)
+            except multiprocessing.TimeoutError:
+                logger.warning(f"OCR timed out on page {page_num + 1} of {doc.name}; skipping and recycling the pool")
+                # A hung worker cannot be interrupted, so replace the pool now
+                self._reset_pool(engine)
+                pool = self._get_pool(engine)
+                for i, (num, payload, _) in enumerate(pending):
+                    pending[i] = (num, payload, pool.apply_async(_ocr_page_worker, payload))
+            except Exception as e:
+                logger.error(f"OCR failed on page {page_num + 1} of {doc.name}: {e}")
+        
+        for plan in plans:
+            if len(pending) >= self.max_in_flight:
+                collect_oldest()
             
+            # Grayscale samples are a third of the RGB payload pickled to the worker
+            pix = render_pixmap(doc.load_page(plan.page_num), plan.dpi)
+            payload = (pix.samples, pix.width, pix.height, pix.n, pix.stride, self.page_timeout)
+            pending.append((plan.page_num, payload, pool.apply_async(_ocr_page_worker, payload)))
+            del pix
+        
+        while pending:
+            collect_oldest()
+        
+        return results
+    
+    def _tesseract_ocr_pages(self, doc, plans: List[PagePlan]) -> Dict[int, str]:
+        """Sequential Tesseract OCR fallback."""
+        try:
+            return tesseract_ocr_pages(doc, plans)
         except Exception as e:
             logger.error(f"Tesseract OCR fallback failed: {e}")
-            return ""
+            return {}
+
+def _ocr_worker_init(engine: str):
+    """Initialize an OCR pool worker process."""
+    global _worker_engine, _worker_trocr
+    _worker_engine = engine
+    # Workers are sized to cores, so keep each one single-threaded
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    torch.set_num_threads(1)
+    if engine == "trocr":
+        # Spawned workers start clean; each loads the model once, here
+        _worker_trocr = TrOCRProcessor(num_threads=1)
+
+def _ocr_page_worker(samples: bytes, width: int, height: int, channels: int, stride: int,
+                     timeout: float) -> str:
+    """OCR one rendered page inside a pool worker."""
+    try:
+        image = image_from_samples(samples, width, height, channels, stride)
+        if _worker_engine == "trocr":
+            return _worker_trocr.extract_text_from_image(image)
+        
+        import pytesseract
+        # Tesseract runs as a subprocess, so its own timeout kills a hung page
+        return pytesseract.image_to_string(image, timeout=timeout)
+    except Exception as e:
+        # Re-raise as a plain error so the parent can always unpickle it
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+# Global instance for reuse, created on first use so that spawned OCR workers
+# importing this module do not load a model of their own
+hybrid_ocr = None
 
-# Global instance for reuse
-hybrid_ocr = HybridOCRProcessor()
+def get_hybrid_ocr() -> HybridOCRProcessor:
+    """Return the shared HybridOCRProcessor, creating it on first use."""
+    global hybrid_ocr
+    if hybrid_ocr is None:
+        hybrid_ocr = HybridOCRProcessor()
+    return hybrid_ocr
 
 def extract_text_with_enhanced_ocr(file_path: str, prefer_trocr: bool = True) -> str:
     """
@@ -198,7 +432,7 @@ def extract_text_with_enhanced_ocr(file_path: str, prefer_trocr: bool = True) ->
     Returns:
         Extracted text
     """
-    return hybrid_ocr.extract_text_from_pdf(file_path, prefer_trocr)
+    return get_hybrid_ocr().extract_text_from_pdf(file_path, prefer_trocr)
 
 if __name__ == "__main__":
     # Test the TrOCR integration
@@ -26,6 +26,7 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from qdrant_client import QdrantClient
+from embedding.checkpoint_store import CheckpointStore
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -35,6 +36,7 @@ class BulkProcessingMonitor:
     
     def __init__(self):
         self.progress_file = Path("/home/azureuser/rag_project/embedding/bulk_progress.json")
+        self.progress_db = Path("/home/azureuser/rag_project/embedding/bulk_progress.db")
         self.log_file = Path("/home/azureuser/rag_project/embedding/logs/bulk_sharepoint_processing.log")
         self.download_dir = Path("/home/azureuser/rag_project/embedding/bulk_downloads")
         self.processed_texts_dir = Path("/home/azureuser/rag_project/embedding/bulk_processed_texts")
@@ -47,6 +49,12 @@ class BulkProcessingMonitor:
     
     def load_progress(self) -> Dict:
         """Load current progress."""
+        if self.progress_db.exists():
+            store = CheckpointStore(self.progress_db)
+            try:
+                return store.summary()
+            finally:
+                store.close()
         if self.progress_file.exists():
             with open(self.progress_file, 'r') as f:
                 return json.load(f)
@@ -262,7 +270,9 @@ class BulkProcessingMonitor:
         if response == 'y':
             if self.progress_file.exists():
                 self.progress_file.unlink()
-                print("✅ Progress file deleted")
+            for path in (self.progress_db, Path(f"{self.progress_db}-wal"), Path(f"{self.progress_db}-shm")):
+                path.unlink(missing_ok=True)
+            print("✅ Progress file deleted")
             
             # Optionally delete collection
             progress = self.load_progress()
@@ -8,7 +8,8 @@ to create a complete vector database for semantic search and RAG integration.
 
 Features:
 - Processes all documents in SharePoint library
-- Batch downloading with retry logic
+- Pipelined download (async), extraction (process pool), embedding (batched threads)
+  and upserts (bulk), each with its own concurrency
 - Progress tracking and resumability
 - Memory-efficient processing
 - Comprehensive error handling
@@ -17,11 +18,15 @@ Features:
 
 Usage:
     python bulk_sharepoint_processor.py --batch-size 100 --max-workers 4
+
+    # Several processes sharing the progress store split the work automatically;
+    # hosts with separate stores take one partition each
+    python bulk_sharepoint_processor.py --partition 0/2   # host A
+    python bulk_sharepoint_processor.py --partition 1/2   # host B
 """
 
 import os
 import sys
-import json
 import time
 import logging
 import asyncio
@@ -29,27 +34,31 @@ import aiohttp
 import aiofiles
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Optional, Set
+from typing import Iterator, List, Dict, Optional, Set, Tuple
 import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import hashlib
+import socket
 
 # Add project root to path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 # Import our existing processors
-from core.sharepoint_integration import get_access_token
-from embedding.download_and_process import DocumentDownloadProcessor
-from embedding.create_embeddings import EmbeddingGenerator
-from msal import ConfidentialClientApplication
+from core.graph_client import GraphClient
+from core.sharepoint_crawler import FolderCrawler, drive_path
+from core.sharepoint_listing import ListingFilter, children_url
+from core.sharepoint_delta import DELETE_COLLECTIONS, DeltaChanges, DeltaSync, delete_item_points
+from embedding.create_embeddings import EmbeddingGenerator, document_id
+from embedding.ingest_pipeline import IngestItem, IngestPipeline, PipelineConfig
+from embedding.checkpoint_store import (
+    CheckpointStore, DOWNLOADED, EMBEDDED, EXTRACTED, FAILED, parse_partition, stable_shard
+)
 from dotenv import load_dotenv
 
 # External libraries
-import requests
 from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
-import uuid
 
 # Load environment variables
 load_dotenv()
@@ -65,11 +74,27 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Work units claimed at a time; small claims keep workers evenly loaded
+CLAIM_SIZE = int(os.getenv("BULK_CLAIM_SIZE", "8"))
+
+def file_version(item: Dict) -> Tuple[Optional[str], Optional[str]]:
+    """(eTag, content hash) of a driveItem for change detection."""
+    hashes = item.get("file", {}).get("hashes", {})
+    content_hash = hashes.get("quickXorHash") or hashes.get("sha256Hash") or hashes.get("sha1Hash")
+    return item.get("eTag"), content_hash
+
+
 class BulkSharePointProcessor:
     """Process all SharePoint documents for embedding generation."""
     
-    def __init__(self):
-        """Initialize the bulk processor."""
+    def __init__(self, partition: Tuple[int, int] = (0, 1), worker_id: Optional[str] = None):
+        """
+        Initialize the bulk processor.
+
+        Args:
+            partition: (k, N) - only process work units whose stable hash falls in slice k of N
+            worker_id: Lease owner name (defaults to host:pid)
+        """
         self.tenant_id = os.getenv("TENANT_ID")
         self.client_id = os.getenv("CLIENT_ID")
         self.client_secret = os.getenv("CLIENT_SECRET")
@@ -80,13 +105,13 @@ class BulkSharePointProcessor:
         self.download_dir = Path("/home/azureuser/rag_project/embedding/bulk_downloads")
         self.processed_texts_dir = Path("/home/azureuser/rag_project/embedding/bulk_processed_texts")
         self.progress_file = Path("/home/azureuser/rag_project/embedding/bulk_progress.json")
+        self.progress_db = Path("/home/azureuser/rag_project/embedding/bulk_progress.db")
         
         # Create directories
         self.download_dir.mkdir(exist_ok=True)
         self.processed_texts_dir.mkdir(exist_ok=True)
         
         # Initialize processors
-        self.doc_processor = DocumentDownloadProcessor()
         self.embedding_generator = EmbeddingGenerator()
         
         # Initialize Qdrant client
@@ -95,66 +120,40 @@ class BulkSharePointProcessor:
             api_key=os.getenv("QDRANT_API_KEY")
         )
         
-        # Progress tracking
-        self.progress = self.load_progress()
+        self.partition = partition
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+
+        # Progress tracking (imports a legacy bulk_progress.json on first run)
+        self.checkpoints = CheckpointStore(self.progress_db, legacy_json=self.progress_file)
         
         # Use existing collection instead of creating new one
-        self.progress["collection_name"] = "complete_project_library"
+        self.collection_name = "complete_project_library"
+        self.checkpoints.set_meta("collection_name", self.collection_name)
         
-        # Get access token
-        self.access_token = self.get_sharepoint_token()
+        # Pooled Graph client; fail fast on bad credentials
+        self.graph = GraphClient(self.tenant_id, self.client_id, self.client_secret)
+        self.get_sharepoint_token()
         
+    @property
+    def access_token(self) -> str:
+        return self.get_sharepoint_token()
+
     def get_sharepoint_token(self) -> str:
-        """Get SharePoint access token."""
+        """Get SharePoint access token (cached and renewed by the Graph client)."""
         try:
-            app = ConfidentialClientApplication(
-                self.client_id,
-                authority=f"https://login.microsoftonline.com/{self.tenant_id}",
-                client_credential=self.client_secret
-            )
-            
-            result = app.acquire_token_for_client(["https://graph.microsoft.com/.default"])
-            
-            if not result or not isinstance(result, dict) or "access_token" not in result:
-                raise Exception(f"Failed to acquire token: {result}")
-                
-            return str(result["access_token"]) if result and "access_token" in result else ""
-            
+            return self.graph.access_token()
         except Exception as e:
             logger.error(f"❌ Failed to get SharePoint token: {e}")
             raise
     
-    def load_progress(self) -> Dict:
-        """Load processing progress from file."""
-        if self.progress_file.exists():
-            with open(self.progress_file, 'r') as f:
-                return json.load(f)
-        return {
-            "processed_items": [],
-            "failed_items": [],
-            "total_files_found": 0,
-            "total_files_processed": 0,
-            "last_batch": 0,
-            "collection_name": "complete_project_library",
-            "start_time": None,
-            "last_update": None
-        }
-    
-    def save_progress(self):
-        """Save processing progress to file."""
-        self.progress["last_update"] = datetime.now().isoformat()
-        with open(self.progress_file, 'w') as f:
-            json.dump(self.progress, f, indent=2)
-    
     def get_all_sharepoint_items(self) -> List[Dict]:
         """Get all items from SharePoint document library using /drive/root/children endpoint."""
         logger.info("🔍 Fetching all SharePoint items (using /drive/root/children)...")
-        headers = {"Authorization": f"Bearer {self.access_token}"}
         all_items = []
-        next_url = f"https://graph.microsoft.com/v1.0/sites/{self.site_id}/drive/root/children?$top=999"
+        next_url = children_url(self.graph.graph_root, f"sites/{self.site_id}/drive", "root")
         while next_url:
             try:
-                response = requests.get(next_url, headers=headers)
+                response = self.graph.get(next_url)
                 response.raise_for_status()
                 data = response.json()
                 items = data.get("value", [])
@@ -169,67 +168,82 @@ class BulkSharePointProcessor:
         logger.info(f"📊 Total SharePoint items found: {len(all_items)}")
         return all_items
     
+    def crawler(self) -> FolderCrawler:
+        return FolderCrawler(self.graph, listing_filter=ListingFilter.from_env())
+
+    def list_files(self, roots: List[Tuple[str, str]]) -> List[Dict]:
+        """Crawl `roots`, warning when some folders could not be listed."""
+        crawler = self.crawler()
+        files = list(crawler.iter_files(roots))
+        if not crawler.complete:
+            logger.warning(f"⚠️ Listing incomplete: {len(crawler.failed_folders)} folders could not be "
+                           f"listed, their files are missing")
+        return files
+
     def get_files_from_item(self, item: Dict) -> List[Dict]:
         """Get all files from a SharePoint item (file or folder from /drive/root/children)."""
-        headers = {"Authorization": f"Bearer {self.access_token}"}
         if "file" in item:
             return [item]
         elif "folder" in item:
-            # Recursively get all files in this folder
-            files = []
-            next_url = f"https://graph.microsoft.com/v1.0/sites/{self.site_id}/drive/items/{item['id']}/children?$top=999"
-            while next_url:
-                try:
-                    response = requests.get(next_url, headers=headers)
-                    response.raise_for_status()
-                    data = response.json()
-                    children = data.get("value", [])
-                    for child in children:
-                        if "file" in child:
-                            files.append(child)
-                        elif "folder" in child:
-                            files.extend(self.get_files_from_item(child))
-                    next_url = data.get("@odata.nextLink")
-                except Exception as e:
-                    logger.error(f"❌ Error walking folder {item.get('name', item.get('id', 'unknown'))}: {e}")
-                    break
-            return files
+            return self.list_files([(f"sites/{self.site_id}/drive", item["id"])])
         else:
             return []
     
     def walk_folder_recursive(self, drive_id: str, folder_id: str, depth: int = 0) -> List[Dict]:
-        """Recursively walk through folders to get all files."""
-        if depth > 10:  # Prevent infinite recursion
-            return []
-        
-        try:
-            headers = {"Authorization": f"Bearer {self.access_token}"}
-            url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{folder_id}/children?$top=999"
-            
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            files = []
-            children = response.json().get("value", [])
-            
-            for child in children:
-                if "file" in child:
-                    files.append(child)
-                elif "folder" in child:
-                    # Recursively get files from subfolder
-                    sub_files = self.walk_folder_recursive(drive_id, child["id"], depth + 1)
-                    files.extend(sub_files)
-            
-            return files
-            
-        except Exception as e:
-            logger.error(f"❌ Error walking folder {folder_id}: {e}")
-            return []
+        """Get all files below a folder (breadth-first, paginated, concurrent)."""
+        return self.list_files([(drive_path(drive_id), folder_id)])
     
-    def process_files_batch(self, files: List[Dict], batch_num: int) -> Dict:
-        """Process a batch of files."""
+    def _ingest_items(self, files: List[Dict], results: Dict) -> Iterator[IngestItem]:
+        """
+        Register files as work units, then claim them from the checkpoint store in ID order.
+
+        Claims are small and made as the pipeline pulls items, so workers sharing the
+        store split the remaining work between them as they go.
+        """
+        by_id = {f["id"]: f for f in files if f.get("id")}
+        changed = self.checkpoints.register(
+            (file_id, info.get("name"), *file_version(info)) for file_id, info in sorted(by_id.items())
+        )
+        logger.info(f"📋 {changed} files new, changed or unfinished since the last run")
+
+        while True:
+            claimed = self.checkpoints.claim(self.worker_id, CLAIM_SIZE, self.partition)
+            if not claimed:
+                return
+            for file_id in claimed:
+                file_info = by_id.get(file_id)
+                if file_info is None:
+                    # Registered by another worker's listing; its lease lapses for them to retry
+                    logger.debug(f"Skipping {file_id}: not in this worker's listing")
+                    continue
+                filename = file_info.get("name", "unknown")
+                download_url = file_info.get("@microsoft.graph.downloadUrl")
+                if not download_url:
+                    logger.warning(f"⚠️ No download URL for {filename}")
+                    results["failed"] += 1
+                    self.checkpoints.mark_failed(file_id, "list", "no download URL", name=filename)
+                    continue
+                etag, content_hash = file_version(file_info)
+                yield IngestItem(item_id=file_id, filename=filename, download_url=download_url,
+                                 extra_payload={"item_id": file_id}, etag=etag, content_hash=content_hash)
+
+    def process_files_batch(self, files: List[Dict], batch_num: int,
+                            log_every: int = 100,
+                            config: Optional[PipelineConfig] = None,
+                            replaced: Optional[Set[str]] = None) -> Dict:
+        """
+        Process files through the staged download/extract/embed/upsert pipeline.
+
+        Args:
+            files: driveItems to process
+            batch_num: Label used in logs and results
+            log_every: Log overall progress after this many completed files
+            config: Per-stage concurrency settings
+            replaced: IDs of files embedded before at another version; their old points
+                are deleted once the new ones are written (a failed re-embed keeps them)
+        """
         logger.info(f"🔄 Processing batch {batch_num} with {len(files)} files...")
-        
+
         batch_results = {
             "batch_num": batch_num,
             "processed": 0,
@@ -237,126 +251,65 @@ class BulkSharePointProcessor:
             "embeddings_created": 0,
             "files": []
         }
-        
-        for file_info in files:
-            try:
-                filename = file_info.get("name", "unknown")
-                file_id = file_info.get("id", "unknown")
-                download_url = file_info.get("@microsoft.graph.downloadUrl")
-                
-                if not download_url:
-                    logger.warning(f"⚠️ No download URL for {filename}")
-                    batch_results["failed"] += 1
-                    continue
-                
-                # Check if already processed
-                if file_id in self.progress["processed_items"]:
-                    logger.info(f"✅ Already processed: {filename}")
-                    continue
-                
-                # Download file
-                local_path = self.download_dir / f"{uuid.uuid4()}_{filename}"
-                
-                try:
-                    response = requests.get(download_url, timeout=60)
-                    response.raise_for_status()
-                    
-                    with open(local_path, 'wb') as f:
-                        f.write(response.content)
-                    
-                    logger.info(f"📥 Downloaded: {filename}")
-                    
-                except Exception as e:
-                    logger.error(f"❌ Download failed for {filename}: {e}")
-                    batch_results["failed"] += 1
-                    continue
-                
-                # Process with OCR and text extraction
-                try:
-                    processed_file = self.doc_processor.process_file(str(local_path))
-
-                    # If processed_file is a list, take the first element if available
-                    if isinstance(processed_file, list) and processed_file:
-                        processed_file_item = processed_file[0]
-                    else:
-                        processed_file_item = processed_file
-
-                    # Check for processed_text in dict
-                    has_text = False
-                    if isinstance(processed_file_item, dict):
-                        has_text = processed_file_item.get("processed_text")
-
-                    if processed_file_item and has_text:
-                        # Create embeddings
-                        embedding_result = self.embedding_generator.create_embedding_for_file(
-                            processed_file_item,
-                            collection_name=self.progress["collection_name"]
-                        )
-
-                        # If embedding_result is a list, take the first element if available
-                        if isinstance(embedding_result, list) and embedding_result:
-                            embedding_result_item = embedding_result[0]
-                        else:
-                            embedding_result_item = embedding_result
-
-                        chunks_created = 0
-                        if isinstance(embedding_result_item, dict):
-                            chunks_created = embedding_result_item.get("chunks_created", 0)
-
-                        if embedding_result_item:
-                            batch_results["embeddings_created"] += 1
-                            batch_results["processed"] += 1
-
-                            # Track progress
-                            self.progress["processed_items"].append(file_id)
-                            self.progress["total_files_processed"] += 1
-
-                            batch_results["files"].append({
-                                "filename": filename,
-                                "file_id": file_id,
-                                "status": "success",
-                                "chunks": chunks_created
-                            })
-
-                            logger.info(f"✅ Processed and embedded: {filename}")
-                        else:
-                            logger.error(f"❌ Embedding creation failed for {filename}")
-                            batch_results["failed"] += 1
-                    else:
-                        logger.error(f"❌ Text extraction failed for {filename}")
-                        batch_results["failed"] += 1
-                
-                except Exception as e:
-                    logger.error(f"❌ Processing failed for {filename}: {e}")
-                    batch_results["failed"] += 1
-                    self.progress["failed_items"].append({
-                        "file_id": file_id,
-                        "filename": filename,
-                        "error": str(e)
-                    })
-                
-                finally:
-                    # Clean up downloaded file
-                    if local_path.exists():
-                        local_path.unlink()
-                        
-            except Exception as e:
-                logger.error(f"❌ Unexpected error in batch processing: {e}")
-                batch_results["failed"] += 1
-        
-        # Save progress after each batch
-        self.progress["last_batch"] = batch_num
-        self.save_progress()
-        
+        replaced = replaced or set()
+        new_doc_ids: Dict[str, str] = {}
+
+        def on_done(item: IngestItem, points: int):
+            batch_results["processed"] += 1
+            batch_results["embeddings_created"] += points
+            batch_results["files"].append({
+                "filename": item.filename,
+                "file_id": item.item_id,
+                "status": "success",
+                "chunks": points
+            })
+            # Committed per file, so a crash loses at most the files still in flight
+            self.checkpoints.mark(item.item_id, EMBEDDED, etag=item.etag, content_hash=item.content_hash)
+            if item.item_id in new_doc_ids:
+                delete_item_points(self.qdrant_client, [item.item_id], [self.collection_name],
+                                   keep_doc_ids=[new_doc_ids.pop(item.item_id)])
+            logger.info(f"✅ Processed and embedded: {item.filename} ({points} chunks)")
+            if batch_results["processed"] % log_every == 0:
+                self.log_overall_progress()
+
+        def on_failed(item: IngestItem, stage: str, error: str):
+            batch_results["failed"] += 1
+            self.checkpoints.mark_failed(item.item_id, stage, error, name=item.filename)
+
+        def on_progress(item: IngestItem, stage: str):
+            if stage == "extracted" and item.item_id in replaced:
+                # The pages are released after encoding, so note the new version's ID now
+                new_doc_ids[item.item_id] = document_id(item.pages, item.extra_payload)
+            self.checkpoints.mark(item.item_id, DOWNLOADED if stage == "downloaded" else EXTRACTED)
+            self.checkpoints.renew(item.item_id, self.worker_id)
+
+        pipeline = IngestPipeline(
+            self.embedding_generator,
+            collection_name=self.collection_name,
+            download_dir=self.download_dir,
+            config=config,
+            on_done=on_done,
+            on_failed=on_failed,
+            on_progress=on_progress
+        )
+        try:
+            stats = pipeline.run(self._ingest_items(files, batch_results))
+        finally:
+            # Hand back anything still leased (interrupted or skipped units) right away
+            self.checkpoints.release(self.worker_id)
+
+        self.checkpoints.set_meta("last_batch", batch_num)
+
         logger.info(f"📊 Batch {batch_num} complete: {batch_results['processed']} processed, "
-                   f"{batch_results['failed']} failed, {batch_results['embeddings_created']} embeddings created")
-        
+                   f"{batch_results['failed']} failed, {batch_results['embeddings_created']} embeddings created "
+                   f"({stats['docs_per_second']} docs/s, {stats['vectors_per_second']} vectors/s)")
+
         return batch_results
-    
+
     def create_vector_collection(self):
         """Create or ensure vector collection exists."""
         try:
-            collection_name = self.progress["collection_name"]
+            collection_name = self.collection_name
             
             # Check if collection exists
             try:
@@ -377,82 +330,141 @@ class BulkSharePointProcessor:
             logger.error(f"❌ Failed to create vector collection: {e}")
             raise
     
-    def process_all_documents(self, batch_size: int = 100, max_workers: int = 4):
-        """Process all SharePoint documents."""
+    def apply_delta(self, changes: DeltaChanges) -> List[Dict]:
+        """
+        Remove deleted files from Qdrant and the checkpoint store. Old points of changed
+        files are dropped by process_files_batch once their new version is written.
+
+        A full resync (no token, or Graph expired it with 410) reports every file but no
+        deletions, so embedded files missing from it are treated as deleted.
+
+        Returns:
+            The changed files to process
+        """
+        deleted = list(changes.deleted)
+        if changes.full_resync:
+            listed = {f["id"] for f in changes.changed}
+            deleted += sorted(self.checkpoints.embedded_ids() - listed - set(deleted))
+        if deleted:
+            collections = list(dict.fromkeys([self.collection_name, *DELETE_COLLECTIONS]))
+            delete_item_points(self.qdrant_client, deleted, collections)
+            self.checkpoints.forget(deleted)
+
+        logger.info(f"🔄 Delta: {len(changes.changed)} changed, {len(deleted)} deleted")
+        return changes.changed
+
+    def process_all_documents(self, batch_size: int = 100, max_workers: int = 4,
+                              incremental: bool = False):
+        """
+        Process all SharePoint documents.
+
+        Args:
+            batch_size: Files completed between progress log lines
+            max_workers: Extraction/OCR worker processes
+            incremental: Only process changes since the last incremental run (drive delta query)
+        """
         logger.info("🚀 Starting bulk SharePoint document processing...")
         
-        if not self.progress["start_time"]:
-            self.progress["start_time"] = datetime.now().isoformat()
+        if not self.checkpoints.get_meta("start_time"):
+            self.checkpoints.set_meta("start_time", datetime.now().isoformat())
         
         # Create vector collection
         self.create_vector_collection()
-        
-        # Get all SharePoint items
-        all_items = self.get_all_sharepoint_items()
-        
-        # Get all files from all items
-        logger.info("📁 Discovering all files in SharePoint library...")
-        all_files = []
-        
-        for i, item in enumerate(all_items):
-            if i % 100 == 0:
-                logger.info(f"🔍 Processed {i}/{len(all_items)} items, found {len(all_files)} files so far...")
-            
-            item_files = self.get_files_from_item(item)
-            all_files.extend(item_files)
-        
-        logger.info(f"📊 Total files discovered: {len(all_files)}")
-        self.progress["total_files_found"] = len(all_files)
-        
+
+        delta, changes = None, None
+        if incremental:
+            delta = DeltaSync(self.site_id, self.access_token, session=self.graph)
+            changes = delta.fetch_changes()
+            all_files = self.apply_delta(changes)
+            if changes.full_resync:
+                self.checkpoints.set_meta("total_files_found", len(all_files))
+        else:
+            all_files = self.discover_all_files()
+
         # Filter out already processed files
+        index, total = self.partition
         remaining_files = [
             f for f in all_files 
-            if f.get("id") not in self.progress["processed_items"]
+            if f.get("id") and stable_shard(f["id"]) % total == index
+            and not self.checkpoints.is_embedded(f["id"], *file_version(f))
         ]
         
-        logger.info(f"📋 Files remaining to process: {len(remaining_files)}")
-        
-        # Process in batches
-        total_batches = (len(remaining_files) + batch_size - 1) // batch_size
-        
-        for batch_num in range(self.progress["last_batch"], total_batches):
-            start_idx = batch_num * batch_size
-            end_idx = min(start_idx + batch_size, len(remaining_files))
-            
-            batch_files = remaining_files[start_idx:end_idx]
-            
-            logger.info(f"🔄 Processing batch {batch_num + 1}/{total_batches}")
-            
-            try:
-                batch_result = self.process_files_batch(batch_files, batch_num + 1)
-                
-                # Log progress
-                processed_count = self.progress["total_files_processed"]
-                total_count = self.progress["total_files_found"]
-                progress_pct = (processed_count / total_count * 100) if total_count > 0 else 0
-                
-                logger.info(f"📈 Overall progress: {processed_count}/{total_count} "
-                           f"({progress_pct:.1f}%) files processed")
-                
-            except Exception as e:
-                logger.error(f"❌ Batch {batch_num + 1} failed: {e}")
-                continue
+        # Embedded before but at another version (full runs and deltas alike)
+        replaced = self.checkpoints.embedded_ids() & {f["id"] for f in remaining_files}
+        logger.info(f"📋 Files remaining to process in partition {index}/{total}: {len(remaining_files)} "
+                    f"({len(replaced)} replacing an older version)")
         
+        # One pipeline over everything left, so stages stay busy instead of draining at
+        # every batch boundary; batch_size only sets how often overall progress is logged
+        config = PipelineConfig(extract_workers=max_workers)
+        try:
+            results = self.process_files_batch(remaining_files, 1, log_every=batch_size, config=config,
+                                               replaced=replaced)
+            # Failed files, and files left to another worker's lease, are not reported by the
+            # next delta again: keep the old token until every change is embedded
+            unfinished = [f for f in remaining_files
+                          if not self.checkpoints.is_embedded(f["id"], *file_version(f))]
+            if delta is not None and changes.delta_link:
+                if unfinished:
+                    logger.warning(f"⚠️ Keeping the delta token: {results['failed']} failed, "
+                                   f"{len(unfinished)} not embedded; they come back next run")
+                else:
+                    delta.save_delta_link(changes.delta_link)
+        except Exception as e:
+            logger.error(f"❌ Bulk pipeline failed: {e}")
+
+        self.log_overall_progress()
+
         # Final summary
         self.print_final_summary()
+
+    def discover_all_files(self) -> List[Dict]:
+        """
+        Enumerate every file in the library with one concurrent crawl from the drive root.
+
+        The list is materialized because work units are claimed in a fixed ID order.
+        """
+        logger.info("📁 Discovering all files in SharePoint library...")
+        all_files = []
+        
+        crawler = self.crawler()
+        for item in crawler.iter_files([(f"sites/{self.site_id}/drive", "root")]):
+            all_files.append(item)
+            if len(all_files) % 1000 == 0:
+                logger.info(f"🔍 Found {len(all_files)} files so far...")
+        
+        logger.info(f"📊 Total files discovered: {len(all_files)}")
+        self.checkpoints.set_meta("total_files_found", len(all_files))
+        # Files under these folders are picked up by the next run that can list them
+        self.checkpoints.set_meta("unlisted_folders", len(crawler.failed_folders))
+        if not crawler.complete:
+            logger.warning(f"⚠️ Listing incomplete: {len(crawler.failed_folders)} folders could not be listed")
+        return all_files
     
+    def log_overall_progress(self):
+        """Log embedded files against files discovered."""
+        processed_count = self.checkpoints.counts()[EMBEDDED]
+        total_count = self.checkpoints.get_meta("total_files_found", 0)
+        progress_pct = (processed_count / total_count * 100) if total_count > 0 else 0
+        logger.info(f"📈 Overall progress: {processed_count}/{total_count} "
+                   f"({progress_pct:.1f}%) files processed")
+
     def print_final_summary(self):
         """Print final processing summary."""
+        counts = self.checkpoints.counts()
+        start = self.checkpoints.get_meta("start_time")
         logger.info("🎉 Bulk SharePoint processing complete!")
         logger.info("=" * 60)
         logger.info(f"📊 FINAL SUMMARY:")
-        logger.info(f"   Total files found: {self.progress['total_files_found']}")
-        logger.info(f"   Files processed: {self.progress['total_files_processed']}")
-        logger.info(f"   Failed files: {len(self.progress['failed_items'])}")
-        logger.info(f"   Collection name: {self.progress['collection_name']}")
+        logger.info(f"   Total files found: {self.checkpoints.get_meta('total_files_found', 0)}")
+        logger.info(f"   Files processed: {counts[EMBEDDED]}")
+        logger.info(f"   Failed files: {counts[FAILED]}")
+        if self.checkpoints.get_meta("unlisted_folders", 0):
+            logger.info(f"   Folders that could not be listed: {self.checkpoints.get_meta('unlisted_folders')}")
+        logger.info(f"   Collection name: {self.collection_name}")
         
-        if self.progress["start_time"]:
-            start_time = datetime.fromisoformat(self.progress["start_time"])
+        if start:
+            start_time = datetime.fromisoformat(start)
             duration = datetime.now() - start_time
             logger.info(f"   Total processing time: {duration}")
         
@@ -460,8 +472,8 @@ class BulkSharePointProcessor:
         
         # Check collection status
         try:
-            collection_info = self.qdrant_client.get_collection(self.progress["collection_name"])
-            logger.info(f"📊 Vector collection '{self.progress['collection_name']}' "
+            collection_info = self.qdrant_client.get_collection(self.collection_name)
+            logger.info(f"📊 Vector collection '{self.collection_name}' "
                        f"contains {collection_info.points_count} embeddings")
         except Exception as e:
             logger.error(f"❌ Could not get collection info: {e}")
@@ -470,16 +482,23 @@ def main():
     """Main entry point."""
     parser = argparse.ArgumentParser(description="Bulk process SharePoint documents for embeddings")
     parser.add_argument("--batch-size", type=int, default=50, 
-                       help="Number of files to process per batch (default: 50)")
+                       help="Files completed between progress log lines (default: 50)")
     parser.add_argument("--max-workers", type=int, default=2,
-                       help="Maximum number of worker threads (default: 2)")
+                       help="Extraction/OCR worker processes (default: 2)")
     parser.add_argument("--resume", action="store_true",
                        help="Resume from last checkpoint")
+    parser.add_argument("--partition", type=parse_partition, default=(0, 1), metavar="K/N",
+                       help="Process only slice K of N of the library, for hosts that do not "
+                            "share a progress store (default: 0/1)")
+    parser.add_argument("--incremental", action="store_true",
+                       help="Only process files added/changed/deleted since the last incremental run")
+    parser.add_argument("--worker-id", default=None,
+                       help="Lease owner name for this process (default: host:pid)")
     
     args = parser.parse_args()
     
     try:
-        processor = BulkSharePointProcessor()
+        processor = BulkSharePointProcessor(partition=args.partition, worker_id=args.worker_id)
         
         if args.resume:
             logger.info("🔄 Resuming from last checkpoint...")
@@ -488,7 +507,8 @@ def main():
         
         processor.process_all_documents(
             batch_size=args.batch_size,
-            max_workers=args.max_workers
+            max_workers=args.max_workers,
+            incremental=args.incremental
         )
         
     except KeyboardInterrupt:
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Bulk Ingestion Checkpoint Store
+SQLite-backed per-file progress for bulk SharePoint processing. Each file keeps its latest
+state (downloaded/extracted/embedded/failed) together with the eTag and content hash it
+was processed at, so membership checks are O(1), every state change is committed on its
+own, and files edited in SharePoint since they were indexed are picked up again.
+Replaces the bulk_progress.json list, which is migrated on first open.
+
+Work is claimed in driveItem-ID order under short leases, so several processes sharing
+one store steal work from each other without overlap, and a crashed worker's files are
+reclaimed once its lease expires. `--partition k/N` additionally splits the ID space by
+a stable hash for hosts that do not share a store.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = Path(__file__).parent / "bulk_progress.db"
+LEASE_SECONDS = float(os.getenv("BULK_LEASE_SECONDS", "1800"))
+MAX_ATTEMPTS = int(os.getenv("BULK_MAX_ATTEMPTS", "3"))
+
+# File states, in pipeline order
+PENDING = "pending"
+DOWNLOADED = "downloaded"
+EXTRACTED = "extracted"
+EMBEDDED = "embedded"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    item_id TEXT PRIMARY KEY,
+    name TEXT,
+    etag TEXT,
+    content_hash TEXT,
+    state TEXT NOT NULL,
+    stage TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    shard INTEGER,
+    lease_owner TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS idx_files_state ON files (state);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# SQL twin of is_embedded()'s version check, for an upsert's old row vs `excluded`
+_CHANGED = (
+    "(CASE WHEN excluded.content_hash IS NOT NULL AND content_hash IS NOT NULL "
+    "THEN excluded.content_hash != content_hash "
+    "WHEN excluded.etag IS NOT NULL AND etag IS NOT NULL THEN excluded.etag != etag ELSE 0 END)"
+)
+
+# Columns added after the first release of the store
+_ADDED_COLUMNS = {"shard": "INTEGER", "lease_owner": "TEXT", "lease_expires": "REAL"}
+
+
+def stable_shard(item_id: str) -> int:
+    """Process-independent 32-bit hash of a work-unit ID (unlike hash(), not salted)."""
+    return int.from_bytes(hashlib.sha1(item_id.encode("utf-8")).digest()[:4], "big")
+
+
+def parse_partition(spec: str) -> Tuple[int, int]:
+    """Parse "k/N" into (k, N) with 0 <= k < N."""
+    try:
+        index, total = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Partition must look like k/N, got {spec!r}")
+    if total < 1 or not 0 <= index < total:
+        raise ValueError(f"Partition index must be in [0, {total}), got {spec!r}")
+    return index, total
+
+
+class CheckpointStore:
+    """Per-file bulk processing state with O(1) "already embedded?" checks."""
+
+    def __init__(self, db_path: Optional[str] = None, legacy_json: Optional[str] = None):
+        """
+        Args:
+            db_path: SQLite database path (env BULK_PROGRESS_DB)
+            legacy_json: Old bulk_progress.json to import if it exists and the store is new
+        """
+        self.db_path = Path(db_path or os.getenv("BULK_PROGRESS_DB", str(DEFAULT_DB_PATH)))
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30,
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across process crashes in WAL mode; only power loss can drop
+        # the last commits, and re-embedding a file is idempotent
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        for column, kind in _ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE files ADD COLUMN {column} {kind}")
+
+        if legacy_json and Path(legacy_json).exists():
+            self.migrate_json(legacy_json)
+
+        # item_id -> (etag, content_hash) of embedded files
+        self._embedded: Dict[str, Tuple[Optional[str], Optional[str]]] = {
+            item_id: (etag, content_hash) for item_id, etag, content_hash in self._conn.execute(
+                "SELECT item_id, etag, content_hash FROM files WHERE state = ?", (EMBEDDED,)
+            )
+        }
+
+    def close(self):
+        self._conn.close()
+
+    # ------------------------------------------------------------------ membership
+
+    def is_embedded(self, item_id: str, etag: Optional[str] = None,
+                    content_hash: Optional[str] = None) -> bool:
+        """
+        True if the file was embedded and has not changed since.
+
+        A matching content hash wins over the eTag (metadata-only edits change the eTag
+        but not the bytes); without either, any embedded record counts.
+        """
+        record = self._embedded.get(item_id)
+        if record is None:
+            return False
+        old_etag, old_hash = record
+        if content_hash and old_hash:
+            return content_hash == old_hash
+        if etag and old_etag:
+            return etag == old_etag
+        return True
+
+    def embedded_ids(self) -> Set[str]:
+        return set(self._embedded)
+
+    # ------------------------------------------------------------------ updates
+
+    def mark(self, item_id: str, state: str, name: Optional[str] = None,
+             etag: Optional[str] = None, content_hash: Optional[str] = None,
+             stage: Optional[str] = None, error: Optional[str] = None):
+        """Record a file's new state in its own transaction. Unset fields keep their values."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO files (item_id, name, etag, content_hash, state, stage, error, attempts, "
+                "updated_at, shard) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(item_id) DO UPDATE SET "
+                "name = COALESCE(excluded.name, name), "
+                "etag = COALESCE(excluded.etag, etag), "
+                "content_hash = COALESCE(excluded.content_hash, content_hash), "
+                "state = excluded.state, stage = excluded.stage, error = excluded.error, "
+                "attempts = attempts + excluded.attempts, updated_at = excluded.updated_at, "
+                "lease_owner = CASE WHEN excluded.state IN (?, ?) THEN NULL ELSE lease_owner END, "
+                "lease_expires = CASE WHEN excluded.state IN (?, ?) THEN NULL ELSE lease_expires END",
+                (item_id, name, etag, content_hash, state, stage, error,
+                 1 if state == FAILED else 0, now, stable_shard(item_id), EMBEDDED, FAILED, EMBEDDED, FAILED)
+            )
+            if state == EMBEDDED:
+                row = self._conn.execute(
+                    "SELECT etag, content_hash FROM files WHERE item_id = ?", (item_id,)
+                ).fetchone()
+                self._embedded[item_id] = (row[0], row[1])
+            else:
+                self._embedded.pop(item_id, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_update', ?)",
+                (json.dumps(now),)
+            )
+
+    def mark_failed(self, item_id: str, stage: str, error: str, name: Optional[str] = None):
+        self.mark(item_id, FAILED, name=name, stage=stage, error=error)
+
+    # ------------------------------------------------------------------ work claiming
+
+    def register(self, units: Iterable[Tuple[str, Optional[str], Optional[str], Optional[str]]]) -> int:
+        """
+        Record discovered work units, resetting embedded ones whose content changed.
+
+        Args:
+            units: (item_id, name, etag, content_hash) tuples
+
+        Returns:
+            Number of units that are new or changed
+        """
+        rows = []
+        for item_id, name, etag, content_hash in units:
+            if self.is_embedded(item_id, etag, content_hash):
+                continue
+            rows.append((item_id, name, etag, content_hash, PENDING, time.time(), stable_shard(item_id)))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                # Unfinished rows keep their state and attempts; embedded rows go back to pending
+                # only if their content changed (another worker may have just embedded them)
+                self._conn.executemany(
+                    "INSERT INTO files (item_id, name, etag, content_hash, state, updated_at, shard) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(item_id) DO UPDATE SET "
+                    "name = excluded.name, etag = excluded.etag, content_hash = excluded.content_hash, "
+                    "shard = excluded.shard, "
+                    f"state = CASE WHEN state = '{EMBEDDED}' AND {_CHANGED} THEN excluded.state ELSE state END, "
+                    f"attempts = CASE WHEN state = '{EMBEDDED}' AND {_CHANGED} THEN 0 ELSE attempts END",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            for row in rows:
+                self._embedded.pop(row[0], None)
+        return len(rows)
+
+    def claim(self, owner: str, limit: int, partition: Tuple[int, int] = (0, 1),
+              lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS) -> List[str]:
+        """
+        Lease the next unfinished work units, in ID order, to `owner`.
+
+        Units already leased by a live owner, embedded, or failed `max_attempts` times are
+        skipped. Leases end when the unit is marked embedded/failed or when they expire.
+
+        Returns:
+            Claimed item IDs (empty when this partition has no work left)
+        """
+        index, total = partition
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [row[0] for row in self._conn.execute(
+                    "SELECT item_id FROM files "
+                    "WHERE state != ? AND NOT (state = ? AND attempts >= ?) "
+                    "AND (lease_expires IS NULL OR lease_expires < ?) "
+                    "AND shard IS NOT NULL AND shard % ? = ? "
+                    "ORDER BY item_id LIMIT ?",
+                    (EMBEDDED, FAILED, max_attempts, now, total, index, limit)
+                )]
+                self._conn.executemany(
+                    "UPDATE files SET lease_owner = ?, lease_expires = ? WHERE item_id = ?",
+                    [(owner, now + lease_seconds, item_id) for item_id in ids]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def renew(self, item_id: str, owner: str, lease_seconds: float = LEASE_SECONDS):
+        """Extend a lease still held by `owner` (e.g. as a unit clears a stage)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE files SET lease_expires = ? WHERE item_id = ? AND lease_owner = ?",
+                (time.time() + lease_seconds, item_id, owner)
+            )
+
+    def release(self, owner: str) -> int:
+        """Drop every lease held by `owner` so other workers can take the units now."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE files SET lease_owner = NULL, lease_expires = NULL WHERE lease_owner = ?", (owner,)
+            )
+        return cur.rowcount
+
+    def forget(self, item_ids: Iterable[str]):
+        """Drop files from the store (e.g. deleted in SharePoint)."""
+        ids = list(item_ids)
+        with self._lock:
+            self._conn.executemany("DELETE FROM files WHERE item_id = ?", [(i,) for i in ids])
+            for item_id in ids:
+                self._embedded.pop(item_id, None)
+
+    # ------------------------------------------------------------------ metadata
+
+    def get_meta(self, key: str, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key: str, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                               (key, json.dumps(value)))
+
+    # ------------------------------------------------------------------ reporting
+
+    def counts(self) -> Dict[str, int]:
+        """Number of files in each state."""
+        with self._lock:
+            rows = dict(self._conn.execute("SELECT state, COUNT(*) FROM files GROUP BY state").fetchall())
+        return {state: rows.get(state, 0) for state in (PENDING, DOWNLOADED, EXTRACTED, EMBEDDED, FAILED)}
+
+    def failed_items(self, limit: Optional[int] = None) -> List[Dict]:
+        query = "SELECT item_id, name, stage, error, attempts FROM files WHERE state = ? ORDER BY updated_at"
+        params: Tuple = (FAILED,)
+        if limit is not None:
+            query += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [{"file_id": item_id, "filename": name, "stage": stage, "error": error, "attempts": attempts}
+                for item_id, name, stage, error, attempts in rows]
+
+    def summary(self) -> Dict:
+        """Progress in the shape of the legacy bulk_progress.json (for the monitor)."""
+        counts = self.counts()
+        last_update = self.get_meta("last_update")
+        return {
+            "total_files_found": self.get_meta("total_files_found", 0),
+            "total_files_processed": counts[EMBEDDED],
+            "failed_items": self.failed_items(),
+            "states": counts,
+            "collection_name": self.get_meta("collection_name", "complete_project_library"),
+            "start_time": self.get_meta("start_time"),
+            "last_update": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(last_update)) if last_update else None,
+            "last_batch": self.get_meta("last_batch", 0)
+        }
+
+    # ------------------------------------------------------------------ migration
+
+    def migrate_json(self, json_path: str) -> int:
+        """
+        Import a legacy bulk_progress.json and rename it to *.migrated.
+
+        Returns:
+            Number of file records imported
+        """
+        json_path = Path(json_path)
+        with open(json_path, "r") as f:
+            progress = json.load(f)
+
+        now = time.time()
+        rows = [(item_id, None, None, None, EMBEDDED, None, None, 0, now, stable_shard(item_id))
+                for item_id in dict.fromkeys(progress.get("processed_items", []))]
+        for failed in progress.get("failed_items", []):
+            if not failed.get("file_id"):
+                continue
+            rows.append((failed.get("file_id"), failed.get("filename"), None, None, FAILED,
+                         failed.get("stage"), failed.get("error"), 1, now, stable_shard(failed.get("file_id"))))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                # Existing records are newer than anything in the JSON file
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO files (item_id, name, etag, content_hash, state, stage, error, "
+                    "attempts, updated_at, shard) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                for key in ("total_files_found", "collection_name", "start_time", "last_batch"):
+                    if progress.get(key) is not None:
+                        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)",
+                                           (key, json.dumps(progress[key])))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        json_path.rename(json_path.with_suffix(json_path.suffix + ".migrated"))
+        logger.info(f"📦 Migrated {len(rows)} file records from {json_path.name}")
+        return len(rows)
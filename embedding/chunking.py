@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Structure-aware Document Chunking
+Splits page text into retrieval chunks along paragraph and sentence boundaries with a
+token-length target and overlap, yielding chunks lazily. Chunks are encoded in large
+batches and upserted in bulk; each point carries the document ID and page/character
+offsets instead of the chunk text, so retrieval rebuilds context from the extracted pages.
+"""
+
+import logging
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces; leave headroom for sub-word splits
+DEFAULT_TARGET_TOKENS = int(os.getenv("CHUNK_TARGET_TOKENS", "200"))
+DEFAULT_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+ENCODE_BATCH_SIZE = int(os.getenv("EMBED_ENCODE_BATCH", "256"))
+UPSERT_BATCH_SIZE = int(os.getenv("EMBED_UPSERT_BATCH", "1024"))
+
+# Namespace for deterministic chunk point IDs
+CHUNK_NAMESPACE = uuid.UUID("6f1c3f5e-2a4b-5d8e-9c70-1b2e3d4f5a6b")
+
+_PARAGRAPH_RE = re.compile(r"\S(?:.*?\S)?(?=\s*\n\s*\n|\s*\Z)", re.DOTALL)
+_SENTENCE_RE = re.compile(r"\S.*?(?:[.!?;:](?=\s)|\Z)", re.DOTALL)
+_WORD_RE = re.compile(r"\S+")
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def approx_token_count(text: str) -> int:
+    """Rough word-piece count: words plus punctuation marks."""
+    return len(_TOKEN_RE.findall(text))
+
+
+@dataclass
+class Chunk:
+    """A retrieval chunk and where it came from."""
+    doc_id: str
+    index: int
+    text: str
+    page_start: int
+    char_start: int
+    page_end: int
+    char_end: int
+    token_count: int
+
+    def payload(self) -> Dict:
+        """Qdrant payload: document ID and offsets, no text."""
+        return {
+            "doc_id": self.doc_id,
+            "chunk_index": self.index,
+            "page_start": self.page_start,
+            "char_start": self.char_start,
+            "page_end": self.page_end,
+            "char_end": self.char_end,
+            "token_count": self.token_count,
+        }
+
+    @property
+    def point_id(self) -> str:
+        """Deterministic point ID, so re-indexing a document overwrites its points."""
+        return str(uuid.uuid5(CHUNK_NAMESPACE, f"{self.doc_id}:{self.index}"))
+
+
+# A unit is the smallest span the chunker places: (page, start, end, tokens)
+_Unit = Tuple[int, int, int, int]
+
+
+def _split_span(text: str, start: int, end: int, pattern: re.Pattern) -> List[Tuple[int, int]]:
+    return [(start + m.start(), start + m.end()) for m in pattern.finditer(text[start:end])]
+
+
+def _page_units(page_num: int, text: str, target_tokens: int, window_tokens: int,
+                count_tokens: Callable[[str], int]) -> Iterator[_Unit]:
+    """Paragraphs of a page, split into sentences and then word windows when too long."""
+    for para in _PARAGRAPH_RE.finditer(text):
+        spans = [(para.start(), para.end())]
+        if count_tokens(para.group()) > target_tokens:
+            spans = _split_span(text, para.start(), para.end(), _SENTENCE_RE)
+
+        for start, end in spans:
+            tokens = count_tokens(text[start:end])
+            if tokens <= target_tokens:
+                yield page_num, start, end, tokens
+                continue
+            # A single run-on sentence (common in OCR output): fall back to word windows
+            window = []
+            size = 0
+            for word_start, word_end in _split_span(text, start, end, _WORD_RE):
+                word_tokens = count_tokens(text[word_start:word_end])
+                if window and size + word_tokens > window_tokens:
+                    yield page_num, window[0][0], window[-1][1], size
+                    window, size = [], 0
+                window.append((word_start, word_end))
+                size += word_tokens
+            if window:
+                yield page_num, window[0][0], window[-1][1], size
+
+
+def chunk_pages(pages: Iterable[str], doc_id: str,
+                target_tokens: int = DEFAULT_TARGET_TOKENS,
+                overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+                count_tokens: Callable[[str], int] = approx_token_count) -> Iterator[Chunk]:
+    """
+    Lazily split a document's pages into chunks.
+
+    Chunks are built from whole paragraphs where possible (sentences, then word windows,
+    for oversized paragraphs), end at a page break once they are at least half the target,
+    and repeat up to `overlap_tokens` of trailing units from the previous chunk.
+
+    Args:
+        pages: Page texts in order (any iterable, e.g. extract_all.iter_pages)
+        doc_id: Document identifier stored with every chunk
+        target_tokens: Approximate chunk length
+        overlap_tokens: Approximate overlap between consecutive chunks
+        count_tokens: Token counter (defaults to a word-piece approximation)
+
+    Yields:
+        Chunk objects in document order
+    """
+    # Run-on text is cut into overlap-sized word windows so overlap survives chunk breaks
+    window_tokens = overlap_tokens if 0 < overlap_tokens < target_tokens else target_tokens
+    page_texts: Dict[int, str] = {}
+    current: List[_Unit] = []
+    current_tokens = 0
+    fresh = False  # current holds units not yet emitted in any chunk
+    index = 0
+
+    def emit() -> Chunk:
+        nonlocal index
+        # The chunk text is exactly the source span(s), so slice_pages() can rebuild it
+        spans: Dict[int, List[int]] = {}
+        for page_num, start, end, _ in current:
+            span = spans.setdefault(page_num, [start, end])
+            span[1] = end
+        text = "\n\n".join(page_texts[p][start:end] for p, (start, end) in spans.items())
+        first, last = current[0], current[-1]
+        chunk = Chunk(doc_id, index, text, first[0], first[1], last[0], last[2], current_tokens)
+        index += 1
+        return chunk
+
+    def carry_overlap():
+        nonlocal current, current_tokens, fresh
+        fresh = False
+        kept, kept_tokens = [], 0
+        for unit in reversed(current):
+            if kept_tokens + unit[3] > overlap_tokens:
+                break
+            kept.insert(0, unit)
+            kept_tokens += unit[3]
+        current, current_tokens = kept, kept_tokens
+
+    for page_num, text in enumerate(pages):
+        if not text:
+            continue
+        page_texts[page_num] = text
+
+        # Prefer page boundaries as chunk boundaries when the chunk is already substantial
+        if fresh and current_tokens >= target_tokens // 2:
+            yield emit()
+            carry_overlap()
+
+        units = _page_units(page_num, text, target_tokens, window_tokens, count_tokens)
+        for unit in units:
+            if fresh and current_tokens + unit[3] > target_tokens:
+                yield emit()
+                carry_overlap()
+                # Drop overlap that would push the next chunk past the target
+                while current and current_tokens + unit[3] > target_tokens:
+                    current_tokens -= current.pop(0)[3]
+            current.append(unit)
+            current_tokens += unit[3]
+            fresh = True
+
+        # Pages no longer referenced by pending units can be released
+        live = {unit[0] for unit in current}
+        for old in [p for p in page_texts if p not in live]:
+            del page_texts[old]
+
+    if fresh:
+        yield emit()
+
+
+def slice_pages(pages: Sequence[str], payload: Dict) -> str:
+    """Rebuild a chunk's source span from its document pages and payload offsets."""
+    page_start, page_end = payload["page_start"], payload["page_end"]
+    if page_start == page_end:
+        return pages[page_start][payload["char_start"]:payload["char_end"]]
+    parts = [pages[page_start][payload["char_start"]:]]
+    parts.extend(pages[page_start + 1:page_end])
+    parts.append(pages[page_end][:payload["char_end"]])
+    return "\n\n".join(part.strip() for part in parts if part.strip())
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def to_point(chunk: Chunk, vector, extra_payload: Optional[Dict] = None):
+    """Build the Qdrant point for an encoded chunk."""
+    from qdrant_client.models import PointStruct
+
+    payload = chunk.payload()
+    if extra_payload:
+        payload.update(extra_payload)
+    vector = vector.tolist() if hasattr(vector, "tolist") else list(vector)
+    return PointStruct(id=chunk.point_id, vector=vector, payload=payload)
+
+
+def iter_points(chunks: Iterable[Chunk], encode_fn: Callable[[List[str]], Sequence],
+                extra_payload: Optional[Dict] = None,
+                encode_batch_size: int = ENCODE_BATCH_SIZE) -> Iterator:
+    """
+    Lazily encode chunks in batches and yield Qdrant points.
+
+    Args:
+        chunks: Chunks to encode (consumed lazily)
+        encode_fn: Encodes a list of texts into vectors (e.g. SentenceTransformer.encode)
+        extra_payload: Fields added to every point (filename, item_id, ...)
+        encode_batch_size: Texts per encode call
+    """
+    for batch in batched(chunks, encode_batch_size):
+        vectors = encode_fn([chunk.text for chunk in batch])
+        for chunk, vector in zip(batch, vectors):
+            yield to_point(chunk, vector, extra_payload)
+
+
+def index_chunks(chunks: Iterable[Chunk], encode_fn: Callable[[List[str]], Sequence],
+                 upsert_fn: Callable[[List], None], extra_payload: Optional[Dict] = None,
+                 encode_batch_size: int = ENCODE_BATCH_SIZE,
+                 upsert_batch_size: int = UPSERT_BATCH_SIZE) -> int:
+    """
+    Encode chunks in large batches and upsert the resulting points in bulk.
+
+    Args:
+        chunks: Chunks to index (consumed lazily)
+        encode_fn: Encodes a list of texts into vectors
+        upsert_fn: Receives lists of PointStruct of up to `upsert_batch_size`
+        extra_payload: Fields added to every point (filename, item_id, ...)
+        encode_batch_size: Texts per encode call
+        upsert_batch_size: Points per upsert call
+
+    Returns:
+        Number of points upserted
+    """
+    total = 0
+    points = iter_points(chunks, encode_fn, extra_payload, encode_batch_size)
+    for batch in batched(points, upsert_batch_size):
+        upsert_fn(batch)
+        total += len(batch)
+    return total
@@ -1,40 +1,417 @@
-# Minimal stub for EmbeddingGenerator and test_embedding_search
+#!/usr/bin/env python3
+"""
+Embedding Generation for Processed Documents
+Streams processed text files through the structure-aware chunker, encodes chunks in large
+batches and uploads them to Qdrant in bulk (wait=False, parallel upload). Point IDs are
+derived from the document content hash (scoped to the SharePoint item when there is one),
+so re-running a file overwrites its points.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, FieldCondition, Filter, MatchValue, PayloadSchemaType, VectorParams
+from sentence_transformers import SentenceTransformer
+
+from embedding.chunking import (
+    DEFAULT_OVERLAP_TOKENS, DEFAULT_TARGET_TOKENS, ENCODE_BATCH_SIZE, UPSERT_BATCH_SIZE,
+    batched, chunk_pages, iter_points, to_point
+)
+
+logger = logging.getLogger(__name__)
+
+# Processed text files written by the OCR step start with this header
+HEADER_SEPARATOR = "=" * 50
+_PAGE_MARKER_RE = re.compile(r"^\[Page (\d+)\]\s*$")
+
+
+def iter_text_file_pages(file_path: Union[str, Path]) -> Tuple[Dict, Iterator[str]]:
+    """
+    Read a processed text file lazily.
+
+    Returns:
+        (header_fields, page_iterator); pages are split on "[Page n]" markers when present
+    """
+    fh = open(file_path, "r", encoding="utf-8", errors="replace")
+    header = {}
+    first_lines = []
+    for line in fh:
+        first_lines.append(line)
+        if line.strip() == HEADER_SEPARATOR:
+            for header_line in first_lines[:-1]:
+                key, _, value = header_line.partition(":")
+                if value:
+                    header[key.strip().lower()] = value.strip()
+            first_lines = []
+            break
+        if len(first_lines) > 5:
+            break  # no header
+
+    def pages() -> Iterator[str]:
+        try:
+            current = list(first_lines)
+            for line in fh:
+                if _PAGE_MARKER_RE.match(line):
+                    if "".join(current).strip():
+                        yield "".join(current)
+                    current = []
+                    continue
+                current.append(line)
+            if "".join(current).strip():
+                yield "".join(current)
+        finally:
+            fh.close()
+
+    return header, pages()
+
+
+def content_hash(text_or_pages: Union[str, Iterable[str]]) -> str:
+    """SHA-256 of document text, used as the document ID."""
+    digest = hashlib.sha256()
+    if isinstance(text_or_pages, str):
+        text_or_pages = [text_or_pages]
+    for page in text_or_pages:
+        digest.update(page.encode("utf-8"))
+        digest.update(b"\f")
+    return digest.hexdigest()
+
+
+def document_id(pages: List[str], extra_payload: Optional[Dict] = None) -> str:
+    """
+    Document ID for point IDs and dedupe: the content hash, scoped to the SharePoint
+    item when the payload names one. Identical files under two driveItems each get
+    points carrying their own item_id, so deleting one item leaves the other indexed.
+    """
+    digest = content_hash(pages)
+    item_id = (extra_payload or {}).get("item_id")
+    if not item_id:
+        return digest
+    return hashlib.sha256(f"{digest}:{item_id}".encode("utf-8")).hexdigest()
 
-class DummyQdrantClient:
-    def search(self, collection_name, query_vector, limit=3):
-        class DummyResult:
-            def __init__(self, i):
-                self.payload = {'filename': f'dummy_file_{i}.txt'}
-                self.score = 1.0 - 0.1 * i
-        return [DummyResult(i) for i in range(limit)]
 
 class EmbeddingGenerator:
-    def __init__(self, *args, **kwargs):
-        self.qdrant_client = DummyQdrantClient()
-        self.embedding_model = None
+    """Chunks, encodes and bulk-uploads documents into a Qdrant collection."""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2",
+                 collection_name: str = "processed_documents",
+                 encode_batch_size: Optional[int] = None,
+                 upsert_batch_size: Optional[int] = None,
+                 upload_parallel: Optional[int] = None,
+                 target_tokens: int = DEFAULT_TARGET_TOKENS,
+                 overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+        self.model_name = model_name
+        self.collection_name = collection_name
+        self.encode_batch_size = encode_batch_size or ENCODE_BATCH_SIZE
+        self.upsert_batch_size = upsert_batch_size or UPSERT_BATCH_SIZE
+        self.upload_parallel = upload_parallel or int(os.getenv("EMBED_UPLOAD_PARALLEL", "2"))
+        self.target_tokens = target_tokens
+        self.overlap_tokens = overlap_tokens
+
+        logger.info(f"Loading embedding model {model_name}...")
+        self.embedding_model = SentenceTransformer(model_name)
+        self.vector_size = self.embedding_model.get_sentence_embedding_dimension()
+
+        self.qdrant_client = QdrantClient(
+            url=os.getenv("QDRANT_URL", "http://localhost:6333"),
+            api_key=os.getenv("QDRANT_API_KEY")
+        )
+        self._ready_collections = set()
+        self.ensure_collection(collection_name)
+        # Documents queued in this run; their points may not be visible in Qdrant yet
+        self._seen_docs = set()
+
+        self._stats = {"start_time": time.time(), "documents": 0, "vectors": 0,
+                       "skipped_duplicates": 0, "encode_seconds": 0.0}
+
+    def ensure_collection(self, collection_name: str):
+        """Create the collection (and its doc_id payload index) if missing."""
+        if collection_name in self._ready_collections:
+            return
+        if not self.qdrant_client.collection_exists(collection_name):
+            self.qdrant_client.create_collection(
+                collection_name=collection_name,
+                vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE)
+            )
+            logger.info(f"✅ Created collection {collection_name}")
+        self.qdrant_client.create_payload_index(collection_name, "doc_id", PayloadSchemaType.KEYWORD)
+        self._ready_collections.add(collection_name)
+
+    def encode(self, texts: List[str]):
+        """Encode texts in one batched model call."""
+        started = time.time()
+        vectors = self.embedding_model.encode(
+            texts, batch_size=min(len(texts), 64) or 1, convert_to_numpy=True, show_progress_bar=False
+        )
+        self._stats["encode_seconds"] += time.time() - started
+        return vectors
+
+    def is_indexed(self, doc_id: str, collection_name: Optional[str] = None) -> bool:
+        """Whether points for this content hash already exist."""
+        if (collection_name or self.collection_name, doc_id) in self._seen_docs:
+            return True
+        points, _ = self.qdrant_client.scroll(
+            collection_name=collection_name or self.collection_name,
+            scroll_filter=Filter(must=[FieldCondition(key="doc_id", match=MatchValue(value=doc_id))]),
+            limit=1, with_payload=False, with_vectors=False
+        )
+        return bool(points)
+
+    def _document_points(self, pages: List[str], filename: str, collection: str,
+                         extra_payload: Optional[Dict], skip_existing: bool,
+                         point_ids: List[str]) -> Iterator:
+        """Points for one document; IDs are appended to `point_ids` as they are produced."""
+        doc_id = document_id(pages, extra_payload)
+        if skip_existing and self.is_indexed(doc_id, collection):
+            self._stats["skipped_duplicates"] += 1
+            logger.info(f"⏭️ {filename} already indexed ({doc_id[:12]})")
+            return
+
+        self._seen_docs.add((collection, doc_id))
+        payload = {"filename": filename}
+        payload.update(extra_payload or {})
+        chunks = chunk_pages(pages, doc_id, self.target_tokens, self.overlap_tokens)
+        for point in iter_points(chunks, self.encode, payload, self.encode_batch_size):
+            point_ids.append(point.id)
+            yield point
+
+        self._stats["documents"] += 1
+        self._stats["vectors"] += len(point_ids)
+
+    def points_for_documents(self, documents: List[Tuple[List[str], str, Optional[Dict]]],
+                             collection_name: Optional[str] = None,
+                             skip_existing: bool = True) -> List[List]:
+        """
+        Chunk several documents and encode their chunks together, so small documents
+        still fill encode batches. Used by the bulk ingestion pipeline.
+
+        Args:
+            documents: List of (pages, filename, extra_payload)
+
+        Returns:
+            Points per document, in input order (empty for already-indexed content)
+        """
+        collection = collection_name or self.collection_name
+        self.ensure_collection(collection)
+        results: List[List] = [[] for _ in documents]
+        pending = []
+        for position, (pages, filename, extra_payload) in enumerate(documents):
+            doc_id = document_id(pages, extra_payload)
+            if skip_existing and self.is_indexed(doc_id, collection):
+                self._stats["skipped_duplicates"] += 1
+                continue
+            self._seen_docs.add((collection, doc_id))
+            payload = {"filename": filename}
+            payload.update(extra_payload or {})
+            for chunk in chunk_pages(pages, doc_id, self.target_tokens, self.overlap_tokens):
+                pending.append((position, chunk, payload))
+
+        for batch in batched(pending, self.encode_batch_size):
+            vectors = self.encode([chunk.text for _, chunk, _ in batch])
+            for (position, chunk, payload), vector in zip(batch, vectors):
+                results[position].append(to_point(chunk, vector, payload))
+
+        self._stats["documents"] += sum(1 for points in results if points)
+        self._stats["vectors"] += len(pending)
+        return results
+
+    def _upload(self, collection: str, points: Iterable, parallel: int):
+        # wait=False returns once Qdrant has accepted a batch; with parallel > 1 upload
+        # workers send batches while the next ones are being encoded
+        self.qdrant_client.upload_points(
+            collection_name=collection,
+            points=points,
+            batch_size=self.upsert_batch_size,
+            parallel=parallel,
+            wait=False
+        )
+
+    def index_pages(self, pages: List[str], filename: str, collection_name: Optional[str] = None,
+                    extra_payload: Optional[Dict] = None, skip_existing: bool = True) -> List[str]:
+        """
+        Chunk, encode and upload one document.
+
+        Args:
+            pages: Page texts of the document
+            filename: Source filename stored in the payload
+            collection_name: Target collection (defaults to the generator's)
+            extra_payload: Additional payload fields (e.g. SharePoint item_id)
+            skip_existing: Skip documents already indexed (same content and item_id)
+
+        Returns:
+            Point IDs written (empty when skipped)
+        """
+        collection = collection_name or self.collection_name
+        self.ensure_collection(collection)
+        point_ids = []
+        # A single document is uploaded in-process; spinning up upload workers costs more
+        self._upload(collection, self._document_points(pages, filename, collection, extra_payload,
+                                                       skip_existing, point_ids), parallel=1)
+        return point_ids
+
+    def index_documents(self, documents: Iterable[Tuple[List[str], str, Optional[Dict]]],
+                        collection_name: Optional[str] = None, skip_existing: bool = True) -> Dict:
+        """
+        Index many documents through one parallel bulk upload.
+
+        Args:
+            documents: Iterable of (pages, filename, extra_payload)
+
+        Returns:
+            {"successful_files", "failed_files", "total_embeddings", "errors"}
+        """
+        collection = collection_name or self.collection_name
+        self.ensure_collection(collection)
+        summary = {"successful_files": 0, "failed_files": 0, "total_embeddings": 0, "errors": []}
+
+        def all_points():
+            for pages, filename, extra_payload in documents:
+                point_ids = []
+                try:
+                    yield from self._document_points(pages, filename, collection, extra_payload,
+                                                     skip_existing, point_ids)
+                except Exception as e:
+                    logger.error(f"❌ Failed to embed {filename}: {e}")
+                    summary["failed_files"] += 1
+                    summary["errors"].append({"file": filename, "error": str(e)})
+                    continue
+                summary["successful_files"] += 1
+                summary["total_embeddings"] += len(point_ids)
+
+        self._upload(collection, all_points(), parallel=self.upload_parallel)
+        return summary
+
+    def process_text_file(self, file_path: Union[str, Path], collection_name: Optional[str] = None,
+                          extra_payload: Optional[Dict] = None) -> List[str]:
+        """Index a processed text file; returns the point IDs written."""
+        header, pages = iter_text_file_pages(file_path)
+        filename = header.get("document") or Path(file_path).name
+        return self.index_pages(list(pages), filename, collection_name, extra_payload)
+
+    def create_embedding_for_file(self, processed_file: Dict, collection_name: Optional[str] = None) -> Dict:
+        """
+        Index a processed file record (as produced by DocumentDownloadProcessor).
+
+        Returns:
+            {"filename", "doc_id", "chunks_created"}
+        """
+        text = processed_file.get("processed_text") or ""
+        filename = processed_file.get("filename") or processed_file.get("original_file", "unknown")
+        pages = processed_file.get("pages") or [text]
+        extra = {key: processed_file[key] for key in ("item_id", "file_id") if processed_file.get(key)}
+
+        point_ids = self.index_pages(pages, filename, collection_name, extra)
+        return {"filename": filename, "doc_id": document_id(pages, extra), "chunks_created": len(point_ids)}
+
+    def process_directory(self, input_dir: Union[str, Path], pattern: str = "*.txt") -> Dict:
+        """Index every processed text file in a directory and report throughput."""
+        files = sorted(Path(input_dir).glob(pattern))
+        skipped_before = self._stats["skipped_duplicates"]
+        started = time.time()
+
+        def documents():
+            for path in files:
+                header, pages = iter_text_file_pages(path)
+                yield list(pages), header.get("document") or path.name, None
+
+        summary = self.index_documents(documents())
+        summary["total_files"] = len(files)
+
+        elapsed = max(time.time() - started, 1e-6)
+        summary["skipped_duplicates"] = self._stats["skipped_duplicates"] - skipped_before
+        summary["elapsed_seconds"] = round(elapsed, 2)
+        summary["docs_per_second"] = round(summary["successful_files"] / elapsed, 2)
+        summary["vectors_per_second"] = round(summary["total_embeddings"] / elapsed, 1)
+        logger.info(f"📊 Embedded {summary['successful_files']} docs / {summary['total_embeddings']} vectors "
+                    f"in {elapsed:.1f}s ({summary['docs_per_second']} docs/s, "
+                    f"{summary['vectors_per_second']} vectors/s)")
+        return summary
+
+    def search_similar(self, query: str, limit: int = 5, collection_name: Optional[str] = None) -> List[Dict]:
+        """Semantic search over indexed chunks."""
+        vector = self.encode([query])[0]
+        response = self.qdrant_client.query_points(
+            collection_name=collection_name or self.collection_name,
+            query=vector.tolist(),
+            limit=limit,
+            with_payload=True
+        )
+        results = []
+        for point in response.points:
+            result = dict(point.payload or {})
+            result.setdefault("filename", "unknown")
+            result["score"] = point.score
+            results.append(result)
+        return results
+
+    def stats(self) -> Dict:
+        """Running totals and throughput since the generator was created."""
+        elapsed = max(time.time() - self._stats["start_time"], 1e-6)
+        return {
+            **self._stats,
+            "total_embeddings": self._stats["vectors"],
+            "elapsed_seconds": round(elapsed, 2),
+            "docs_per_second": round(self._stats["documents"] / elapsed, 2),
+            "vectors_per_second": round(self._stats["vectors"] / elapsed, 1),
+        }
 
-    def generate(self, *args, **kwargs):
-        return []
 
-    def process_text_file(self, *args, **kwargs):
-        return []
+def test_embedding_search(generator: EmbeddingGenerator,
+                          queries: Optional[List[str]] = None) -> Dict[str, List[Dict]]:
+    """Run a few representative queries against the generator's collection and log the hits."""
+    queries = queries or [
+        "notice to appear immigration court",
+        "asylum application I-589",
+        "affidavit of support I-864",
+        "FOIA response records",
+    ]
+    results = {}
+    for query in queries:
+        hits = generator.search_similar(query, limit=3)
+        results[query] = hits
+        logger.info(f"🔍 {query}")
+        for i, hit in enumerate(hits, 1):
+            logger.info(f"  {i}. {hit['filename']} (score: {hit['score']:.3f})")
+    return results
 
-    def create_embedding_for_file(self, *args, **kwargs):
-        return []
 
-    def search_similar(self, *args, **kwargs):
-        return []
+def main():
+    parser = argparse.ArgumentParser(description="Create embeddings for processed text files")
+    parser.add_argument("--input-dir", required=True, help="Directory of processed text files")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Sentence transformer model")
+    parser.add_argument("--collection", default="processed_documents", help="Qdrant collection name")
+    parser.add_argument("--encode-batch", type=int, default=None, help="Chunks per encode call")
+    parser.add_argument("--upsert-batch", type=int, default=None, help="Points per upload batch")
+    parser.add_argument("--parallel", type=int, default=None, help="Parallel upload workers")
+    parser.add_argument("--test-search", action="store_true", help="Run sample searches afterwards")
+    args = parser.parse_args()
 
-    def stats(self):
-        return {"total_embeddings": 0}
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    generator = EmbeddingGenerator(
+        model_name=args.model,
+        collection_name=args.collection,
+        encode_batch_size=args.encode_batch,
+        upsert_batch_size=args.upsert_batch,
+        upload_parallel=args.parallel
+    )
+    summary = generator.process_directory(args.input_dir)
+    print(json.dumps({key: value for key, value in summary.items() if key != "errors"}, indent=2))
 
-    def process_directory(self, *args, **kwargs):
-        return {"processed": 0}
+    if args.test_search:
+        test_embedding_search(generator)
 
-    def encode(self, texts):
-        if self.embedding_model and hasattr(self.embedding_model, 'encode'):
-            return self.embedding_model.encode(texts)
-        return [[0.0] * 384 for _ in texts]
 
-def test_embedding_search(*args, **kwargs):
-    return {"result": "stub"}
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Pipelined Bulk Ingestion
+Runs download, extraction, embedding and upsert as concurrent stages connected by bounded
+queues, so network I/O, OCR and encoding overlap instead of running file by file:
+
+    source -> download (async I/O) -> extract (process pool) -> embed (threads) -> upsert (bulk)
+
+Every stage has its own concurrency knob, and a full queue blocks the stage feeding it.
+Items are reported done only after their points are upserted.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import aiohttp
+
+from core.streaming_download import DOWNLOAD_MAX_BYTES, StreamingDownloader
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PipelineConfig:
+    """Per-stage concurrency and buffering."""
+    download_concurrency: int = field(default_factory=lambda: int(os.getenv("INGEST_DOWNLOADS", "8")))
+    extract_workers: int = field(default_factory=lambda: int(os.getenv("INGEST_EXTRACT_WORKERS", str(os.cpu_count() or 2))))
+    embed_threads: int = field(default_factory=lambda: int(os.getenv("INGEST_EMBED_THREADS", "2")))
+    # Documents an embed thread gathers so small files still fill encode batches
+    embed_batch_docs: int = field(default_factory=lambda: int(os.getenv("INGEST_EMBED_BATCH_DOCS", "16")))
+    upsert_batch: int = field(default_factory=lambda: int(os.getenv("EMBED_UPSERT_BATCH", "1024")))
+    queue_size: int = field(default_factory=lambda: int(os.getenv("INGEST_QUEUE_SIZE", "32")))
+    download_timeout: float = field(default_factory=lambda: float(os.getenv("INGEST_DOWNLOAD_TIMEOUT", "300")))
+    download_max_bytes: int = DOWNLOAD_MAX_BYTES
+    max_retries: int = 3
+
+
+@dataclass
+class IngestItem:
+    """A file moving through the pipeline."""
+    item_id: str
+    filename: str
+    download_url: str
+    extra_payload: Dict[str, Any] = field(default_factory=dict)
+    # Version the source reported at listing time, for change detection
+    etag: Optional[str] = None
+    content_hash: Optional[str] = None
+    local_path: Optional[Path] = None
+    # SHA-256 of the downloaded bytes (the extraction cache key)
+    sha256: Optional[str] = None
+    pages: Optional[List[str]] = None
+
+
+def _extract_pages(file_path: str, digest: Optional[str] = None) -> List[str]:
+    """Process pool entry point: full-mode, cached, page-level extraction."""
+    from scripts.utils.extract_all import iter_pages
+    try:
+        return list(iter_pages(file_path, digest=digest))
+    except Exception as e:
+        # Re-raise as a plain error so the parent can always unpickle it
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+
+_DONE = object()
+
+
+class IngestPipeline:
+    """Staged download/extract/embed/upsert pipeline for bulk indexing."""
+
+    def __init__(self, embedding_generator, collection_name: str, download_dir: Path,
+                 config: Optional[PipelineConfig] = None,
+                 on_done: Optional[Callable[[IngestItem, int], None]] = None,
+                 on_failed: Optional[Callable[[IngestItem, str, str], None]] = None,
+                 on_progress: Optional[Callable[[IngestItem, str], None]] = None,
+                 extract_fn: Callable[[str, Optional[str]], List[str]] = _extract_pages):
+        """
+        Args:
+            embedding_generator: EmbeddingGenerator used for chunking/encoding and its Qdrant client
+            collection_name: Target collection
+            download_dir: Scratch directory for downloads (files are deleted after extraction)
+            config: Stage settings
+            on_done: Called with (item, points_written) once an item's points are upserted
+            on_failed: Called with (item, stage, error) when an item fails
+            on_progress: Called with (item, "downloaded" | "extracted") as an item clears a stage
+            extract_fn: Picklable page extractor run in the process pool with (path, sha256)
+        """
+        self.embedder = embedding_generator
+        self.collection_name = collection_name
+        self.download_dir = Path(download_dir)
+        self.config = config or PipelineConfig()
+        self.on_done = on_done or (lambda item, points: None)
+        self.on_failed = on_failed or (lambda item, stage, error: None)
+        self.on_progress = on_progress or (lambda item, stage: None)
+        self.extract_fn = extract_fn
+        self.downloader = StreamingDownloader(max_bytes=self.config.download_max_bytes,
+                                              timeout=self.config.download_timeout,
+                                              max_retries=self.config.max_retries)
+        self.stats = {"downloaded": 0, "extracted": 0, "embedded": 0, "upserted_points": 0,
+                      "done": 0, "failed": 0}
+
+    def _fail(self, item: IngestItem, stage: str, error: Exception):
+        self.stats["failed"] += 1
+        logger.error(f"❌ {stage} failed for {item.filename}: {error}")
+        if item.local_path is not None:
+            item.local_path.unlink(missing_ok=True)
+        self.on_failed(item, stage, str(error))
+
+    def run(self, items: Iterable[IngestItem]) -> Dict:
+        """Run the pipeline to completion over `items` and return stage counters."""
+        return asyncio.run(self.run_async(items))
+
+    async def run_async(self, items: Iterable[IngestItem]) -> Dict:
+        cfg = self.config
+        self.download_dir.mkdir(parents=True, exist_ok=True)
+        download_q: asyncio.Queue = asyncio.Queue(cfg.queue_size)
+        extract_q: asyncio.Queue = asyncio.Queue(cfg.queue_size)
+        embed_q: asyncio.Queue = asyncio.Queue(cfg.queue_size)
+        upsert_q: asyncio.Queue = asyncio.Queue(cfg.queue_size)
+
+        started = time.time()
+        # Spawned (not forked) workers: the parent already holds torch/model threads
+        process_pool = ProcessPoolExecutor(max_workers=cfg.extract_workers,
+                                           mp_context=multiprocessing.get_context("spawn"))
+        thread_pool = ThreadPoolExecutor(max_workers=cfg.embed_threads + 1, thread_name_prefix="ingest")
+        connector = aiohttp.TCPConnector(limit=cfg.download_concurrency)
+        try:
+            async with aiohttp.ClientSession(connector=connector) as session:
+                stages = [
+                    self._stage(download_q, extract_q, cfg.download_concurrency,
+                                lambda item: self._download(session, item)),
+                    self._stage(extract_q, embed_q, cfg.extract_workers,
+                                lambda item: self._extract(process_pool, item)),
+                    self._embed_stage(embed_q, upsert_q, thread_pool),
+                    self._upsert_stage(upsert_q, thread_pool),
+                ]
+                tasks = [asyncio.create_task(self._feed(items, download_q))]
+                tasks += [asyncio.create_task(stage) for stage in stages]
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    # A failed stage stops draining its inbox; cancel the feed and the
+                    # other stages rather than leave them blocked on full queues
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+        finally:
+            process_pool.shutdown(wait=False, cancel_futures=True)
+            thread_pool.shutdown(wait=True)
+
+        elapsed = max(time.time() - started, 1e-6)
+        self.stats["elapsed_seconds"] = round(elapsed, 1)
+        self.stats["docs_per_second"] = round(self.stats["done"] / elapsed, 2)
+        self.stats["vectors_per_second"] = round(self.stats["upserted_points"] / elapsed, 1)
+        logger.info(f"📊 Pipeline finished: {self.stats}")
+        return self.stats
+
+    async def _feed(self, items: Iterable[IngestItem], queue: asyncio.Queue):
+        for item in items:
+            await queue.put(item)  # blocks while downloads are backed up
+        await queue.put(_DONE)
+
+    async def _stage(self, inbox: asyncio.Queue, outbox: asyncio.Queue, concurrency: int, handler):
+        """Run `concurrency` workers applying `handler` (item -> item or None) from inbox to outbox."""
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    await inbox.put(_DONE)  # let sibling workers see the end marker
+                    return
+                result = await handler(item)
+                if result is not None:
+                    await outbox.put(result)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        await outbox.put(_DONE)
+
+    async def _download(self, session: aiohttp.ClientSession, item: IngestItem) -> Optional[IngestItem]:
+        """Stream a file to disk (hashed, size-limited, resumable), retrying transient failures."""
+        item.local_path = self.download_dir / f"{uuid.uuid4()}_{item.filename}"
+        try:
+            result = await self.downloader.fetch(session, item.download_url, item.local_path)
+        except Exception as e:
+            self._fail(item, "download", e)
+            return None
+        item.sha256 = result.sha256
+        self.stats["downloaded"] += 1
+        logger.debug(f"📥 Downloaded: {item.filename} ({result.size} bytes)")
+        self.on_progress(item, "downloaded")
+        return item
+
+    async def _extract(self, pool: ProcessPoolExecutor, item: IngestItem) -> Optional[IngestItem]:
+        loop = asyncio.get_running_loop()
+        try:
+            item.pages = await loop.run_in_executor(pool, self.extract_fn, str(item.local_path), item.sha256)
+        except Exception as e:
+            self._fail(item, "extract", e)
+            return None
+        finally:
+            if item.local_path is not None:
+                item.local_path.unlink(missing_ok=True)
+
+        if not any(page.strip() for page in item.pages):
+            self._fail(item, "extract", ValueError("no text extracted"))
+            return None
+        self.stats["extracted"] += 1
+        self.on_progress(item, "extracted")
+        return item
+
+    async def _embed_stage(self, inbox: asyncio.Queue, outbox: asyncio.Queue, pool: ThreadPoolExecutor):
+        """Encode documents in groups on worker threads."""
+        loop = asyncio.get_running_loop()
+
+        async def worker():
+            finished = False
+            while not finished:
+                group = [await inbox.get()]
+                # Gather whatever else is already waiting, up to the group size
+                while len(group) < self.config.embed_batch_docs and not inbox.empty():
+                    group.append(inbox.get_nowait())
+                if _DONE in group:
+                    group.remove(_DONE)
+                    await inbox.put(_DONE)
+                    finished = True
+                if not group:
+                    continue
+
+                documents = [(item.pages, item.filename, item.extra_payload) for item in group]
+                try:
+                    points = await loop.run_in_executor(
+                        pool, self.embedder.points_for_documents, documents, self.collection_name
+                    )
+                except Exception as e:
+                    for item in group:
+                        self._fail(item, "embed", e)
+                    continue
+                for item, item_points in zip(group, points):
+                    item.pages = None  # release text once encoded
+                    self.stats["embedded"] += 1
+                    await outbox.put((item, item_points))
+
+        await asyncio.gather(*(worker() for _ in range(max(1, self.config.embed_threads))))
+        await outbox.put(_DONE)
+
+    async def _upsert_stage(self, inbox: asyncio.Queue, pool: ThreadPoolExecutor):
+        """Accumulate points and upsert them in bulk; items complete when their points land."""
+        loop = asyncio.get_running_loop()
+        client = self.embedder.qdrant_client
+        points: List = []
+        waiting: List = []
+
+        async def flush():
+            nonlocal points, waiting
+            batch, items = points, waiting
+            points, waiting = [], []
+            try:
+                if batch:
+                    # wait=False: acknowledged once Qdrant has the batch in its WAL
+                    await loop.run_in_executor(
+                        pool, lambda: client.upsert(collection_name=self.collection_name, points=batch, wait=False)
+                    )
+            except Exception as e:
+                for item, _ in items:
+                    self._fail(item, "upsert", e)
+                return
+            self.stats["upserted_points"] += len(batch)
+            for item, count in items:
+                self.stats["done"] += 1
+                self.on_done(item, count)
+
+        while True:
+            entry = await inbox.get()
+            if entry is _DONE:
+                break
+            item, item_points = entry
+            points.extend(item_points)
+            waiting.append((item, len(item_points)))
+            if len(points) >= self.config.upsert_batch:
+                await flush()
+        await flush()
@@ -223,7 +223,7 @@ fi
 echo ""
 
 # Show processing status
-if [ -f "/home/azureuser/rag_project/embedding/bulk_progress.json" ]; then
+if [ -f "/home/azureuser/rag_project/embedding/bulk_progress.db" ] || [ -f "/home/azureuser/rag_project/embedding/bulk_progress.json" ]; then
     echo "📊 Processing Status:"
     python3 /home/azureuser/rag_project/embedding/bulk_processing_monitor.py --status
 else
@@ -16,12 +16,17 @@ import tempfile
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
-from msal import ConfidentialClientApplication
 
 # Add project root to path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
+from core.graph_client import GraphClient
+from core.sharepoint_crawler import FolderCrawler, drive_path
+from core.sharepoint_listing import ListingFilter, iter_list_items
+from core.sharepoint_delta import DELETE_COLLECTIONS, DeltaSync, delete_item_points
+from core.streaming_download import StreamingDownloader
+from core.change_index import EMBED, NEW, UNCHANGED, ChangeIndex
 from embedding.create_embeddings import EmbeddingGenerator
 from embedding.download_and_process import DocumentDownloadProcessor
 
@@ -43,6 +48,8 @@ class WorkingSharePointProcessor:
         self.headers = None
         self.embedding_gen = None
         self.doc_processor = None
+        self.downloader = StreamingDownloader()
+        self.change_index = ChangeIndex()
         self.processed_count = 0
         
         print("🔧 Initializing SharePoint processor...")
@@ -53,19 +60,9 @@ class WorkingSharePointProcessor:
         """Authenticate with Microsoft Graph API."""
         print("🔑 Authenticating with Microsoft Graph...")
         
-        app = ConfidentialClientApplication(
-            self.client_id,
-            authority=f"https://login.microsoftonline.com/{self.tenant_id}",
-            client_credential=self.client_secret
-        )
-        
-        result = app.acquire_token_for_client(["https://graph.microsoft.com/.default"])
-        
-        if not result or "access_token" not in result:
-            error_msg = result.get('error_description', str(result)) if isinstance(result, dict) else str(result)
-            raise RuntimeError(f"Failed to acquire token: {error_msg}")
-        
-        self.headers = {"Authorization": f"Bearer {result['access_token']}"}
+        self.graph = GraphClient(self.tenant_id, self.client_id, self.client_secret)
+        self.access_token = self.graph.access_token()
+        self.headers = {"Authorization": f"Bearer {self.access_token}"}
         print("✅ Authentication successful")
     
     def _setup_processors(self):
@@ -82,7 +79,7 @@ class WorkingSharePointProcessor:
         if not hasattr(self.doc_processor, "process_single_file"):
             self.doc_processor.process_single_file = lambda path: ["dummy"]
         if not hasattr(self.embedding_gen, "process_text_file"):
-            self.embedding_gen.process_text_file = lambda path: ["dummy"]
+            self.embedding_gen.process_text_file = lambda path, **kwargs: ["dummy"]
         
         print("✅ Processors ready")
     
@@ -90,18 +87,11 @@ class WorkingSharePointProcessor:
         """Get all documents from SharePoint using the working method."""
         print("📋 Fetching documents from SharePoint...")
         
-        # Get list items
-        items_url = (f"https://graph.microsoft.com/v1.0/sites/{self.site_id}"
-                    f"/lists/{self.list_id}/items?$expand=fields&$top=9999")
-        
-        response = requests.get(items_url, headers=self.headers)
-        if response.status_code != 200:
-            raise RuntimeError(f"Failed to fetch list items: {response.status_code} - {response.text}")
-        
-        items = response.json().get("value", [])
+        # Get list items, with each item's driveItem parent in the same query
+        items = list(iter_list_items(self.graph, self.site_id, self.list_id))
         print(f"📊 Found {len(items)} items in SharePoint list")
         
-        all_documents = []
+        case_folders = []
         
         for item in items:
             try:
@@ -111,50 +101,57 @@ class WorkingSharePointProcessor:
                            fields.get("Title") or f"Item {item_id}")
                 print(f"🔍 Processing case: {case_name}")
                 
-                # Get drive item info
-                drive_item_url = (f"https://graph.microsoft.com/v1.0/sites/{self.site_id}"
-                                f"/lists/{self.list_id}/items/{item_id}/driveItem")
-                
-                di_response = requests.get(drive_item_url, headers=self.headers)
-                if di_response.status_code != 200:
+                drive_info = item.get("driveItem")
+                if not drive_info or "parentReference" not in drive_info:
                     print(f"  ⚠️ Could not get drive item for {case_name}")
                     continue
                 
-                drive_info = di_response.json()
                 drive_id = drive_info["parentReference"]["driveId"]
                 folder_id = drive_info["parentReference"]["id"]
-                
-                # Get all files in this folder
-                folder_docs = list(self._walk_folder(drive_id, folder_id))
-                print(f"  📄 Found {len(folder_docs)} documents in {case_name}")
-                
-                all_documents.extend(folder_docs)
+                case_folders.append((drive_path(drive_id), folder_id))
                 
             except Exception as e:
                 case_name = locals().get('case_name', 'Unknown')
                 print(f"  ❌ Error processing {case_name}: {e}")
                 continue
         
+        # One crawl over every case folder, so folders are listed concurrently
+        crawler = FolderCrawler(self.graph, listing_filter=ListingFilter.from_env())
+        all_documents = list(crawler.iter_files(case_folders))
         print(f"🎯 Total documents to process: {len(all_documents)}")
+        if not crawler.complete:
+            print(f"⚠️ Listing incomplete: {len(crawler.failed_folders)} folders could not be listed")
         return all_documents
     
+    def get_changed_documents(self):
+        """
+        Get files added or changed since the last incremental run via the drive delta query.
+        Deleted files are removed from the collection right away.
+
+        Returns:
+            (documents, delta, delta_link) - save delta_link with delta.save_delta_link()
+            once the documents are processed
+        """
+        print("🔄 Fetching changes from SharePoint (delta query)...")
+        delta = DeltaSync(self.site_id, self.graph.access_token(), session=self.graph)
+        changes = delta.fetch_changes()
+
+        if changes.deleted and self.embedding_gen is not None:
+            delete_item_points(self.embedding_gen.qdrant_client, changes.deleted,
+                               list(dict.fromkeys(["complete_project_library", *DELETE_COLLECTIONS])))
+            print(f"🗑️ Removed {len(changes.deleted)} deleted items from the vector database")
+        self.change_index.forget(changes.deleted)
+
+        print(f"🎯 {len(changes.changed)} documents added or changed"
+              f"{' (first sync: full enumeration)' if changes.full_resync else ''}")
+        return changes.changed, delta, changes.delta_link
+
     def _walk_folder(self, drive_id, item_id, depth=0):
-        """Walk folder structure to find all files."""
-        if depth > 3:  # Prevent infinite recursion
-            return
-        
-        url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{item_id}/children"
-        response = requests.get(url, headers=self.headers)
-        
-        if response.status_code != 200:
-            print(f"    ⚠️ Could not read folder children: {response.status_code}")
-            return
-        
-        for child in response.json().get("value", []):
-            if "file" in child:
-                yield child
-            elif "folder" in child:
-                yield from self._walk_folder(drive_id, child["id"], depth + 1)
+        """Walk folder structure to find all files (streamed as they are listed)."""
+        crawler = FolderCrawler(self.graph)
+        yield from crawler.iter_files([(drive_path(drive_id), item_id)])
+        if not crawler.complete:
+            print(f"⚠️ Listing incomplete: {len(crawler.failed_folders)} folders could not be listed")
     
     def process_document(self, doc_info):
         """Process a single document."""
@@ -166,18 +163,31 @@ class WorkingSharePointProcessor:
                 print(f"    ⚠️ No download URL for {filename}")
                 return False
             
-            print(f"    📥 Processing: {filename}")
+            # Same content as when last embedded: skip the download entirely
+            check = self.change_index.check(EMBED, doc_info) if doc_info.get("id") else None
+            if check is not None and check.status == UNCHANGED:
+                print(f"    ⏭️ Unchanged since last run: {filename}")
+                return True
+            # Points carry the driveItem ID, so delta deletions and re-indexing can find them
+            extra_payload = {"item_id": doc_info["id"]} if doc_info.get("id") else None
             
-            # Download file to temp location
-            response = requests.get(download_url)
-            if response.status_code != 200:
-                print(f"    ❌ Download failed for {filename}")
-                return False
+            print(f"    📥 Processing: {filename}")
             
-            # Save to temporary file
+            # Stream to a temporary file (never buffered whole in memory)
             with tempfile.NamedTemporaryFile(delete=False, suffix=Path(filename).suffix) as temp_file:
-                temp_file.write(response.content)
                 temp_path = Path(temp_file.name)
+            try:
+                self.downloader.download(download_url, temp_path)
+            except Exception as e:
+                temp_path.unlink(missing_ok=True)
+                print(f"    ❌ Download failed for {filename}: {e}")
+                return False
+            
+            if check is not None and check.status != NEW and self.embedding_gen is not None:
+                # Embedded before at another version: the new content gets a new document_id,
+                # so the old points would otherwise stay next to it
+                delete_item_points(self.embedding_gen.qdrant_client, [doc_info["id"]],
+                                   [self.embedding_gen.collection_name])
             
             try:
                 # Process with OCR if needed
@@ -189,14 +199,14 @@ class WorkingSharePointProcessor:
                     if processed_files:
                         text_file = processed_files[0]
                         if self.embedding_gen and hasattr(self.embedding_gen, 'process_text_file'):
-                            embeddings = self.embedding_gen.process_text_file(text_file)
+                            embeddings = self.embedding_gen.process_text_file(text_file, extra_payload=extra_payload)
                         else:
                             embeddings = []
                         print(f"    ✅ Created {len(embeddings)} embeddings for {filename}")
                         return True
                 else:
                     if self.embedding_gen and hasattr(self.embedding_gen, 'process_text_file'):
-                        embeddings = self.embedding_gen.process_text_file(temp_path)
+                        embeddings = self.embedding_gen.process_text_file(temp_path, extra_payload=extra_payload)
                     else:
                         embeddings = []
                     print(f"    ✅ Created {len(embeddings)} embeddings for {filename}")
@@ -211,16 +221,21 @@ class WorkingSharePointProcessor:
             print(f"    ❌ Error processing {filename}: {e}")
             return False
     
-    def process_all_documents(self, batch_size=10, max_files=None):
-        """Process all documents in batches."""
+    def process_all_documents(self, batch_size=10, max_files=None, incremental=False):
+        """Process all documents in batches (only changed ones when incremental)."""
         print("🚀 STARTING BULK SHAREPOINT PROCESSING")
         print("=" * 60)
         
         start_time = datetime.now()
         
         # Get all documents
-        all_documents = self.get_all_documents()
+        delta, delta_link = None, None
+        if incremental:
+            all_documents, delta, delta_link = self.get_changed_documents()
+        else:
+            all_documents = self.get_all_documents()
         
+        capped = bool(max_files) and len(all_documents) > max_files
         if max_files:
             all_documents = all_documents[:max_files]
             print(f"🔢 Limited to {max_files} files for this run")
@@ -243,6 +258,8 @@ class WorkingSharePointProcessor:
                 processed += 1
                 if self.process_document(doc):
                     successful += 1
+                    if doc.get("id"):
+                        self.change_index.record(EMBED, doc)
                 else:
                     failed += 1
                 
@@ -255,6 +272,15 @@ class WorkingSharePointProcessor:
             
             # Small delay between batches
             time.sleep(1)
+
+        # A capped run has not seen every change, and failed files would not be reported
+        # by the next delta again, so either way keep the old token
+        if delta is not None and delta_link:
+            if capped or failed:
+                print(f"⚠️ Keeping the delta token: {failed} failed"
+                      f"{', run capped' if capped else ''}; the changes come back next run")
+            else:
+                delta.save_delta_link(delta_link)
         
         # Final summary
         elapsed = datetime.now() - start_time
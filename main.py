@@ -2,21 +2,29 @@
 """
 FastAPI application for document classification using enhanced RAG classifier
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request
+from fastapi.responses import PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Dict, Any, List, Tuple, Optional, Union
+import asyncio
 import logging
 import traceback
 import sys
 import os
 import time
+import tempfile
+from concurrent.futures import Future
 
 # Add the project root to the Python path
 sys.path.append('/home/azureuser/rag_project')
 
-# Import our enhanced RAG classifier
-from core.enhanced_rag_classifier import EnhancedRAGClassifier
+from core.job_queue import JobQueue
+from core.process_lock import ProcessLock
+from core.inference_scheduler import BULK, INTERACTIVE, InferenceScheduler
+from core.model_server import ModelClient
+from core.file_extraction import FileExtractionService, UploadTooLargeError
+from scripts.utils.extract_all import CLASSIFY_MODE
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -36,9 +44,39 @@ app.add_middleware(
 # Global classifier instance
 classifier = None
 
+# With MODEL_SERVER_SOCKET set, the models live in the shared model server
+# (python -m core.model_server) and this process only forwards to it
+model_client = None
+
+# Orders model calls: interactive requests ahead of batch/job work, by weighted share
+inference_scheduler = InferenceScheduler()
+
+# Persistent queue for asynchronous classification jobs
+job_queue = None
+
+# Held by the one API worker that runs the job queue workers and the webhook
+# subscription loop; every worker still queues jobs, reports on them and takes notifications
+background_lock = ProcessLock(os.getenv(
+    "BACKGROUND_LOCK_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "jobs", "background.lock")))
+
+# Process pool for server-side text extraction/OCR of uploads
+extraction_service = None
+
+# Graph change notifications (enabled by WEBHOOK_NOTIFICATION_URL) and the index
+# that keeps our own metadata write-backs from being classified again
+webhook_receiver = None
+change_index = None
+
 class ClassificationRequest(BaseModel):
     text: str
     filename: str = "document.pdf"
+    # SharePoint driveItem ID; lets delta sync remove the stored document when the file is deleted
+    item_id: Optional[str] = None
+
+class JobRequest(BaseModel):
+    texts: List[ClassificationRequest] = []
+    sharepoint_item_ids: List[str] = []
 
 class ClassificationResponse(BaseModel):
     document_type: str
@@ -52,17 +90,159 @@ class ClassificationResponse(BaseModel):
     rag_context_used: bool = False
     success: bool = True
 
+class FileClassificationResponse(ClassificationResponse):
+    filename: str
+    content_hash: str
+    extracted_characters: int = 0
+    extraction_cached: bool = False
+
+def _build_response_fields(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a classifier result onto ClassificationResponse fields."""
+    return {
+        "document_type": result.get('doc_type', 'Unknown'),
+        "document_category": result.get('doc_category', 'Unknown'),
+        "confidence_level": result.get('confidence', 'Low'),
+        "confidence_score": float(result.get('confidence_score', 0.0)),
+        "uncertainty_flags": result.get('uncertainty_flags', []),
+        "needs_human_review": result.get('needs_human_review', False),
+        "alternative_classifications": result.get('alternative_classifications', []),
+        "processing_time": f"{result.get('processing_time', 0):.2f}s",
+        "rag_context_used": result.get('rag_context', {}).get('context_used', False),
+        "success": True
+    }
+
+def _format_batch_result(result: Dict[str, Any], filename: str) -> Dict[str, Any]:
+    """Convert a classifier result into the compact per-document batch format."""
+    return {
+        "filename": filename,
+        "document_type": result.get('doc_type', 'Unknown'),
+        "document_category": result.get('doc_category', 'Unknown'),
+        "confidence_level": result.get('confidence', 'Low'),
+        "confidence_score": float(result.get('confidence_score', 0.0)),
+        "uncertainty_flags": result.get('uncertainty_flags', []),
+        "needs_human_review": result.get('needs_human_review', False),
+        "success": True
+    }
+
+def _classifier_ready() -> bool:
+    return classifier is not None or model_client is not None
+
+def _submit_classification(text: str, filename: str, priority: str, item_id: Optional[str] = None) -> Future:
+    """Queue a model call on the local scheduler, or on the shared model server."""
+    if model_client is not None:
+        return model_client.submit_classification(text, filename, priority, item_id)
+    return inference_scheduler.submit(classifier.classify_with_rag, text, filename, item_id, priority=priority)
+
+def _classify_for_job(text: str, filename: str, item_id: Optional[str] = None) -> Dict[str, Any]:
+    """Job queue worker entry point."""
+    if not _classifier_ready():
+        raise RuntimeError("Classifier not initialized")
+    result = _submit_classification(text, filename, BULK, item_id).result()
+    return _format_batch_result(result, filename)
+
+def _resolve_sharepoint_item(item_id: str) -> Tuple[str, str, Optional[str]]:
+    """Download and extract the text of a SharePoint list item for the job queue."""
+    from core.sharepoint_integration import download_list_item
+    from scripts.utils.extract_all import extract_text_from_file
+    
+    with tempfile.TemporaryDirectory(prefix="job_item_") as tmp_dir:
+        local_path, filename, drive_item_id = download_list_item(item_id, tmp_dir)
+        # Only the first few pages reach the classifier prompt
+        return extract_text_from_file(local_path, mode=CLASSIFY_MODE), filename, drive_item_id
+
+def _write_back_classification(item: Dict[str, Any], result: Dict[str, Any]):
+    """Write a queued item's classification to SharePoint and record the classified version."""
+    from core.sharepoint_integration import update_metadata
+    from core.change_index import CLASSIFY
+    
+    if not update_metadata(item["item_id"], result["filename"],
+                           result["document_type"], result["document_category"]):
+        raise RuntimeError(f"Metadata update failed for item {item['item_id']}")
+    if change_index is not None and item.get("drive_item"):
+        change_index.record(CLASSIFY, item["drive_item"], {
+            "doc_type": result["document_type"],
+            "doc_category": result["document_category"]
+        })
+
+def _start_webhook_receiver():
+    """Subscribe to library changes when a public notification URL is configured."""
+    global webhook_receiver, change_index
+    if not os.getenv("WEBHOOK_NOTIFICATION_URL"):
+        return
+    if job_queue is None:
+        logger.error("❌ Webhook receiver needs the job queue; not subscribing")
+        return
+    try:
+        from core.change_index import ChangeIndex
+        from core.graph_client import get_graph_client
+        from core.sharepoint_webhook import WebhookReceiver
+        
+        change_index = ChangeIndex()
+        webhook_receiver = WebhookReceiver.from_env(get_graph_client(), job_queue.submit, change_index)
+        webhook_receiver.start(manage_subscription=background_lock.held)
+        logger.info("✅ SharePoint webhook receiver started")
+    except Exception as e:
+        logger.error(f"❌ Failed to start webhook receiver: {e}")
+        webhook_receiver = None
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the classifier on startup."""
-    global classifier
+    """Initialize the classifier and job queue on startup."""
+    global classifier, model_client, job_queue, extraction_service
+    if os.getenv("MODEL_SERVER_SOCKET"):
+        # Light worker: no models in this process, so several workers can run side by side
+        model_client = ModelClient(os.getenv("MODEL_SERVER_SOCKET"))
+        logger.info(f"✅ Forwarding inference to the model server at {model_client.socket_path}")
+    else:
+        try:
+            from core.enhanced_rag_classifier import EnhancedRAGClassifier
+            
+            logger.info("Initializing Enhanced RAG Classifier...")
+            classifier = EnhancedRAGClassifier()
+            logger.info("✅ Enhanced RAG Classifier initialized successfully")
+        except Exception as e:
+            logger.error(f"❌ Failed to initialize classifier: {e}")
+            logger.error(traceback.format_exc())
+        
+        inference_scheduler.start()
+    
+    try:
+        job_queue = JobQueue(
+            classify_fn=_classify_for_job,
+            resolve_fn=_resolve_sharepoint_item,
+            writeback_fn=_write_back_classification,
+            num_workers=int(os.getenv("JOB_WORKERS", "1"))
+        )
+        if background_lock.acquire(blocking=False):
+            job_queue.start()
+        else:
+            logger.info("📡 Job workers run in another API worker; this one only queues and reports")
+    except Exception as e:
+        logger.error(f"❌ Failed to start job queue: {e}")
+        job_queue = None
+    
     try:
-        logger.info("Initializing Enhanced RAG Classifier...")
-        classifier = EnhancedRAGClassifier()
-        logger.info("✅ Enhanced RAG Classifier initialized successfully")
+        extraction_service = FileExtractionService()
     except Exception as e:
-        logger.error(f"❌ Failed to initialize classifier: {e}")
-        logger.error(traceback.format_exc())
+        logger.error(f"❌ Failed to start extraction service: {e}")
+        extraction_service = None
+    
+    _start_webhook_receiver()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers; unfinished job items resume on next startup."""
+    if webhook_receiver is not None:
+        webhook_receiver.stop()
+    if job_queue is not None:
+        job_queue.close()
+    background_lock.release()
+    if model_client is not None:
+        model_client.close()
+    else:
+        inference_scheduler.stop()
+    if extraction_service is not None:
+        extraction_service.shutdown()
 
 @app.get("/")
 async def root():
@@ -74,40 +254,27 @@ async def health_check():
     """Health check endpoint."""
     return {
         "status": "healthy",
-        "classifier_ready": classifier is not None,
+        "classifier_ready": _classifier_ready(),
+        "model_server": model_client.socket_path if model_client is not None else None,
         "service": "enhanced-rag-classifier"
     }
 
 @app.post("/classify", response_model=ClassificationResponse)
 async def classify_document(request: ClassificationRequest):
     """Classify a document using the enhanced RAG classifier."""
-    if classifier is None:
+    if not _classifier_ready():
         raise HTTPException(status_code=503, detail="Classifier not initialized")
     
     try:
         logger.info(f"Classifying document: {request.filename}")
         
         # Use the enhanced RAG classifier
-        result = classifier.classify_with_rag(request.text, request.filename)
+        result = await asyncio.wrap_future(
+            _submit_classification(request.text, request.filename, INTERACTIVE, request.item_id)
+        )
         
         # Convert the result to our response format
-        confidence_score = float(result.get('confidence_score', 0.0))
-        uncertainty_flags = result.get('uncertainty_flags', [])
-        needs_review = result.get('needs_human_review', False)
-        alternatives = result.get('alternative_classifications', [])
-        
-        response = ClassificationResponse(
-            document_type=result.get('doc_type', 'Unknown'),
-            document_category=result.get('doc_category', 'Unknown'),
-            confidence_level=result.get('confidence', 'Low'),
-            confidence_score=confidence_score,
-            uncertainty_flags=uncertainty_flags,
-            needs_human_review=needs_review,
-            alternative_classifications=alternatives,
-            processing_time=f"{result.get('processing_time', 0):.2f}s",
-            rag_context_used=result.get('rag_context', {}).get('context_used', False),
-            success=True
-        )
+        response = ClassificationResponse(**_build_response_fields(result))
         
         logger.info(f"Classification successful: {response.document_type} -> {response.document_category}")
         return response
@@ -117,30 +284,59 @@ async def classify_document(request: ClassificationRequest):
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Classification failed: {str(e)}")
 
+@app.post("/classify-file", response_model=FileClassificationResponse)
+async def classify_file(file: UploadFile = File(...)):
+    """Extract text from an uploaded file server-side and classify it."""
+    if not _classifier_ready():
+        raise HTTPException(status_code=503, detail="Classifier not initialized")
+    if extraction_service is None:
+        raise HTTPException(status_code=503, detail="Extraction service not initialized")
+    
+    filename = file.filename or "document.pdf"
+    try:
+        text, content_hash, cached = await extraction_service.extract_upload(file, filename, mode=CLASSIFY_MODE)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        logger.error(f"Extraction error for {filename}: {e}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Extraction failed: {str(e)}")
+    finally:
+        await file.close()
+    
+    if not text.strip():
+        raise HTTPException(status_code=422, detail=f"No text could be extracted from {filename}")
+    
+    try:
+        logger.info(f"Classifying uploaded file: {filename}")
+        result = await asyncio.wrap_future(_submit_classification(text, filename, INTERACTIVE))
+        return FileClassificationResponse(
+            filename=filename,
+            content_hash=content_hash,
+            extracted_characters=len(text),
+            extraction_cached=cached,
+            **_build_response_fields(result)
+        )
+    except Exception as e:
+        logger.error(f"Classification error: {e}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Classification failed: {str(e)}")
+
 @app.post("/classify-batch")
 async def classify_documents_batch(requests: List[ClassificationRequest]):
     """Classify multiple documents in batch."""
-    if classifier is None:
+    if not _classifier_ready():
         raise HTTPException(status_code=503, detail="Classifier not initialized")
     
+    # One task per document: interactive requests can go ahead between any two of them
+    futures = [_submit_classification(req.text, req.filename, BULK, req.item_id) for req in requests]
     results = []
-    for req in requests:
+    for req, future in zip(requests, futures):
         try:
-            result = classifier.classify_with_rag(req.text, req.filename)
-            confidence_score = float(result.get('confidence_score', 0.0))
-            uncertainty_flags = result.get('uncertainty_flags', [])
-            needs_review = result.get('needs_human_review', False)
-            
-            results.append({
-                "filename": req.filename,
-                "document_type": result.get('doc_type', 'Unknown'),
-                "document_category": result.get('doc_category', 'Unknown'),
-                "confidence_level": result.get('confidence', 'Low'),
-                "confidence_score": confidence_score,
-                "uncertainty_flags": uncertainty_flags,
-                "needs_human_review": needs_review,
-                "success": True
-            })
+            result = await asyncio.wrap_future(future)
+            results.append(_format_batch_result(result, req.filename))
         except Exception as e:
             results.append({
                 "filename": req.filename,
@@ -150,6 +346,68 @@ async def classify_documents_batch(requests: List[ClassificationRequest]):
     
     return {"results": results, "total": len(requests)}
 
+@app.post("/jobs", status_code=202)
+async def create_job(request: JobRequest):
+    """Queue texts and/or SharePoint items for asynchronous classification."""
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Job queue not initialized")
+    
+    items = [{"kind": "text", "text": req.text, "filename": req.filename, "item_id": req.item_id}
+             for req in request.texts]
+    items += [{"kind": "sharepoint", "item_id": item_id} for item_id in request.sharepoint_item_ids]
+    if not items:
+        raise HTTPException(status_code=400, detail="Job must contain at least one text or SharePoint item ID")
+    
+    job_id = job_queue.submit(items)
+    return {"job_id": job_id, "status": "queued", "total": len(items)}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, offset: int = 0, limit: int = 100):
+    """Report job progress and a page of finished results."""
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Job queue not initialized")
+    
+    job = job_queue.get_job(job_id, offset=max(0, offset), limit=min(max(1, limit), 1000))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel the pending items of a job."""
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Job queue not initialized")
+    
+    if not job_queue.cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return {"job_id": job_id, "status": "cancelled"}
+
+@app.get("/metrics/inference")
+async def inference_metrics():
+    """Queue depth, counters and latency percentiles per priority class."""
+    if model_client is not None:
+        return await asyncio.wrap_future(model_client.call("metrics"))
+    return {"workers": inference_scheduler.num_workers, "classes": inference_scheduler.metrics()}
+
+@app.post("/webhooks/sharepoint")
+async def sharepoint_webhook(request: Request, validationToken: Optional[str] = None):
+    """Receive Graph change notifications for the document library."""
+    if validationToken is not None:
+        # Subscription handshake: Graph expects the token back verbatim as plain text
+        return PlainTextResponse(validationToken)
+    if webhook_receiver is None:
+        raise HTTPException(status_code=503, detail="Webhook receiver not initialized")
+    
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Notification body is not JSON")
+    
+    # Only queues a debounced delta round, so Graph gets its answer well within its timeout
+    if not webhook_receiver.handle(payload):
+        raise HTTPException(status_code=403, detail="No notification carried the expected clientState")
+    return Response(status_code=202)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
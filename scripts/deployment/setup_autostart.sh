@@ -19,13 +19,49 @@ NC='\033[0m' # No Color
 
 echo -e "${YELLOW}📋 Creating systemd service files...${NC}"
 
-# 1. FastAPI Server Service
+# 1. Model Server Service (classifier models loaded once, shared by all API workers)
+MODEL_SERVER_SOCKET="/run/rag/model_server.sock"
+API_WORKERS=4
+
+sudo tee /etc/systemd/system/rag-model-server.service > /dev/null << EOF
+[Unit]
+Description=RAG Shared Model Server
+After=network.target qdrant.service nvidia-persistenced.service
+Wants=qdrant.service
+
+[Service]
+Type=simple
+User=azureuser
+Group=azureuser
+WorkingDirectory=$PROJECT_DIR
+RuntimeDirectory=rag
+RuntimeDirectoryPreserve=yes
+Environment=PATH=$CONDA_PATH/envs/$RAG_ENV/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
+Environment=MODEL_SERVER_SOCKET=$MODEL_SERVER_SOCKET
+ExecStart=$CONDA_PATH/envs/$RAG_ENV/bin/python -m core.model_server
+Restart=always
+RestartSec=10
+KillMode=mixed
+KillSignal=SIGINT
+TimeoutStopSec=60
+
+# Logging
+StandardOutput=append:$PROJECT_DIR/logs/application/model_server.log
+StandardError=append:$PROJECT_DIR/logs/application/model_server.log
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+# 2. FastAPI Server Service (light workers forwarding inference to the model server)
+#    Whichever worker holds data/jobs/background.lock runs the job queue workers and the
+#    webhook subscription loop; the others queue jobs and take notifications only
 sudo tee /etc/systemd/system/rag-fastapi.service > /dev/null << EOF
 [Unit]
 Description=RAG FastAPI Classification Server
 After=network.target
-Wants=qdrant.service
-After=qdrant.service
+Wants=qdrant.service rag-model-server.service
+After=qdrant.service rag-model-server.service
 
 [Service]
 Type=simple
@@ -33,7 +69,8 @@ User=azureuser
 Group=azureuser
 WorkingDirectory=$PROJECT_DIR/core
 Environment=PATH=$CONDA_PATH/envs/$RAG_ENV/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
-ExecStart=$CONDA_PATH/envs/$RAG_ENV/bin/python -m uvicorn main:app --host 0.0.0.0 --port 8000
+Environment=MODEL_SERVER_SOCKET=$MODEL_SERVER_SOCKET
+ExecStart=$CONDA_PATH/envs/$RAG_ENV/bin/python -m uvicorn main:app --host 0.0.0.0 --port 8000 --workers $API_WORKERS
 Restart=always
 RestartSec=3
 KillMode=mixed
@@ -48,7 +85,7 @@ StandardError=append:$PROJECT_DIR/logs/application/fastapi.log
 WantedBy=multi-user.target
 EOF
 
-# 2. Mistral API Server Service
+# 3. Mistral API Server Service
 sudo tee /etc/systemd/system/rag-mistral.service > /dev/null << EOF
 [Unit]
 Description=RAG Mistral AI Server
@@ -77,7 +114,7 @@ StandardError=append:$PROJECT_DIR/logs/application/mistral_server.log
 WantedBy=multi-user.target
 EOF
 
-# 3. Updated SharePoint Automation Service (system-level)
+# 4. Updated SharePoint Automation Service (system-level)
 sudo tee /etc/systemd/system/rag-sharepoint.service > /dev/null << EOF
 [Unit]
 Description=RAG SharePoint Document Automation
@@ -123,6 +160,7 @@ echo -e "${YELLOW}🔄 Reloading systemd daemon...${NC}"
 sudo systemctl daemon-reload
 
 echo -e "${YELLOW}🟢 Enabling services for auto-start...${NC}"
+sudo systemctl enable rag-model-server.service
 sudo systemctl enable rag-fastapi.service
 sudo systemctl enable rag-mistral.service
 sudo systemctl enable rag-sharepoint.service
@@ -134,6 +172,8 @@ sudo systemctl start qdrant.service
 sleep 2
 sudo systemctl start rag-mistral.service
 sleep 5
+sudo systemctl start rag-model-server.service
+sleep 5
 sudo systemctl start rag-fastapi.service
 sleep 3
 sudo systemctl start rag-sharepoint.service
@@ -141,6 +181,8 @@ sudo systemctl start rag-sharepoint.service
 echo -e "${GREEN}✅ All services configured for automatic startup!${NC}"
 
 echo -e "${YELLOW}📊 Service Status:${NC}"
+echo "Model Server ($MODEL_SERVER_SOCKET):"
+sudo systemctl is-active rag-model-server || echo "❌ Not running"
 echo "FastAPI Server (Port 8000):"
 sudo systemctl is-active rag-fastapi || echo "❌ Not running"
 echo "Mistral Server (Port 8001):"
@@ -1,20 +1,43 @@
 #!/usr/bin/env python3
 """
 Simple OpenAI-compatible API server for Mistral model using transformers
+
+Requests are not generated one by one. A single engine thread runs the model in
+iterations: each iteration admits waiting requests (prefill), then advances every
+running request by one token in one batched forward pass (decode). Requests join and
+leave the batch between iterations, so a short request never waits for a long one to
+finish. Tokens can be streamed back as server-sent events (`"stream": true`).
 """
 import asyncio
 import json
+import os
+import threading
 import time
 import uuid
-from datetime import datetime
-from typing import Dict, List, Optional
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
 
 import torch
+import torch.nn.functional as F
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from transformers import AutoModelForCausalLM, AutoTokenizer
 import uvicorn
 
+try:
+    from transformers import DynamicCache
+except ImportError:  # older transformers only take the legacy tuple cache
+    DynamicCache = None
+
+
+# Engine limits
+MAX_BATCH_SIZE = int(os.getenv("MISTRAL_MAX_BATCH_SIZE", "8"))
+# Prompt + completion tokens reserved by all running requests together (KV cache budget)
+MAX_BATCH_TOKENS = int(os.getenv("MISTRAL_MAX_BATCH_TOKENS", "16384"))
+# Prefills per iteration; bounds how long running streams stall while requests join
+MAX_PREFILLS_PER_STEP = int(os.getenv("MISTRAL_MAX_PREFILLS_PER_STEP", "2"))
+
 
 class ChatMessage(BaseModel):
     role: str
@@ -27,6 +50,7 @@ class ChatCompletionRequest(BaseModel):
     max_tokens: Optional[int] = 500
     temperature: Optional[float] = 0.7
     top_p: Optional[float] = 0.9
+    stream: bool = False
 
 
 class ChatCompletionResponse(BaseModel):
@@ -43,15 +67,16 @@ app = FastAPI(title="Mistral API Server", version="1.0.0")
 # Global variables for model and tokenizer
 model = None
 tokenizer = None
+engine = None
 
 
 def load_model():
     """Load the Mistral model and tokenizer"""
     global model, tokenizer
-    
+
     print("Loading Mistral model...")
     model_name = "microsoft/DialoGPT-medium"  # Using a lighter model for testing
-    
+
     try:
         tokenizer = AutoTokenizer.from_pretrained(model_name)
         model = AutoModelForCausalLM.from_pretrained(
@@ -60,12 +85,12 @@ def load_model():
             device_map="auto" if torch.cuda.is_available() else None,
             low_cpu_mem_usage=True
         )
-        
+
         if tokenizer.pad_token is None:
             tokenizer.pad_token = tokenizer.eos_token
-            
+
         print(f"Model loaded successfully! Using device: {next(model.parameters()).device}")
-        
+
     except Exception as e:
         print(f"Error loading model: {e}")
         # Fallback to a very simple model
@@ -76,92 +101,402 @@ def load_model():
         if tokenizer.pad_token is None:
             tokenizer.pad_token = tokenizer.eos_token
 
+    model.eval()
+
+
+def context_window(model) -> int:
+    """Tokens the model can attend to (MISTRAL_MAX_CONTEXT can lower it)."""
+    config = model.config
+    window = (getattr(config, "max_position_embeddings", None)
+              or getattr(config, "n_positions", None) or 2048)
+    override = os.getenv("MISTRAL_MAX_CONTEXT")
+    return min(window, int(override)) if override else window
+
+
+def build_prompt(messages: List[ChatMessage]) -> str:
+    """Combine messages into a single prompt"""
+    prompt = ""
+    for message in messages:
+        if message.role == "system":
+            prompt += f"System: {message.content}\n"
+        elif message.role == "user":
+            prompt += f"User: {message.content}\n"
+        elif message.role == "assistant":
+            prompt += f"Assistant: {message.content}\n"
+    return prompt + "Assistant:"
+
+
+# ---------------------------------------------------------------------------
+# Continuous batching engine
+# ---------------------------------------------------------------------------
+
+def _legacy_cache(past_key_values) -> Tuple:
+    """Per-layer (key, value) tensors shaped [batch, heads, seq, head_dim]."""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return tuple(past_key_values)
+
+
+def _model_cache(legacy: Tuple):
+    return DynamicCache.from_legacy_cache(legacy) if DynamicCache is not None else legacy
+
+
+def _pad_left(cache: Tuple, width: int) -> Tuple:
+    return tuple((F.pad(k, (0, 0, width, 0)), F.pad(v, (0, 0, width, 0))) for k, v in cache)
+
+
+class Sequence:
+    """One request moving through the engine; events are delivered to its event loop."""
+
+    def __init__(self, prompt_ids: List[int], max_new_tokens: int, temperature: float, top_p: float,
+                 loop: asyncio.AbstractEventLoop):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.generated: List[int] = []
+        self.text = ""
+        self.length = 0                  # tokens in this row's KV cache
+        self.next_token: Optional[int] = None
+        self.finish_reason: Optional[str] = None
+        self.cancelled = False
+        self.loop = loop
+        self.events: asyncio.Queue = asyncio.Queue()
+
+    @property
+    def budget(self) -> int:
+        return len(self.prompt_ids) + self.max_new_tokens
+
+    def push(self, kind: str, value):
+        self.loop.call_soon_threadsafe(self.events.put_nowait, (kind, value))
+
+    def finish(self, reason: str):
+        self.finish_reason = reason
+        self.push("done", reason)
+
+    async def stream(self):
+        """Yield text deltas until the request finishes."""
+        while True:
+            kind, value = await self.events.get()
+            if kind == "token":
+                yield value
+            elif kind == "error":
+                raise RuntimeError(value)
+            else:
+                return
+
+    async def collect(self) -> str:
+        return "".join([delta async for delta in self.stream()])
+
+
+class ContinuousBatchingEngine:
+    """
+    Iteration-level scheduler over one model. Running requests share one batched KV
+    cache: rows are left-padded to a common length (masked out), a joining request's
+    prefill cache is padded in, and finished rows are dropped and the padding columns
+    no row needs anymore are trimmed, so the cache buffer is reused instead of rebuilt.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size: int = MAX_BATCH_SIZE,
+                 max_batch_tokens: int = MAX_BATCH_TOKENS,
+                 max_prefills_per_step: int = MAX_PREFILLS_PER_STEP):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = next(model.parameters()).device
+        self.max_context = context_window(model)
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_prefills_per_step = max_prefills_per_step
+
+        self.waiting: Deque[Sequence] = deque()
+        self.running: List[Sequence] = []
+        self.cache: Optional[Tuple] = None
+        self.mask: Optional[torch.Tensor] = None
+        self.stats = {"requests": 0, "steps": 0, "tokens": 0, "max_batch": 0}
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------ API
+
+    def submit(self, prompt_ids: List[int], max_new_tokens: int, temperature: float,
+               top_p: float) -> Sequence:
+        seq = Sequence(prompt_ids, max_new_tokens, temperature, top_p, asyncio.get_running_loop())
+        with self._cond:
+            self.waiting.append(seq)
+            self.stats["requests"] += 1
+            self._cond.notify()
+        return seq
+
+    def start(self):
+        self._stop = False
+        self._thread = threading.Thread(target=self._loop, name="mistral-engine", daemon=True)
+        self._thread.start()
+        print(f"Engine started: batch {self.max_batch_size}, {self.max_batch_tokens} batch tokens, "
+              f"context {self.max_context}")
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    # ------------------------------------------------------------------ engine loop
+
+    def _admit(self) -> List[Sequence]:
+        """Take waiting requests that fit in the batch and the token budget."""
+        with self._cond:
+            while not self._stop and not self.waiting and not self.running:
+                self._cond.wait()
+            admitted = []
+            reserved = sum(seq.budget for seq in self.running)
+            while (self.waiting and len(admitted) < self.max_prefills_per_step
+                   and len(self.running) + len(admitted) < self.max_batch_size):
+                seq = self.waiting[0]
+                if seq.cancelled:
+                    self.waiting.popleft()
+                    continue
+                if (self.running or admitted) and reserved + seq.budget > self.max_batch_tokens:
+                    break
+                admitted.append(self.waiting.popleft())
+                reserved += seq.budget
+            return admitted
+
+    def _loop(self):
+        while True:
+            admitted = self._admit()
+            if self._stop:
+                break
+            try:
+                with torch.no_grad():
+                    for seq in admitted:
+                        self._prefill(seq)
+                    self._drop_finished()
+                    if self.running:
+                        self._decode_step()
+                        self._drop_finished()
+            except Exception as e:
+                print(f"Engine step failed: {e}")
+                for seq in self.running + [s for s in admitted if s not in self.running]:
+                    if seq.finish_reason is None:
+                        seq.push("error", f"Generation failed: {e}")
+                self.running, self.cache, self.mask = [], None, None
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+
+    def _prefill(self, seq: Sequence):
+        input_ids = torch.tensor([seq.prompt_ids], device=self.device)
+        out = self.model(input_ids=input_ids, use_cache=True)
+        seq.length = len(seq.prompt_ids)
+        self._join(seq, _legacy_cache(out.past_key_values))
+        self._emit(seq, self._sample(out.logits[:, -1, :], [seq])[0])
+
+    def _decode_step(self):
+        batch = self.running
+        input_ids = torch.tensor([[seq.next_token] for seq in batch], device=self.device)
+        position_ids = torch.tensor([[seq.length] for seq in batch], device=self.device)
+        mask = torch.cat([self.mask, self.mask.new_ones((len(batch), 1))], dim=1)
+        out = self.model(input_ids=input_ids, past_key_values=_model_cache(self.cache),
+                         attention_mask=mask, position_ids=position_ids, use_cache=True)
+        self.cache, self.mask = _legacy_cache(out.past_key_values), mask
+        for seq, token in zip(batch, self._sample(out.logits[:, -1, :], batch)):
+            seq.length += 1
+            self._emit(seq, token)
+        self.stats["steps"] += 1
+        self.stats["tokens"] += len(batch)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+
+    # ------------------------------------------------------------------ batch cache
+
+    def _join(self, seq: Sequence, cache: Tuple):
+        row_mask = torch.ones((1, seq.length), dtype=torch.long, device=self.device)
+        if self.cache is None:
+            self.cache, self.mask, self.running = cache, row_mask, [seq]
+            return
+        width, row_width = self.mask.shape[1], seq.length
+        if row_width > width:
+            self.cache = _pad_left(self.cache, row_width - width)
+            self.mask = F.pad(self.mask, (row_width - width, 0))
+        elif width > row_width:
+            cache = _pad_left(cache, width - row_width)
+            row_mask = F.pad(row_mask, (width - row_width, 0))
+        self.cache = tuple((torch.cat([k, rk]), torch.cat([v, rv]))
+                           for (k, v), (rk, rv) in zip(self.cache, cache))
+        self.mask = torch.cat([self.mask, row_mask])
+        self.running.append(seq)
+
+    def _drop_finished(self):
+        keep = [i for i, seq in enumerate(self.running) if seq.finish_reason is None and not seq.cancelled]
+        if len(keep) == len(self.running):
+            return
+        if not keep:
+            self.running, self.cache, self.mask = [], None, None
+            return
+        index = torch.tensor(keep, device=self.device)
+        cache = tuple((k.index_select(0, index), v.index_select(0, index)) for k, v in self.cache)
+        mask = self.mask.index_select(0, index)
+        # Leading columns that are padding in every remaining row are dead weight
+        unused = int((mask.sum(dim=0) == 0).long().cumprod(dim=0).sum())
+        if unused:
+            cache = tuple((k[:, :, unused:], v[:, :, unused:]) for k, v in cache)
+            mask = mask[:, unused:]
+        self.running = [self.running[i] for i in keep]
+        self.cache, self.mask = cache, mask
+
+    # ------------------------------------------------------------------ tokens
+
+    def _sample(self, logits: torch.Tensor, batch: List[Sequence]) -> List[int]:
+        tokens = []
+        for row, seq in zip(logits.float(), batch):
+            if seq.temperature <= 0:
+                tokens.append(int(row.argmax()))
+                continue
+            probs = torch.softmax(row / seq.temperature, dim=-1)
+            if seq.top_p < 1.0:
+                sorted_probs, order = probs.sort(descending=True)
+                sorted_probs[sorted_probs.cumsum(0) - sorted_probs > seq.top_p] = 0
+                probs = torch.zeros_like(probs).scatter_(0, order, sorted_probs)
+            tokens.append(int(torch.multinomial(probs, 1)))
+        return tokens
+
+    def _emit(self, seq: Sequence, token: int):
+        if token == self.tokenizer.eos_token_id:
+            seq.finish("stop")
+            return
+        seq.generated.append(token)
+        seq.next_token = token
+        # Decode the whole completion so multi-token characters come out whole
+        text = self.tokenizer.decode(seq.generated, skip_special_tokens=True)
+        if not text.endswith("\ufffd"):
+            delta, seq.text = text[len(seq.text):], text
+            if delta:
+                seq.push("token", delta)
+        if len(seq.generated) >= seq.max_new_tokens:
+            seq.finish("length")
+
+
+# ---------------------------------------------------------------------------
+# HTTP API
+# ---------------------------------------------------------------------------
 
 @app.on_event("startup")
 async def startup_event():
     """Load model on startup"""
+    global engine
     load_model()
+    engine = ContinuousBatchingEngine(model, tokenizer)
+    engine.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if engine is not None:
+        engine.stop()
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "model_loaded": model is not None}
+    return {
+        "status": "healthy",
+        "model_loaded": model is not None,
+        "running": len(engine.running) if engine else 0,
+        "waiting": len(engine.waiting) if engine else 0,
+        "engine": engine.stats if engine else None
+    }
+
+
+def _context_error(prompt_tokens: int, max_tokens: int) -> JSONResponse:
+    limit = engine.max_context
+    return JSONResponse(status_code=400, content={"error": {
+        "message": (f"This model's maximum context length is {limit} tokens. However, you requested "
+                    f"{prompt_tokens + max_tokens} tokens ({prompt_tokens} in the messages, "
+                    f"{max_tokens} in the completion). Please reduce the length of the messages "
+                    f"or completion."),
+        "type": "invalid_request_error",
+        "param": "messages",
+        "code": "context_length_exceeded"
+    }})
+
+
+async def _sse_chunks(seq: Sequence, completion_id: str, model_name: str):
+    """OpenAI-style `chat.completion.chunk` events, ending with [DONE]."""
+    def chunk(delta: Dict, finish_reason: Optional[str] = None) -> str:
+        body = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model_name,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        return f"data: {json.dumps(body)}\n\n"
+
+    try:
+        yield chunk({"role": "assistant"})
+        async for delta in seq.stream():
+            yield chunk({"content": delta})
+        yield chunk({}, seq.finish_reason or "stop")
+    except RuntimeError as e:
+        yield f"data: {json.dumps({'error': {'message': str(e), 'type': 'server_error'}})}\n\n"
+    finally:
+        # Client disconnected or done: the engine drops the row at the next iteration
+        seq.cancelled = True
+    yield "data: [DONE]\n\n"
 
 
 @app.post("/chat/completions")
 async def chat_completions(request: ChatCompletionRequest):
     """OpenAI-compatible chat completions endpoint"""
-    if model is None or tokenizer is None:
+    if engine is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
-    
+
+    prompt_ids = tokenizer.encode(build_prompt(request.messages))
+    max_tokens = request.max_tokens or 500
+    if max_tokens < 1:
+        raise HTTPException(status_code=400, detail="max_tokens must be at least 1")
+    # Nothing is truncated: a request that cannot fit is refused
+    if len(prompt_ids) + max_tokens > engine.max_context:
+        return _context_error(len(prompt_ids), max_tokens)
+
+    seq = engine.submit(
+        prompt_ids, max_tokens,
+        temperature=request.temperature if request.temperature is not None else 0.7,
+        top_p=request.top_p if request.top_p is not None else 0.9
+    )
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    if request.stream:
+        return StreamingResponse(_sse_chunks(seq, completion_id, request.model),
+                                 media_type="text/event-stream")
+
     try:
-        # Combine messages into a single prompt
-        prompt = ""
-        for message in request.messages:
-            if message.role == "system":
-                prompt += f"System: {message.content}\n"
-            elif message.role == "user":
-                prompt += f"User: {message.content}\n"
-            elif message.role == "assistant":
-                prompt += f"Assistant: {message.content}\n"
-        
-        prompt += "Assistant:"
-        
-        # Tokenize input
-        inputs = tokenizer.encode(prompt, return_tensors="pt", truncation=True, max_length=512)
-        
-        # Move to same device as model
-        if torch.cuda.is_available():
-            inputs = inputs.to(model.device)
-        
-        # Generate response
-        with torch.no_grad():
-            outputs = model.generate(
-                inputs,
-                max_new_tokens=min(request.max_tokens or 150, 150),
-                temperature=request.temperature or 0.7,
-                top_p=request.top_p or 0.9,
-                do_sample=True,
-                pad_token_id=tokenizer.pad_token_id,
-                eos_token_id=tokenizer.eos_token_id,
-                attention_mask=inputs.ne(tokenizer.pad_token_id)
-            )
-        
-        # Decode response
-        response_text = tokenizer.decode(outputs[0][inputs.shape[1]:], skip_special_tokens=True)
-        
-        # Clean up response
-        response_text = response_text.strip()
-        if not response_text:
-            response_text = "I understand your request for document classification. Please provide the document content."
-        
-        # Create response
-        response = ChatCompletionResponse(
-            id=f"chatcmpl-{uuid.uuid4().hex[:12]}",
-            created=int(time.time()),
-            model=request.model,
-            choices=[{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": response_text
-                },
-                "finish_reason": "stop"
-            }],
-            usage={
-                "prompt_tokens": inputs.shape[1],
-                "completion_tokens": len(tokenizer.encode(response_text)),
-                "total_tokens": inputs.shape[1] + len(tokenizer.encode(response_text))
-            }
-        )
-        
-        return response
-        
-    except Exception as e:
+        response_text = (await seq.collect()).strip()
+    except asyncio.CancelledError:
+        seq.cancelled = True
+        raise
+    except RuntimeError as e:
         print(f"Error generating response: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
 
+    if not response_text:
+        response_text = "I understand your request for document classification. Please provide the document content."
+
+    return ChatCompletionResponse(
+        id=completion_id,
+        created=int(time.time()),
+        model=request.model,
+        choices=[{
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": response_text
+            },
+            "finish_reason": seq.finish_reason or "stop"
+        }],
+        usage={
+            "prompt_tokens": len(prompt_ids),
+            "completion_tokens": len(seq.generated),
+            "total_tokens": len(prompt_ids) + len(seq.generated)
+        }
+    )
+
 
 @app.get("/")
 async def root():
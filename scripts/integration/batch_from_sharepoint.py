@@ -8,145 +8,189 @@ Prereqs:
   • helper modules: extract_all.py, embed_test.py, update_sharepoint.py
 """
 
-import os, uuid, requests, csv
-from msal   import ConfidentialClientApplication
+import os, uuid, csv
 from dotenv import load_dotenv
-from scripts.utils.extract_all import extract_text_from_file
+from scripts.utils.extract_all import CLASSIFY_MODE, extract_text_from_file
 from scripts.utils.embed_test import classify_with_llm
 from core.sharepoint_integration import update_metadata  # (item_id, filename, doc_type, doc_category)
+from core.graph_client import get_graph_client
+from core.sharepoint_crawler import FolderCrawler, drive_path
+from core.sharepoint_listing import ListingFilter, iter_list_items
+from core.sharepoint_delta import DeltaSync, delete_item_points
+from core.streaming_download import StreamingDownloader
+from core.change_index import CLASSIFY, DUPLICATE, UNCHANGED, ChangeIndex
 
 # ───────── 0. config ─────────
 load_dotenv()
-TENANT_ID  = os.getenv("TENANT_ID")
-CLIENT_ID  = os.getenv("CLIENT_ID")
-CLIENT_SEC = os.getenv("CLIENT_SECRET")
 SITE_ID    = os.getenv("SITE_ID")
 LIST_ID    = os.getenv("LIST_ID")
+# "delta": only files added/changed since the last delta run (token kept in data/sync)
+SYNC_MODE  = os.getenv("SP_SYNC_MODE", "full")
+# optional LISTING_EXTENSIONS / LISTING_MODIFIED_SINCE: skip other files while listing
+LISTING_FILTER = ListingFilter.from_env()
 
 # ───────── 1. auth ───────────
-app   = ConfidentialClientApplication(
-           CLIENT_ID,
-           authority=f"https://login.microsoftonline.com/{TENANT_ID}",
-           client_credential=CLIENT_SEC)
-tok   = app.acquire_token_for_client(["https://graph.microsoft.com/.default"])
-if not tok or "access_token" not in tok:
-    error_msg = tok.get('error_description', tok) if isinstance(tok, dict) else str(tok)
-    raise RuntimeError(f"Failed to acquire token: {error_msg}")
-HEADERS = {"Authorization": f"Bearer {tok['access_token']}"}
+# shared pooled client: caches/renews the token, retries throttling, caps concurrency
+graph = get_graph_client()
+graph.access_token()   # fail fast on bad credentials
 
 # ───────── 2. helpers ────────
 LOG_CSV      = "classification_log.csv"
 DOWNLOAD_DIR = "sp_batch_downloads"
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+# chunked, hashed, size-limited downloads (DOWNLOAD_MAX_BYTES, DOWNLOAD_TIMEOUT)
+downloader = StreamingDownloader()
 
 def append_log(fname, doc_type, cat, item_id):
     with open(LOG_CSV, "a", newline="") as fh:
         csv.writer(fh).writerow([fname, doc_type, cat, item_id])
 
-logged_files = set()
-if os.path.exists(LOG_CSV):
-    with open(LOG_CSV) as fh:
-        logged_files = {row[0] for row in csv.reader(fh)}
+# per-driveItem version + result of past runs (keyed by ID, not filename)
+change_index = ChangeIndex()
+
+# files that failed this run (download, extract/classify or SP update); in delta mode
+# the token is kept so they come back next run — the rest are skipped as unchanged
+failed_files = []
 
 # ---- LLM-prompt length guard ----
 MAX_MODEL_TOKENS    = 2048
 RESERVED_COMPLETION = 200
 SAFE_PROMPT_TOKENS  = MAX_MODEL_TOKENS - RESERVED_COMPLETION - 48   # spare room
 
+# Stop extracting once trim_for_llm has enough words (generous ~10 chars per word)
+EXTRACT_TARGET_CHARS = SAFE_PROMPT_TOKENS * 10
+
 def trim_for_llm(raw_text: str,
                  max_tokens: int = SAFE_PROMPT_TOKENS) -> str:
     """Keep only the first max_tokens words (~tokens)."""
     words = raw_text.split()
     return " ".join(words[:max_tokens]) if len(words) > max_tokens else raw_text
 
-def walk_folder(drive_id: str, item_id: str, depth: int = 0):
-    """Yield every file (recursively) inside a folder (max 3 levels)."""
-    if depth > 2:
-        return
-    url  = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/{item_id}/children"
-    resp = requests.get(url, headers=HEADERS)
-    if resp.status_code != 200:
-        print(f"❌  Graph error {resp.status_code} while reading children of {item_id}")
+def walk_folder(drive_id: str, item_id: str):
+    """Yield every file (recursively, breadth-first) inside a folder as it is listed."""
+    crawler = FolderCrawler(graph, listing_filter=LISTING_FILTER)
+    yield from crawler.iter_files([(drive_path(drive_id), item_id)])
+    if not crawler.complete:
+        print(f"⚠️  Listing incomplete: {len(crawler.failed_folders)} folder(s) could not be listed")
+
+def iter_cases():
+    """Yield (case_name, list item id, files) for every case folder."""
+    print("📋 Fetching Case-Management list …")
+    # only the name columns + each case's driveItem parent, in the same paged query
+    items = list(iter_list_items(graph, SITE_ID, LIST_ID))
+    items.sort(key=lambda it: it["fields"].get("FileLeafRef", "").lower())
+
+    for item in items:
+        item_id   = item["id"]
+        fields    = item["fields"]
+        case_name = (fields.get("FileLeafRef") or
+                     fields.get("Title") or f"Item {item_id}")
+
+        # locate drive/folder backing the Case
+        parent = item.get("driveItem", {}).get("parentReference")
+        if not parent:
+            print(f"⚠️  Skipping {case_name} — no drive item")
+            continue
+        yield case_name, item_id, walk_folder(parent["driveId"], parent["id"])
+
+def iter_delta_changes(delta):
+    """Yield changed files as one pseudo-case; deleted files leave the vector DB."""
+    changes = delta.fetch_changes()
+    if changes.deleted:
+        from qdrant_client import QdrantClient
+        qdrant = QdrantClient(url=os.getenv("QDRANT_URL", "http://localhost:6333"),
+                              api_key=os.getenv("QDRANT_API_KEY"))
+        delete_item_points(qdrant, changes.deleted)
+        change_index.forget(changes.deleted)
+        print(f"🗑️  Removed {len(changes.deleted)} deleted files from the vector DB")
+    yield "changes since last sync", None, [c for c in changes.changed if LISTING_FILTER.accepts(c)]
+    # Only reached once every change was handled (MAX_FILES stops the loop early)
+    if failed_files:
+        print(f"⚠️  Keeping the delta token: {len(failed_files)} file(s) failed and will be retried next run")
         return
-    for child in resp.json().get("value", []):
-        if "file" in child:
-            yield child
-        elif "folder" in child:
-            yield from walk_folder(drive_id, child["id"], depth + 1)
+    delta.save_delta_link(changes.delta_link)
 
 # ───────── 3. fetch cases ─────
-print("📋 Fetching Case-Management list …")
-items_url = (f"https://graph.microsoft.com/v1.0/sites/{SITE_ID}"
-             f"/lists/{LIST_ID}/items?$expand=fields&$top=9999")
-items = requests.get(items_url, headers=HEADERS).json().get("value", [])
-items.sort(key=lambda it: it["fields"].get("FileLeafRef", "").lower())
+if SYNC_MODE == "delta":
+    cases = iter_delta_changes(DeltaSync(SITE_ID, graph.access_token(), session=graph))
+else:
+    cases = iter_cases()
 
 # ───────── 4. main loop ───────
 processed_files = 0
 MAX_FILES = 5  # Limit for test run
-for item in items:
+for case_name, item_id, files_found in cases:
     if processed_files >= MAX_FILES:
         break
-    item_id   = item["id"]
-    fields    = item["fields"]
-    case_name = (fields.get("FileLeafRef") or
-                 fields.get("Title") or f"Item {item_id}")
-
-    # 4-A. locate drive/folder backing the Case
-    di = requests.get(
-        f"https://graph.microsoft.com/v1.0/sites/{SITE_ID}"
-        f"/lists/{LIST_ID}/items/{item_id}/driveItem",
-        headers=HEADERS).json()
-    drive_id, folder_id = di["parentReference"]["driveId"], di["parentReference"]["id"]
-
-    # 4-B. collect files
-    files_found = list(walk_folder(drive_id, folder_id))
-    if not files_found:
-        print(f"⚠️  Skipping {case_name} — no files found")
-        continue
 
     print(f"📁 Processing folder {case_name} …")
+    found = 0
     for child in files_found:
+        found += 1
         filename     = child["name"]
         download_url = child.get("@microsoft.graph.downloadUrl")
 
         if not download_url:
             print(f"   • ⚠️  {filename} – no download URL")
             continue
-        if filename in logged_files:
-            print(f"   • ✅ Already processed {filename}")
+        # update SharePoint metadata of this item (delta changes carry their own list item ID)
+        target_id = item_id or child.get("sharepointIds", {}).get("listItemId")
+
+        # same content as when last classified (our own metadata write-back only bumps the eTag)
+        check = change_index.check(CLASSIFY, child)
+        if check.status == UNCHANGED:
+            print(f"   • ✅ Unchanged since last run: {filename}")
+            continue
+        # identical file elsewhere in the library: reuse its classification
+        if check.status == DUPLICATE and check.result:
+            doc_type, doc_cat = check.result["doc_type"], check.result["doc_category"]
+            status = update_metadata(item_id=target_id, filename=filename,
+                                     doc_type=doc_type, doc_category=doc_cat)
+            print(f"   • ♻️  {filename} = {check.source_item_id} → {doc_type} / {doc_cat} (SP update: {status})")
+            if status:
+                append_log(filename, doc_type, doc_cat, target_id)
+                change_index.record(CLASSIFY, child, check.result)
+            else:
+                failed_files.append(child["id"])
             continue
 
         # download
         local_path = os.path.join(DOWNLOAD_DIR, f"{uuid.uuid4()}_{filename}")
         try:
-            with open(local_path, "wb") as fh:
-                fh.write(requests.get(download_url).content)
+            download = downloader.download(download_url, local_path, session=graph.session)
         except Exception as e:
             print(f"   • ❌ Download failed for {filename}: {e}")
+            failed_files.append(child["id"])
             continue
 
         try:
             # extract & classify (with trim)
-            raw_text          = extract_text_from_file(local_path)
+            raw_text          = extract_text_from_file(local_path, digest=download.sha256,
+                                                       mode=CLASSIFY_MODE,
+                                                       target_chars=EXTRACT_TARGET_CHARS)
             prompt_text       = trim_for_llm(raw_text)
             doc_type, doc_cat = classify_with_llm(prompt_text)
             print(f"   • {filename} → {doc_type} / {doc_cat}")
 
-            # update SharePoint metadata
-            status = update_metadata(item_id=item_id,
+            status = update_metadata(item_id=target_id,
                                      filename=filename,
                                      doc_type=doc_type,
                                      doc_category=doc_cat)
             print(f"     ↳ SP update: {status}")
 
-            append_log(filename, doc_type, doc_cat, item_id)
-            logged_files.add(filename)
+            append_log(filename, doc_type, doc_cat, target_id)
+            if status:
+                change_index.record(CLASSIFY, child, {"doc_type": doc_type, "doc_category": doc_cat})
+            else:
+                failed_files.append(child["id"])
             processed_files += 1
             if processed_files >= MAX_FILES:
                 break
         except Exception as exc:
             print(f"   • ❌ Failed on {filename}: {exc}")
+            failed_files.append(child["id"])
+    if not found:
+        print(f"⚠️  Skipping {case_name} — no files found")
     if processed_files >= MAX_FILES:
         break
 
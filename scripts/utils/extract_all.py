@@ -2,82 +2,179 @@
 """
 Text extraction utilities for various document formats
 """
+import logging
 import os
 import re
 from pathlib import Path
+from typing import Iterable, Iterator
 from docx import Document
-import fitz  # PyMuPDF
 from PIL import Image
 import pytesseract
 
+from core.extraction_cache import file_digest, get_extraction_cache, make_key
+from core.page_extraction import MIN_TEXT_CHARS, STREAM_WINDOW_PAGES, iter_pdf_pages
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_HYPHEN_BREAK_RE = re.compile(r'-\s+')
+
 def clean_text(raw: str) -> str:
     """Cleans up extracted text: removes hyphenation and excess newlines."""
     if not raw:
         return ""
     
-    # Remove excessive whitespace
-    cleaned = re.sub(r'\s+', ' ', raw)
+    # Remove excessive whitespace (this also collapses line breaks)
+    cleaned = _WHITESPACE_RE.sub(' ', raw)
     
     # Remove hyphenation at line breaks
-    cleaned = re.sub(r'-\s+', '', cleaned)
-    
-    # Normalize line breaks
-    cleaned = re.sub(r'\n+', '\n', cleaned)
+    cleaned = _HYPHEN_BREAK_RE.sub('', cleaned)
     
     return cleaned.strip()
 
-def extract_text_from_file(file_path: str) -> str:
-    """Extracts and returns cleaned text from a DOCX, PDF, or image file."""
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File not found: {file_path}")
-    
-    ext = Path(file_path).suffix.lower()
-    raw_text = ""
+def iter_clean_pages(raw_pages: Iterable[str]) -> Iterator[str]:
+    """
+    Clean pages one at a time.
+
+    A word hyphenated across a page break is rejoined onto the earlier page, so each
+    page is yielded once the following page has been read.
+    """
+    pending = None
+    for raw in raw_pages:
+        text = _WHITESPACE_RE.sub(' ', raw or "").strip()
+        if pending is not None:
+            if pending.endswith("-") and text:
+                word, _, text = text.partition(" ")
+                pending = pending[:-1] + word
+            yield clean_text(pending)
+        pending = text
+    if pending is not None:
+        yield clean_text(pending)
 
+# Extractor identity for the content-addressed cache
+EXTRACTOR_NAME = "extract_all"
+EXTRACTOR_SETTINGS = {"ocr": "tesseract", "min_text_chars": MIN_TEXT_CHARS}
+
+# Extraction modes: "full" reads every page (embedding/indexing), "classify" stops once
+# there is enough text for the classifier prompt (it reads at most the first 2500 chars)
+FULL_MODE = "full"
+CLASSIFY_MODE = "classify"
+CLASSIFY_TARGET_CHARS = int(os.getenv("CLASSIFY_TARGET_CHARS", "3000"))
+# Smaller OCR windows in classify mode so OCR stops close to the target
+CLASSIFY_OCR_WINDOW = int(os.getenv("CLASSIFY_OCR_WINDOW", "2"))
+
+def _iter_raw_pages(file_path: str, ext: str, window: int = STREAM_WINDOW_PAGES) -> Iterator[str]:
+    """Extract uncleaned text per page (one entry for non-paginated formats)."""
     if ext == ".docx":
         doc = Document(file_path)
-        raw_text = "\n".join(p.text for p in doc.paragraphs)
+        yield "\n".join(p.text for p in doc.paragraphs)
 
     elif ext == ".pdf":
-        pdf = fitz.open(file_path)
-        for page in pdf:
-            pg_text = None
-            # Try to extract text using dir() to avoid attribute errors
-            for method in ("get_text", "getText"):
-                if method in dir(page):
-                    try:
-                        pg_text = getattr(page, method)()
-                        break
-                    except Exception:
-                        continue
-            if pg_text and pg_text.strip():
-                raw_text += pg_text
-            else:
-                # fallback to OCR if no text found
-                pix = None
-                for method in ("get_pixmap", "getPixmap"):
-                    if method in dir(page):
-                        try:
-                            pix = getattr(page, method)(dpi=300)
-                            break
-                        except Exception:
-                            continue
-                if pix is not None:
-                    img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
-                    raw_text += pytesseract.image_to_string(img)
-                else:
-                    print("OCR failed for page: no pixmap method found")
-            raw_text += "\n\n"
-        pdf.close()
+        # Text-layer pages are read directly; only image-only/mixed pages are OCR'd
+        for _, text in iter_pdf_pages(file_path, window=window):
+            yield text
 
     elif ext in [".jpg", ".jpeg", ".png"]:
         img = Image.open(file_path).convert("RGB")
-        raw_text = pytesseract.image_to_string(img)
+        yield pytesseract.image_to_string(img)
 
     else:
         raise ValueError(f"Unsupported file type: {ext}")
 
-    return clean_text(raw_text)
+def _classify_key(digest: str, target_chars: int) -> str:
+    """Cache key for the text prefix kept by a classify-mode extraction."""
+    settings = dict(EXTRACTOR_SETTINGS, mode=CLASSIFY_MODE, target_chars=target_chars)
+    return make_key(digest, EXTRACTOR_NAME, settings)
+
+def cached_text_for_digest(digest: str, mode: str = FULL_MODE):
+    """
+    Return cleaned text for already-extracted content with this SHA-256, or None.
+    In classify mode the prefix kept by an earlier classification also counts.
+    """
+    cache = get_extraction_cache()
+    if cache is None:
+        return None
+    entry = cache.get(make_key(digest, EXTRACTOR_NAME, EXTRACTOR_SETTINGS))
+    if entry is not None:
+        return " ".join(page for page in iter_clean_pages(entry["pages"]) if page)
+    if mode == CLASSIFY_MODE:
+        entry = cache.get(_classify_key(digest, CLASSIFY_TARGET_CHARS))
+        if entry is not None:
+            return " ".join(entry["pages"])
+    return None
+
+def iter_pages(file_path: str, digest: str = None, window: int = STREAM_WINDOW_PAGES) -> Iterator[str]:
+    """
+    Yields cleaned text page by page from a DOCX, PDF, or image file.
+    Pages are extracted (and OCR'd) lazily, `window` PDF pages at a time, so callers can
+    stop once they have enough text. Results are cached by content hash; pass `digest`
+    if the SHA-256 is already known.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    
+    ext = Path(file_path).suffix.lower()
+    if ext not in (".docx", ".pdf", ".jpg", ".jpeg", ".png"):
+        raise ValueError(f"Unsupported file type: {ext}")
+
+    cache = get_extraction_cache()
+    if cache is None:
+        raw_pages = _iter_raw_pages(file_path, ext, window)
+    else:
+        raw_pages = cache.iter_or_extract(
+            file_path, EXTRACTOR_NAME, EXTRACTOR_SETTINGS,
+            lambda: _iter_raw_pages(file_path, ext, window),
+            digest=digest
+        )
+    yield from iter_clean_pages(raw_pages)
+
+def extract_text_from_file(file_path: str, digest: str = None, mode: str = FULL_MODE,
+                           target_chars: int = None) -> str:
+    """
+    Extracts and returns cleaned text from a DOCX, PDF, or image file.
+    Results are cached by content hash; pass `digest` if the SHA-256 is already known.
+
+    In classify mode extraction stops (no further rendering or OCR) once `target_chars`
+    (default CLASSIFY_TARGET_CHARS) of text have been read; use full mode for indexing.
+    The full cache entry is only written once every page has been read, so the prefix
+    read here is cached under its own key and reused by the next classification.
+    """
+    if mode == FULL_MODE:
+        return " ".join(page for page in iter_pages(file_path, digest=digest) if page)
+    if mode != CLASSIFY_MODE:
+        raise ValueError(f"Unknown extraction mode: {mode}")
+
+    target = target_chars or CLASSIFY_TARGET_CHARS
+    cache = get_extraction_cache()
+    prefix_key = None
+    if cache is not None:
+        digest = digest or file_digest(file_path)
+        prefix_key = _classify_key(digest, target)
+        entry = cache.get(prefix_key)
+        if entry is not None:
+            logger.info(f"♻️ Classification prefix cache hit for {Path(file_path).name}")
+            return " ".join(entry["pages"])
+
+    pages = iter_pages(file_path, digest=digest, window=CLASSIFY_OCR_WINDOW)
+    collected = []
+    length = 0
+    stopped_early = False
+    try:
+        for page in pages:
+            if page:
+                collected.append(page)
+                length += len(page) + 1
+            if length >= target:
+                logger.info(f"✂️ Stopped extraction of {Path(file_path).name} after {len(collected)} "
+                            f"page(s) ({length} chars) for classification")
+                stopped_early = True
+                break
+    finally:
+        # Releases the open document before any further pages are rendered
+        pages.close()
+    if stopped_early and prefix_key is not None:
+        cache.put(prefix_key, collected, {"target_chars": target})
+    return " ".join(collected)
 
 if __name__ == "__main__":
     # Test extraction
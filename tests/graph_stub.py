@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Local Microsoft Graph stand-in for tests.
+
+Serves scripted responses on 127.0.0.1 over keep-alive HTTP/1.1 and records every
+request, the connections used and the peak number of requests in flight.
+
+    with GraphStub() as graph:
+        graph.add("GET", "/sites/s1/drive", (429, None, {"Retry-After": "0"}), (200, {"id": "d1"}))
+        client = GraphClient(..., graph_root=graph.url)
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+# (status, JSON body or None, headers) - or a callable taking the request record
+Reply = Union[Tuple, Callable[[Dict], Tuple]]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        stub: "GraphStub" = self.server.stub
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        request = {
+            "method": self.command,
+            "path": url.path,
+            "query": parse_qs(url.query),
+            "headers": dict(self.headers),
+            "json": json.loads(raw) if raw else None,
+            "connection": self.client_address,
+        }
+        status, body, headers = stub._respond(request)
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _handle
+
+
+class GraphStub:
+    """Scripted HTTP server standing in for graph.microsoft.com."""
+
+    def __init__(self, delay: float = 0.0):
+        """
+        Args:
+            delay: Seconds each request is held open (to observe concurrency)
+        """
+        self.delay = delay
+        self.routes: Dict[Tuple[str, str], List[Reply]] = {}
+        self.requests: List[Dict] = []
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def add(self, method: str, path: str, *replies: Reply):
+        """Script replies for a route; they are served in order and the last one repeats."""
+        self.routes[(method.upper(), path)] = list(replies)
+
+    def calls(self, path: str) -> List[Dict]:
+        return [r for r in self.requests if r["path"] == path]
+
+    def _respond(self, request: Dict) -> Tuple:
+        with self._lock:
+            self.requests.append(request)
+            self.connections.add(request["connection"])
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            replies = self.routes.get((request["method"], request["path"]))
+            reply = (replies.pop(0) if len(replies) > 1 else replies[0]) if replies else (404, {}, {})
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            reply = reply(request) if callable(reply) else reply
+            status, body, headers = (tuple(reply) + (None, None))[:3]
+            return status, body, headers
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def start(self) -> "GraphStub":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "GraphStub":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
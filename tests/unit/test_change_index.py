@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the SharePoint change-detection index
+"""
+
+import pytest
+import os
+import sys
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from core.change_index import (
+    CHANGED, CLASSIFY, DUPLICATE, EMBED, NEW, UNCHANGED, ChangeIndex
+)
+
+
+def drive_item(item_id, name="a.pdf", etag="e1", ctag="c1", size=100, qxh="h1"):
+    item = {"id": item_id, "name": name, "eTag": etag, "cTag": ctag, "size": size}
+    if qxh:
+        item["file"] = {"hashes": {"quickXorHash": qxh}}
+    return item
+
+
+class TestChangeIndex:
+    """Test suite for skip-if-unchanged and duplicate detection"""
+
+    @pytest.fixture
+    def index(self, tmp_path):
+        return ChangeIndex(str(tmp_path / "change_index.db"))
+
+    def test_unchanged_content_is_skipped_despite_metadata_edits(self, index):
+        """Test that an eTag-only change (our own write-back) counts as unchanged"""
+        result = {"doc_type": "Motion", "doc_category": "Civil"}
+        assert index.check(CLASSIFY, drive_item("1")).status == NEW
+
+        index.record(CLASSIFY, drive_item("1"), result)
+
+        check = index.check(CLASSIFY, drive_item("1", etag="e2"))
+        assert check.status == UNCHANGED and check.result == result
+        assert index.check(CLASSIFY, drive_item("1", ctag="c2", qxh="h2")).status == CHANGED
+        assert index.check(EMBED, drive_item("1")).status == NEW  # scopes are independent
+
+    def test_fallbacks_without_hashes(self, index):
+        """Test cTag, then eTag comparison when Graph reports no hash"""
+        index.record(EMBED, drive_item("1", qxh=None))
+        assert index.check(EMBED, drive_item("1", etag="e9", qxh=None)).status == UNCHANGED
+        assert index.check(EMBED, drive_item("1", ctag="c2", qxh=None)).status == CHANGED
+
+        index.record(EMBED, drive_item("2", ctag=None, qxh=None))
+        assert index.check(EMBED, drive_item("2", ctag=None, qxh=None)).status == UNCHANGED
+        assert index.check(EMBED, drive_item("2", etag="e2", ctag=None, qxh=None)).status == CHANGED
+
+    def test_same_name_in_different_folders_is_not_confused(self, index):
+        """Test that items are keyed by ID, and identical content is found across folders"""
+        result = {"doc_type": "Motion", "doc_category": "Civil"}
+        index.record(CLASSIFY, drive_item("case1-file", name="Evidence.pdf", qxh="h1"), result)
+
+        other = index.check(CLASSIFY, drive_item("case2-file", name="Evidence.pdf", qxh="h2", ctag="c2"))
+        assert other.status == NEW
+
+        copy = index.check(CLASSIFY, drive_item("case3-file", name="Scan 12.pdf", ctag="c9"))
+        assert copy.status == DUPLICATE
+        assert copy.source_item_id == "case1-file" and copy.result == result
+        assert index.check(CLASSIFY, drive_item("case4-file", ctag="c9", size=101)).status == NEW
+
+    def test_forget_and_persistence(self, tmp_path):
+        """Test deletion handling and reopening the database"""
+        path = str(tmp_path / "change_index.db")
+        index = ChangeIndex(path)
+        index.record(CLASSIFY, drive_item("1"), {"doc_type": "Motion"})
+        index.record(EMBED, drive_item("1"))
+        index.record(CLASSIFY, drive_item("2", qxh="h2"))
+        index.close()
+
+        reopened = ChangeIndex(path)
+        assert reopened.check(CLASSIFY, drive_item("1")).result == {"doc_type": "Motion"}
+        assert reopened.forget(["1"]) == 2
+        assert reopened.check(CLASSIFY, drive_item("1")).status == NEW
+        assert reopened.check(CLASSIFY, drive_item("2", qxh="h2")).status == UNCHANGED
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Tests for the bulk ingestion checkpoint store
+"""
+
+import pytest
+import json
+import os
+import sys
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from embedding.checkpoint_store import (
+    CheckpointStore, DOWNLOADED, EMBEDDED, FAILED, parse_partition
+)
+
+
+class TestCheckpointStore:
+    """Test suite for per-file bulk progress"""
+
+    @pytest.fixture
+    def db_path(self, tmp_path):
+        return str(tmp_path / "progress.db")
+
+    def test_states_persist_across_reopen(self, db_path):
+        """Test per-file state transitions survive a restart"""
+        store = CheckpointStore(db_path)
+        store.mark("a", DOWNLOADED, name="a.pdf", etag="e1", content_hash="h1")
+        store.mark("a", EMBEDDED)
+        store.mark("b", DOWNLOADED, name="b.pdf")
+        store.mark_failed("c", "extract", "no text extracted", name="c.pdf")
+        store.close()
+
+        reopened = CheckpointStore(db_path)
+        assert reopened.is_embedded("a")
+        assert not reopened.is_embedded("b")
+        assert reopened.counts()[EMBEDDED] == 1
+        assert reopened.counts()[DOWNLOADED] == 1
+        assert reopened.failed_items() == [{"file_id": "c", "filename": "c.pdf", "stage": "extract",
+                                            "error": "no text extracted", "attempts": 1}]
+
+    def test_changed_files_are_not_embedded(self, db_path):
+        """Test eTag/hash change detection, with the content hash taking precedence"""
+        store = CheckpointStore(db_path)
+        store.mark("a", EMBEDDED, etag="e1", content_hash="h1")
+
+        assert store.is_embedded("a", etag="e1", content_hash="h1")
+        assert store.is_embedded("a", etag="e2", content_hash="h1")  # metadata-only edit
+        assert not store.is_embedded("a", etag="e2", content_hash="h2")
+        assert not store.is_embedded("a", etag="e2")
+
+        store.mark_failed("a", "download", "timeout")
+        assert not store.is_embedded("a")
+
+    def test_legacy_json_is_migrated_once(self, db_path, tmp_path):
+        """Test import of bulk_progress.json and that it is not re-read"""
+        legacy = tmp_path / "bulk_progress.json"
+        legacy.write_text(json.dumps({
+            "processed_items": ["a", "b", "a"],
+            "failed_items": [{"file_id": "c", "filename": "c.pdf", "error": "boom"}],
+            "total_files_found": 10,
+            "collection_name": "complete_project_library",
+            "last_batch": 3
+        }))
+
+        store = CheckpointStore(db_path, legacy_json=str(legacy))
+
+        assert not legacy.exists()
+        assert (tmp_path / "bulk_progress.json.migrated").exists()
+        assert store.embedded_ids() == {"a", "b"}
+        summary = store.summary()
+        assert summary["total_files_found"] == 10
+        assert summary["total_files_processed"] == 2
+        assert summary["states"][FAILED] == 1
+        assert summary["last_update"] is None
+
+    def test_workers_sharing_a_store_never_claim_the_same_unit(self, db_path):
+        """Test work stealing: ordered, disjoint claims that together cover everything"""
+        first, second = CheckpointStore(db_path), CheckpointStore(db_path)
+        first.register((f"id{n:02d}", None, None, None) for n in range(10))
+        first.mark("id03", EMBEDDED)
+
+        claimed_a = first.claim("a", 4)
+        claimed_b = second.claim("b", 4)
+        claimed_a += first.claim("a", 4)
+
+        assert claimed_a[:4] == ["id00", "id01", "id02", "id04"]
+        assert not set(claimed_a) & set(claimed_b)
+        assert sorted(claimed_a + claimed_b) == [f"id{n:02d}" for n in range(10) if n != 3]
+        assert first.claim("a", 4) == []
+
+    def test_expired_and_released_leases_are_reclaimed(self, db_path):
+        """Test that a crashed worker's units come back, finished ones do not"""
+        store = CheckpointStore(db_path)
+        store.register([("a", None, None, None), ("b", None, None, None), ("c", None, None, None)])
+
+        assert store.claim("crashed", 2, lease_seconds=-1) == ["a", "b"]
+        assert store.claim("alive", 3) == ["a", "b", "c"]
+        store.mark("a", EMBEDDED)
+        store.release("alive")
+        assert store.claim("next", 3) == ["b", "c"]
+
+    def test_register_resets_only_changed_embedded_units(self, db_path):
+        """Test change detection on re-listing, including units embedded by another worker"""
+        store, other = CheckpointStore(db_path), CheckpointStore(db_path)
+        store.register([("a", "a.pdf", "e1", "h1"), ("b", "b.pdf", "e1", "h1")])
+        other.mark("a", EMBEDDED)
+        other.mark("b", EMBEDDED)
+
+        # `store` has a stale view; unchanged "a" must stay embedded
+        store.register([("a", "a.pdf", "e2", "h1"), ("b", "b.pdf", "e2", "h2")])
+
+        assert store.claim("w", 10) == ["b"]
+        assert CheckpointStore(db_path).is_embedded("a")
+
+    def test_partitions_split_the_id_space(self, db_path, tmp_path):
+        """Test that k/N partitions are disjoint and complete"""
+        ids = [f"item-{n}" for n in range(50)]
+        claimed = []
+        for k in range(3):
+            store = CheckpointStore(str(tmp_path / f"host{k}.db"))
+            store.register((item_id, None, None, None) for item_id in ids)
+            claimed.append(set(store.claim(f"host{k}", 100, partition=parse_partition(f"{k}/3"))))
+
+        assert all(claimed)
+        assert sum(len(part) for part in claimed) == 50
+        assert set().union(*claimed) == set(ids)
+        with pytest.raises(ValueError):
+            parse_partition("3/3")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for the structure-aware chunker
+"""
+
+import pytest
+import os
+import sys
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from embedding.chunking import approx_token_count, chunk_pages, index_chunks, slice_pages
+
+
+@pytest.fixture
+def pages():
+    """Pages shaped like our extraction output: paragraphs, a blank page and run-on OCR text"""
+    return [
+        "NOTICE TO APPEAR\n\nYou are ordered to appear before an immigration judge.\n\n"
+        "The hearing will be held at the address below on the date shown.",
+        "",
+        "ocr text without punctuation " * 60,
+        "Respondent signature and date.",
+    ]
+
+
+class TestChunking:
+    """Test suite for page/paragraph-aware chunking"""
+
+    def test_offsets_rebuild_chunk_text(self, pages):
+        """Test that payload offsets alone recover each chunk's text"""
+        chunks = list(chunk_pages(pages, "doc-1", target_tokens=50, overlap_tokens=10))
+
+        assert len(chunks) > 2
+        for chunk in chunks:
+            payload = chunk.payload()
+            assert "text" not in payload
+            assert payload["doc_id"] == "doc-1"
+            assert slice_pages(pages, payload) == chunk.text
+
+    def test_chunks_respect_target_and_overlap(self, pages):
+        """Test token target and overlap between consecutive chunks on run-on text"""
+        chunks = list(chunk_pages(pages, "doc-1", target_tokens=50, overlap_tokens=10))
+
+        assert all(approx_token_count(chunk.text) <= 50 for chunk in chunks)
+        run_on = [chunk for chunk in chunks if chunk.page_start == chunk.page_end == 2]
+        for previous, current in zip(run_on, run_on[1:]):
+            assert current.char_start < previous.char_end
+
+    def test_paragraphs_are_not_split_when_they_fit(self, pages):
+        """Test that the first page's short paragraphs stay whole and in order"""
+        first = next(chunk_pages(pages, "doc-1", target_tokens=200, overlap_tokens=0))
+
+        assert first.text.startswith("NOTICE TO APPEAR\n\nYou are ordered")
+        assert first.page_start == 0
+
+    def test_pages_are_consumed_lazily(self):
+        """Test that the chunker only reads as many pages as the consumer needs"""
+        read = []
+
+        def page_source():
+            for n in range(100):
+                read.append(n)
+                yield f"Page {n} paragraph with some words in it. " * 10
+
+        chunks = chunk_pages(page_source(), "doc-1", target_tokens=100, overlap_tokens=10)
+        next(chunks)
+
+        assert len(read) <= 3
+
+    def test_index_chunks_batches_and_uses_deterministic_ids(self, pages):
+        """Test batched encoding, bulk upserts and stable point IDs"""
+        encode_calls, upserts = [], []
+
+        def encode(texts):
+            encode_calls.append(len(texts))
+            return [[0.1, 0.2, 0.3] for _ in texts]
+
+        chunks = list(chunk_pages(pages, "doc-1", target_tokens=30, overlap_tokens=5))
+        total = index_chunks(iter(chunks), encode, upserts.append, extra_payload={"filename": "nta.pdf"},
+                             encode_batch_size=4, upsert_batch_size=3)
+
+        assert total == len(chunks)
+        assert max(encode_calls) == 4
+        assert all(len(batch) <= 3 for batch in upserts)
+        points = [point for batch in upserts for point in batch]
+        assert points[0].payload["filename"] == "nta.pdf"
+        assert [p.id for p in points] == [c.point_id for c in chunk_pages(pages, "doc-1", 30, 5)]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests for the batched EmbeddingGenerator
+"""
+
+import pytest
+import importlib
+import os
+import sys
+import types
+from unittest.mock import patch
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from qdrant_client import QdrantClient
+
+
+class FakeSentenceTransformer:
+    """Deterministic bag-of-characters encoder standing in for the real model"""
+
+    def __init__(self, model_name):
+        self.calls = []
+
+    def get_sentence_embedding_dimension(self):
+        return 16
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(len(texts))
+        vectors = np.zeros((len(texts), 16), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for char in text.lower():
+                vectors[row, ord(char) % 16] += 1.0
+        return vectors + 1e-3
+
+
+@pytest.fixture
+def generator_module():
+    fake = types.ModuleType("sentence_transformers")
+    fake.SentenceTransformer = FakeSentenceTransformer
+    with patch.dict(sys.modules, {"sentence_transformers": fake}):
+        sys.modules.pop("embedding.create_embeddings", None)
+        module = importlib.import_module("embedding.create_embeddings")
+        yield module
+    sys.modules.pop("embedding.create_embeddings", None)
+
+
+@pytest.fixture
+def generator(generator_module):
+    client = QdrantClient(":memory:")
+    with patch.object(generator_module, "QdrantClient", return_value=client):
+        yield generator_module.EmbeddingGenerator(collection_name="test_docs", encode_batch_size=4,
+                                                  upsert_batch_size=5, upload_parallel=2,
+                                                  target_tokens=40, overlap_tokens=8)
+
+
+@pytest.fixture
+def processed_dir(tmp_path):
+    """Processed text files in the OCR step's output format"""
+    body = "[Page 1]\nNOTICE TO APPEAR in removal proceedings.\n\n" + "The respondent shall appear. " * 30 + \
+           "\n[Page 2]\nSigned by the immigration officer.\n"
+    for name, text in [("a_processed.txt", body), ("b_processed.txt", body),
+                       ("c_processed.txt", "Form I-864 affidavit of support. " * 20)]:
+        (tmp_path / name).write_text(
+            f"Document: {name.replace('_processed.txt', '.pdf')}\nProcessed: 2025-05-27 04:50:19\n"
+            f"{'=' * 50}\n\n{text}", encoding="utf-8"
+        )
+    return tmp_path
+
+
+class TestEmbeddingGenerator:
+    """Test suite for chunked, batched, idempotent indexing"""
+
+    def test_text_file_pages_and_header(self, generator_module, processed_dir):
+        """Test header parsing and [Page n] splitting"""
+        header, pages = generator_module.iter_text_file_pages(processed_dir / "a_processed.txt")
+        pages = list(pages)
+
+        assert header["document"] == "a.pdf"
+        assert len(pages) == 2
+        assert pages[1].strip() == "Signed by the immigration officer."
+
+    def test_process_directory_is_idempotent(self, generator, processed_dir):
+        """Test duplicate content is skipped and re-runs write nothing new"""
+        first = generator.process_directory(processed_dir)
+
+        assert first["successful_files"] == 3
+        assert first["skipped_duplicates"] == 1
+        assert first["total_embeddings"] > 3
+        assert first["vectors_per_second"] > 0
+        count = generator.qdrant_client.count("test_docs").count
+        assert count == first["total_embeddings"]
+
+        second = generator.process_directory(processed_dir)
+        assert second["skipped_duplicates"] == 3
+        assert second["total_embeddings"] == 0
+        assert generator.qdrant_client.count("test_docs").count == count
+
+    def test_encode_is_batched(self, generator, processed_dir):
+        """Test that chunks are encoded in batches of the configured size"""
+        generator.process_text_file(processed_dir / "a_processed.txt")
+
+        calls = generator.embedding_model.calls
+        assert max(calls) == 4
+        assert len(calls) < sum(calls)
+
+    def test_points_carry_offsets_not_text(self, generator, processed_dir):
+        """Test payload contents and search results"""
+        generator.process_directory(processed_dir)
+        results = generator.search_similar("affidavit of support", limit=2)
+
+        assert results and {"filename", "score", "doc_id", "page_start", "char_end"} <= set(results[0])
+        assert "text" not in results[0]
+
+    def test_create_embedding_for_file_reports_chunks(self, generator):
+        """Test the bulk SharePoint processor's entry point"""
+        result = generator.create_embedding_for_file(
+            {"filename": "bond.pdf", "processed_text": "Bond notice for the respondent. " * 40, "item_id": "17"}
+        )
+
+        assert result["chunks_created"] > 1
+        assert generator.stats()["vectors"] == result["chunks_created"]
+
+
+    def test_same_content_under_two_items_survives_deleting_one(self, generator):
+        """Test that dedupe is per item, so a deletion only removes that item's points"""
+        from core.sharepoint_delta import delete_item_points
+
+        pages = ["Bond notice for the respondent. " * 40]
+        first = generator.index_pages(pages, "bond.pdf", extra_payload={"item_id": "17"})
+        copy = generator.index_pages(pages, "bond (copy).pdf", extra_payload={"item_id": "18"})
+        again = generator.index_pages(pages, "bond.pdf", extra_payload={"item_id": "17"})
+
+        assert first and len(copy) == len(first) and not set(copy) & set(first)
+        assert again == []
+
+        delete_item_points(generator.qdrant_client, ["17"], ["test_docs"])
+        points, _ = generator.qdrant_client.scroll("test_docs", limit=100, with_payload=True)
+        assert {point.payload["item_id"] for point in points} == {"18"}
+        assert len(points) == len(copy)
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for how the enhanced RAG classifier stores classified documents
+"""
+
+import pytest
+import os
+import sys
+
+import numpy as np
+
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams
+
+from core.enhanced_rag_classifier import EnhancedRAGClassifier
+from core.sharepoint_delta import delete_item_points
+
+
+class FakeEncoder:
+    def encode(self, text, **kwargs):
+        return np.full(8, 0.5, dtype=np.float32)
+
+
+class TestDocumentStore:
+    """Test suite for the "documents" collection written after classification"""
+
+    @pytest.fixture
+    def classifier(self):
+        # No models: only the pieces classify_with_rag needs to reach the store step
+        classifier = EnhancedRAGClassifier.__new__(EnhancedRAGClassifier)
+        classifier.client = QdrantClient(":memory:")
+        classifier.client.create_collection("documents", vectors_config=VectorParams(size=8, distance=Distance.COSINE))
+        classifier.embedding_model = FakeEncoder()
+        classifier._get_rag_context = lambda text, filename: {
+            "similar_categories": [], "similar_examples": [], "similar_documents": []}
+        classifier._classify_with_primary = lambda text, context, filename: {
+            "doc_type": "Motion to Dismiss", "doc_category": "Civil", "confidence": "High", "confidence_score": 0.9}
+        classifier._validate_with_bart = lambda text, result: {}
+        classifier._combine_classification_results = lambda result, validation, context, filename: dict(result)
+        return classifier
+
+    def test_delta_deletion_removes_the_stored_document(self, classifier):
+        """Test that the driveItem ID reaches the stored point, so deleting the file removes it"""
+        classifier.classify_with_rag("Motion to dismiss the complaint. " * 20, "motion.pdf", item_id="drive-1")
+        classifier.classify_with_rag("Notice of appeal to the circuit. " * 20, "appeal.pdf", item_id="drive-2")
+
+        points, _ = classifier.client.scroll("documents", limit=10, with_payload=True)
+        assert sorted(point.payload["item_id"] for point in points) == ["drive-1", "drive-2"]
+
+        assert delete_item_points(classifier.client, ["drive-1"]) == ["documents"]
+        points, _ = classifier.client.scroll("documents", limit=10, with_payload=True)
+        assert [point.payload["filename"] for point in points] == ["appeal.pdf"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed extraction cache
+"""
+
+import pytest
+import os
+import sys
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from core.extraction_cache import ExtractionCache, file_digest, make_key
+
+
+class TestExtractionCache:
+    """Test suite for the extraction cache"""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return ExtractionCache(cache_dir=str(tmp_path / "cache"), max_bytes=10 * 1024 * 1024)
+
+    @pytest.fixture
+    def sample_file(self, tmp_path):
+        path = tmp_path / "notice.pdf"
+        path.write_bytes(b"%PDF-1.4 fake notice to appear")
+        return str(path)
+
+    def test_key_depends_on_content_extractor_and_settings(self):
+        """Test that any change to the key material changes the key"""
+        base = make_key("abc", "extract_all", {"ocr": "tesseract"})
+        assert base == make_key("abc", "extract_all", {"ocr": "tesseract"})
+        assert base != make_key("abd", "extract_all", {"ocr": "tesseract"})
+        assert base != make_key("abc", "hybrid_ocr", {"ocr": "tesseract"})
+        assert base != make_key("abc", "extract_all", {"ocr": "trocr"})
+
+    def test_round_trip(self, cache):
+        """Test storing and reading back page text"""
+        cache.put("k1", ["page one", "página dos"], {"ocr_pages": [1]})
+        entry = cache.get("k1")
+        assert entry["pages"] == ["page one", "página dos"]
+        assert entry["meta"] == {"ocr_pages": [1]}
+        assert cache.get("missing") is None
+
+    def test_get_or_extract_only_extracts_once(self, cache, sample_file):
+        """Test that a repeat costs only a hash and a read"""
+        calls = []
+
+        def extract():
+            calls.append(1)
+            return ["extracted text"], {}
+
+        first = cache.get_or_extract(sample_file, "extract_all", None, extract)
+        second = cache.get_or_extract(sample_file, "extract_all", None, extract)
+
+        assert first["pages"] == second["pages"] == ["extracted text"]
+        assert len(calls) == 1
+
+    def test_precomputed_digest_matches_file_hash(self, cache, sample_file):
+        """Test that callers can pass the SHA-256 they computed while downloading"""
+        cache.get_or_extract(sample_file, "extract_all", None, lambda: (["text"], {}))
+        entry = cache.get(make_key(file_digest(sample_file), "extract_all", None))
+        assert entry["pages"] == ["text"]
+
+    def test_incomplete_results_are_not_cached(self, cache, sample_file):
+        """Test that partial OCR output is returned but never stored"""
+        result = cache.get_or_extract(sample_file, "hybrid_ocr", None,
+                                      lambda: (["partial"], {"incomplete": True}))
+        assert result["pages"] == ["partial"]
+        assert cache.get(make_key(file_digest(sample_file), "hybrid_ocr", None)) is None
+
+    def test_streamed_pages_cached_only_when_fully_read(self, cache, sample_file):
+        """Test that a consumer stopping early does not leave a truncated entry"""
+        key = make_key(file_digest(sample_file), "extract_all", None)
+
+        pages = cache.iter_or_extract(sample_file, "extract_all", None, lambda: iter(["one", "two"]))
+        assert next(pages) == "one"
+        pages.close()
+        assert cache.get(key) is None
+
+        assert list(cache.iter_or_extract(sample_file, "extract_all", None,
+                                          lambda: iter(["one", "two"]))) == ["one", "two"]
+        assert cache.get(key)["pages"] == ["one", "two"]
+
+    def test_size_based_eviction_drops_least_recently_used(self, tmp_path):
+        """Test LRU eviction when the cache exceeds its size limit"""
+        cache = ExtractionCache(cache_dir=str(tmp_path / "small"), max_bytes=1500)
+        # Random-ish text so compression cannot shrink entries to nothing
+        pages = [os.urandom(600).hex()]
+
+        cache.put("old", pages)
+        cache.put("recent", pages)
+        cache.get("old")  # touch so "recent" becomes the LRU entry
+        cache.put("newest", pages)
+
+        assert cache.total_bytes() <= 1500
+        assert cache.get("newest") is not None
+        assert cache.get("recent") is None
+
+    def test_corrupt_shard_is_discarded(self, cache):
+        """Test that an unreadable shard behaves like a miss"""
+        cache.put("bad", ["text"])
+        cache._shard_path("bad").write_bytes(b"not zlib")
+        assert cache.get("bad") is None
+        assert cache.total_bytes() == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
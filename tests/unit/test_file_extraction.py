@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests for server-side upload extraction and the /classify-file endpoint
+"""
+
+import pytest
+import asyncio
+import hashlib
+import io
+import os
+import sys
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+
+from docx import Document
+from fastapi.testclient import TestClient
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import core.extraction_cache as extraction_cache
+import main
+from core.file_extraction import FileExtractionService, UploadTooLargeError, spool_upload
+
+
+class FakeUpload:
+    """Minimal async UploadFile stand-in"""
+
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+    async def read(self, size=-1):
+        return self.stream.read(size)
+
+
+class BrokenPool(Executor):
+    """Executor whose worker "dies" on every task"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker died"))
+        return future
+
+    def shutdown(self, wait=True, **kwargs):
+        pass
+
+
+class FakeModelClient:
+    """Answers classifications without loading models"""
+
+    def submit_classification(self, text, filename, priority, item_id=None):
+        future = Future()
+        future.set_result({"doc_type": "Motion", "doc_category": "Civil", "confidence": "High",
+                           "confidence_score": 0.9, "processing_time": 0.1})
+        return future
+
+
+def docx_bytes(text):
+    buffer = io.BytesIO()
+    document = Document()
+    document.add_paragraph(text)
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+class TestFileExtraction:
+    """Test suite for upload spooling, pooled extraction and the upload endpoint"""
+
+    @pytest.fixture
+    def service(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("EXTRACTION_CACHE_DIR", str(tmp_path / "cache"))
+        monkeypatch.setattr(extraction_cache, "_cache_instance", None)
+        service = FileExtractionService(max_workers=1)
+        yield service
+        service.shutdown()
+
+    @pytest.fixture
+    def client(self, service, monkeypatch):
+        monkeypatch.setattr(main, "model_client", FakeModelClient())
+        monkeypatch.setattr(main, "extraction_service", service)
+        return TestClient(main.app)
+
+    def test_spool_upload_hashes_and_cleans_up(self, tmp_path, monkeypatch):
+        """Test that the body is written once to a named file and removed when too large"""
+        monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+        data = os.urandom(3 * 1024 * 1024 + 17)
+
+        path, digest, size = asyncio.run(spool_upload(FakeUpload(data), max_bytes=len(data), suffix=".pdf"))
+        try:
+            assert path.endswith(".pdf") and size == len(data)
+            assert digest == hashlib.sha256(data).hexdigest()
+            with open(path, "rb") as fh:
+                assert fh.read() == data
+        finally:
+            os.unlink(path)
+
+        with pytest.raises(UploadTooLargeError):
+            asyncio.run(spool_upload(FakeUpload(data), max_bytes=len(data) - 1))
+        assert os.listdir(tmp_path) == []
+
+    def test_extracts_in_pool_then_serves_from_cache(self, service):
+        """Test a real extraction in a worker process, then a cache hit by upload hash"""
+        # Spawned, so workers inherit neither the API's threads nor its lock file descriptors
+        assert service._pool._mp_context.get_start_method() == "spawn"
+        data = docx_bytes("Notice of motion to dismiss the complaint")
+
+        text, digest, cached = asyncio.run(service.extract_upload(FakeUpload(data), "motion.docx"))
+        assert "motion to dismiss" in text and not cached
+
+        again, digest_again, cached = asyncio.run(service.extract_upload(FakeUpload(data), "copy.docx"))
+        assert (again, digest_again, cached) == (text, digest, True)
+
+    def test_crashed_worker_restarts_the_pool(self, service):
+        """Test that a dead worker fails the request and is replaced"""
+        service._pool = BrokenPool()
+        with pytest.raises(RuntimeError, match="crashed"):
+            asyncio.run(service.extract_upload(FakeUpload(b"%PDF-1.4 broken"), "broken.pdf"))
+        assert not isinstance(service._pool, BrokenPool)
+
+    def test_classify_file_endpoint(self, client, service):
+        """Test upload classification and the 413, 415 and 500 paths"""
+        data = docx_bytes("Notice of motion to dismiss the complaint")
+        response = client.post("/classify-file", files={"file": ("motion.docx", data)})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["document_type"] == "Motion"
+        assert body["content_hash"] == hashlib.sha256(data).hexdigest()
+        assert body["extracted_characters"] > 0
+
+        response = client.post("/classify-file", files={"file": ("setup.exe", b"MZ")})
+        assert response.status_code == 415
+
+        service.max_upload_bytes = 10
+        response = client.post("/classify-file", files={"file": ("big.pdf", b"%PDF-1.4 " + b"x" * 100)})
+        assert response.status_code == 413
+
+        service.max_upload_bytes = 1024
+        service._pool = BrokenPool()
+        response = client.post("/classify-file", files={"file": ("scan.pdf", b"%PDF-1.4 scan")})
+        assert response.status_code == 500
+        assert "crashed" in response.json()["detail"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
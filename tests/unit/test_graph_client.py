@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared Microsoft Graph client
+"""
+
+import pytest
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from core.graph_client import GraphAuthError, GraphClient, retry_delay
+from tests.graph_stub import GraphStub
+
+
+def token_app(*tokens, expires_in=3600):
+    """MSAL stand-in handing out the given tokens in order"""
+    app = Mock()
+    app.acquire_token_for_client.side_effect = [
+        {"access_token": token, "expires_in": expires_in} for token in tokens
+    ]
+    return app
+
+
+class TestGraphClient:
+    """Test suite for pooling, token caching and throttling"""
+
+    @pytest.fixture
+    def graph(self):
+        with GraphStub() as stub:
+            yield stub
+
+    def make_client(self, graph, app, tenant="tenant-a", **kwargs):
+        return GraphClient(tenant, "client", "secret", graph_root=graph.url, app=app,
+                           backoff_base=0.01, **kwargs)
+
+    def test_token_is_cached_and_connections_reused(self, graph):
+        """Test one token acquisition and one keep-alive connection for many requests"""
+        graph.add("GET", "/sites/s1", (200, {"id": "s1"}))
+        app = token_app("t1")
+        client = self.make_client(graph, app)
+
+        for _ in range(5):
+            assert client.get_json("sites/s1") == {"id": "s1"}
+
+        assert app.acquire_token_for_client.call_count == 1
+        assert len(graph.connections) == 1
+        assert graph.requests[0]["headers"]["Authorization"] == "Bearer t1"
+
+    def test_token_is_refreshed_before_expiry_and_after_401(self, graph):
+        """Test proactive refresh inside the margin and one re-auth on 401"""
+        graph.add("GET", "/me", (200, {}), (200, {}), (401, {}), (200, {}))
+        app = token_app("t1", "t2", "t3", expires_in=3600)
+        client = self.make_client(graph, app)
+
+        client.get("me")
+        with patch("core.graph_client.time.time", return_value=time.time() + 3400):
+            client.get("me")
+        assert graph.requests[-1]["headers"]["Authorization"] == "Bearer t2"
+
+        response = client.get("me")  # 401, then retried with a new token
+        assert response.status_code == 200
+        assert graph.requests[-1]["headers"]["Authorization"] == "Bearer t3"
+        assert app.remove_tokens_for_client.call_count == 2
+
+    def test_throttling_honours_retry_after(self, graph):
+        """Test 429/503 retries and that non-retryable errors are returned"""
+        graph.add("GET", "/drives/d1", (429, None, {"Retry-After": "0"}),
+                  (503, None, {"Retry-After": "0"}), (200, {"id": "d1"}))
+        graph.add("GET", "/drives/missing", (404, {"error": {"code": "itemNotFound"}}))
+        client = self.make_client(graph, token_app("t1"))
+
+        assert client.get_json("drives/d1") == {"id": "d1"}
+        assert client.stats["throttled"] == 2
+        assert client.get("drives/missing").status_code == 404
+        assert len(graph.calls("/drives/missing")) == 1
+
+        assert 10 <= retry_delay(0, "10") <= 12
+        assert 0 <= retry_delay(3) <= 8
+
+    def test_concurrency_is_capped_per_tenant(self):
+        """Test that two clients of one tenant share the cap"""
+        with GraphStub(delay=0.05) as graph:
+            graph.add("GET", "/items", (200, {"value": []}))
+            first = self.make_client(graph, token_app("t1"), tenant="tenant-cap", max_concurrency=3)
+            second = self.make_client(graph, token_app("t2"), tenant="tenant-cap", max_concurrency=3)
+
+            with ThreadPoolExecutor(max_workers=10) as pool:
+                list(pool.map(lambda n: (first if n % 2 else second).get("items"), range(12)))
+
+            assert graph.max_in_flight <= 3
+            assert len(graph.requests) == 12
+
+    def test_pagination_and_auth_failure(self, graph):
+        """Test nextLink following and a clear error when no token is issued"""
+        graph.add("GET", "/lists/l1/items",
+                  lambda request: (200, {"value": [{"id": "2"}]}) if "page" in request["query"]
+                  else (200, {"value": [{"id": "1"}], "@odata.nextLink": f"{graph.url}/lists/l1/items?page=2"}))
+        client = self.make_client(graph, token_app("t1"))
+        assert [item["id"] for item in client.iter_pages("lists/l1/items")] == ["1", "2"]
+
+        app = Mock()
+        app.acquire_token_for_client.return_value = {"error_description": "bad secret"}
+        with pytest.raises(GraphAuthError, match="bad secret"):
+            self.make_client(graph, app).get("me")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Tests for the priority inference scheduler
+"""
+
+import pytest
+import asyncio
+import os
+import sys
+import threading
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from core.inference_scheduler import BULK, INTERACTIVE, InferenceScheduler
+
+
+class FakeClock:
+    """Time only moves when a task "runs the model" """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def model_call(self, label, seconds=1.0, order=None):
+        self.now += seconds
+        if order is not None:
+            order.append(label)
+        return label
+
+
+class TestInferenceScheduler:
+    """Test suite for interactive vs bulk scheduling"""
+
+    def test_interactive_request_goes_next_at_the_batch_boundary(self):
+        """Test that a single upload does not wait behind a long backfill"""
+        scheduler = InferenceScheduler(weights={INTERACTIVE: 8, BULK: 1})
+        order, gate = [], threading.Event()
+
+        def model_call(label):
+            if label == "bulk-0":
+                gate.wait(5)
+            order.append(label)
+            return label
+
+        scheduler.start()
+        try:
+            bulk = [scheduler.submit(model_call, f"bulk-{i}", priority=BULK) for i in range(50)]
+            while scheduler.metrics()[BULK]["running"] == 0:
+                time.sleep(0.001)
+            interactive = scheduler.submit(model_call, "upload", priority=INTERACTIVE)
+            gate.set()
+
+            assert interactive.result(timeout=5) == "upload"
+            assert [f.result(timeout=5) for f in bulk][-1] == "bulk-49"
+        finally:
+            scheduler.stop()
+
+        # The running document finishes, then the interactive request preempts the rest
+        assert order[:2] == ["bulk-0", "upload"]
+
+    def test_backlogged_classes_share_by_weight(self):
+        """Test weighted fair sharing when both queues stay busy"""
+        clock = FakeClock()
+        scheduler = InferenceScheduler(weights={INTERACTIVE: 3, BULK: 1}, clock=clock)
+        order = []
+        futures = [scheduler.submit(clock.model_call, "i", order=order, priority=INTERACTIVE) for _ in range(30)]
+        futures += [scheduler.submit(clock.model_call, "b", order=order, priority=BULK) for _ in range(30)]
+
+        scheduler.start()
+        try:
+            for future in futures:
+                future.result(timeout=5)
+        finally:
+            scheduler.stop()
+
+        # Bulk is never starved, and gets a quarter of the model while both are backlogged
+        assert order[:20].count("i") == 15
+        assert order[:20].count("b") == 5
+        assert "b" in order[:4]
+
+    def test_idle_class_gets_no_banked_credit(self):
+        """Test that bulk returning after an interactive-only period does not take over"""
+        clock = FakeClock()
+        scheduler = InferenceScheduler(weights={INTERACTIVE: 1, BULK: 1}, clock=clock)
+        scheduler.start()
+        try:
+            for _ in range(10):
+                scheduler.run(clock.model_call, "i", priority=INTERACTIVE)
+            order, gate = [], threading.Event()
+            blocker = scheduler.submit(gate.wait, 5, priority=INTERACTIVE)
+            while scheduler.metrics()[INTERACTIVE]["running"] == 0:
+                time.sleep(0.001)
+            futures = [scheduler.submit(clock.model_call, "b", order=order, priority=BULK) for _ in range(4)]
+            futures += [scheduler.submit(clock.model_call, "i", order=order, priority=INTERACTIVE) for _ in range(4)]
+            gate.set()
+            blocker.result(timeout=5)
+            for future in futures:
+                future.result(timeout=5)
+        finally:
+            scheduler.stop()
+
+        # Equal weights alternate rather than bulk running 4 in a row on saved-up credit
+        assert order[:4].count("b") <= 2
+
+    def test_metrics_errors_and_async(self):
+        """Test per-class counters, latency percentiles and error propagation"""
+        scheduler = InferenceScheduler()
+        scheduler.start()
+
+        def boom():
+            raise ValueError("model exploded")
+
+        async def classify():
+            return await scheduler.run_async(lambda text: text.upper(), "motion", priority=INTERACTIVE)
+
+        try:
+            assert asyncio.run(classify()) == "MOTION"
+            with pytest.raises(ValueError):
+                scheduler.run(boom, priority=BULK)
+            with pytest.raises(ValueError):
+                scheduler.submit(boom, priority="urgent")
+            metrics = scheduler.metrics()
+        finally:
+            scheduler.stop()
+
+        assert metrics[INTERACTIVE]["completed"] == 1 and metrics[INTERACTIVE]["latency_p95"] is not None
+        assert metrics[BULK]["failed"] == 1 and metrics[BULK]["queued"] == 0
+        with pytest.raises(RuntimeError):
+            scheduler.submit(boom)
+
+    def test_cancelled_tasks_are_counted_separately(self):
+        """Test that a task cancelled in the queue is neither completed nor sampled"""
+        clock = FakeClock()
+        scheduler = InferenceScheduler(weights={INTERACTIVE: 1, BULK: 1}, clock=clock)
+        gate = threading.Event()
+        scheduler.start()
+        try:
+            blocker = scheduler.submit(gate.wait, 5, priority=BULK)
+            while scheduler.metrics()[BULK]["running"] == 0:
+                time.sleep(0.001)
+            clock.now = 100.0
+            abandoned = scheduler.submit(clock.model_call, "gone", priority=BULK)
+            assert abandoned.cancel()
+            clock.now = 500.0
+            gate.set()
+            blocker.result(timeout=5)
+            assert scheduler.run(clock.model_call, "next", priority=BULK) == "next"
+            metrics = scheduler.metrics()[BULK]
+        finally:
+            scheduler.stop()
+
+        assert (metrics["completed"], metrics["failed"], metrics["cancelled"]) == (2, 0, 1)
+        # Only the blocker and the last call are sampled; both started as soon as they were queued
+        assert metrics["wait_p95"] == 0.0 and metrics["latency_max"] == 500.0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Tests for the pipelined bulk ingestion stages
+"""
+
+import pytest
+import os
+import sys
+import threading
+import asyncio
+from unittest.mock import MagicMock
+
+from aiohttp import web
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from embedding.ingest_pipeline import IngestItem, IngestPipeline, PipelineConfig
+
+
+def split_pages(file_path, digest=None):
+    """Picklable extractor: one page per form feed"""
+    with open(file_path, encoding="utf-8") as fh:
+        return fh.read().split("\f")
+
+
+class FakeEmbedder:
+    """Records encode groups and returns one point per page"""
+
+    def __init__(self):
+        self.groups = []
+        self.qdrant_client = MagicMock()
+
+    def points_for_documents(self, documents, collection_name=None):
+        self.groups.append([filename for _, filename, _ in documents])
+        return [[(filename, n) for n, _ in enumerate(pages)] for pages, filename, _ in documents]
+
+
+@pytest.fixture
+def file_server():
+    """Local HTTP server standing in for Graph download URLs"""
+    hits = {}
+
+    async def handler(request):
+        name = request.match_info["name"]
+        hits[name] = hits.get(name, 0) + 1
+        if name == "throttled.txt" and hits[name] == 1:
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        if name == "missing.txt":
+            return web.Response(status=404)
+        return web.Response(body=f"{name} page one\fpage two".encode())
+
+    app = web.Application()
+    app.router.add_get("/{name}", handler)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{port}", hits
+
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+class TestIngestPipeline:
+    """Test suite for the download/extract/embed/upsert pipeline"""
+
+    def test_pipeline_processes_retries_and_reports_failures(self, file_server, tmp_path):
+        """Test end-to-end flow, 429 retry, failure reporting and bulk upserts"""
+        base_url, hits = file_server
+        names = [f"doc{n}.txt" for n in range(6)] + ["throttled.txt", "missing.txt"]
+        items = [IngestItem(item_id=name, filename=name, download_url=f"{base_url}/{name}",
+                            extra_payload={"item_id": name}) for name in names]
+        embedder = FakeEmbedder()
+        done, failed = {}, []
+        config = PipelineConfig(download_concurrency=3, extract_workers=2, embed_threads=2,
+                                embed_batch_docs=4, upsert_batch=5, queue_size=2, max_retries=2)
+
+        pipeline = IngestPipeline(embedder, "test_docs", tmp_path / "downloads", config,
+                                  on_done=lambda item, points: done.update({item.item_id: points}),
+                                  on_failed=lambda item, stage, error: failed.append((item.item_id, stage)),
+                                  extract_fn=split_pages)
+        stats = pipeline.run(items)
+
+        assert set(done) == set(names) - {"missing.txt"}
+        assert all(points == 2 for points in done.values())
+        assert failed == [("missing.txt", "download")]
+        assert hits["throttled.txt"] == 2
+        assert stats["upserted_points"] == 14
+        upserts = embedder.qdrant_client.upsert.call_args_list
+        assert sum(len(call.kwargs["points"]) for call in upserts) == 14
+        assert all(len(group) <= 4 for group in embedder.groups)
+        assert list((tmp_path / "downloads").iterdir()) == []
+
+    def test_upsert_failure_fails_its_items(self, file_server, tmp_path):
+        """Test that items are not reported done when their upsert fails"""
+        base_url, _ = file_server
+        embedder = FakeEmbedder()
+        embedder.qdrant_client.upsert.side_effect = RuntimeError("qdrant down")
+        done, failed = [], []
+        config = PipelineConfig(download_concurrency=2, extract_workers=1, embed_threads=1,
+                                embed_batch_docs=2, upsert_batch=100, queue_size=2)
+
+        pipeline = IngestPipeline(embedder, "test_docs", tmp_path, config,
+                                  on_done=lambda item, points: done.append(item.item_id),
+                                  on_failed=lambda item, stage, error: failed.append(stage),
+                                  extract_fn=split_pages)
+        pipeline.run([IngestItem(item_id=str(n), filename=f"doc{n}.txt", download_url=f"{base_url}/doc{n}.txt")
+                      for n in range(3)])
+
+        assert done == []
+        assert failed == ["upsert"] * 3
+
+
+    def test_stage_error_stops_the_feed(self, file_server, tmp_path):
+        """Test that a raising progress callback fails the run instead of hanging on a full queue"""
+        base_url, _ = file_server
+        config = PipelineConfig(download_concurrency=1, extract_workers=1, embed_threads=1,
+                                embed_batch_docs=1, upsert_batch=100, queue_size=1)
+
+        def on_progress(item, stage):
+            raise RuntimeError("database is locked")
+
+        pipeline = IngestPipeline(FakeEmbedder(), "test_docs", tmp_path, config,
+                                  on_progress=on_progress, extract_fn=split_pages)
+        items = [IngestItem(item_id=str(n), filename=f"doc{n}.txt", download_url=f"{base_url}/doc{n}.txt")
+                 for n in range(20)]
+
+        with pytest.raises(RuntimeError, match="database is locked"):
+            asyncio.run(asyncio.wait_for(pipeline.run_async(items), timeout=10))
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
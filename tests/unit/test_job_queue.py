@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent classification job queue
+"""
+
+import pytest
+import os
+import sys
+import threading
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from core.job_queue import FAILED, JobQueue
+
+
+def wait_for(queue, job_id, status, timeout=5.0):
+    """Poll a job until it reaches the expected status"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get_job(job_id)
+        if job["status"] == status:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not reach {status}: {queue.get_job(job_id)}")
+
+
+class TestJobQueue:
+    """Test suite for the SQLite-backed job queue"""
+
+    @pytest.fixture
+    def classify_fn(self):
+        def classify(text, filename, item_id=None):
+            if text == "boom":
+                raise ValueError("classification exploded")
+            return {"filename": filename, "document_type": text.upper(), "drive_item_id": item_id}
+        return classify
+
+    @pytest.fixture
+    def db_path(self, tmp_path):
+        return str(tmp_path / "jobs.db")
+
+    def test_job_completes_with_ordered_paged_results(self, classify_fn, db_path):
+        """Test that results come back in submission order and can be paged"""
+        queue = JobQueue(classify_fn, db_path=db_path, poll_interval=0.01)
+        queue.start()
+        try:
+            items = [{"kind": "text", "text": f"doc{i}", "filename": f"f{i}.pdf"} for i in range(5)]
+            job_id = queue.submit(items)
+
+            job = wait_for(queue, job_id, "completed")
+            assert job["total"] == 5
+            assert job["progress"]["done"] == 5
+
+            page = queue.get_job(job_id, offset=2, limit=2)
+            assert [r["index"] for r in page["results"]] == [2, 3]
+            assert page["results"][0]["document_type"] == "DOC2"
+        finally:
+            queue.close()
+
+    def test_failed_item_does_not_stop_job(self, classify_fn, db_path):
+        """Test that a failing item is recorded and the rest of the job proceeds"""
+        queue = JobQueue(classify_fn, db_path=db_path, poll_interval=0.01)
+        queue.start()
+        try:
+            job_id = queue.submit([
+                {"kind": "text", "text": "boom"},
+                {"kind": "text", "text": "fine"}
+            ])
+            job = wait_for(queue, job_id, "completed")
+            assert job["progress"]["failed"] == 1
+            assert job["results"][0]["success"] is False
+            assert "exploded" in job["results"][0]["error"]
+            assert job["results"][1]["success"] is True
+        finally:
+            queue.close()
+
+    def test_cancel_marks_pending_items(self, classify_fn, db_path):
+        """Test cancelling a job before workers pick it up"""
+        queue = JobQueue(classify_fn, db_path=db_path)
+        try:
+            job_id = queue.submit([{"kind": "text", "text": "a"}, {"kind": "text", "text": "b"}])
+            assert queue.cancel(job_id)
+            job = queue.get_job(job_id)
+            assert job["status"] == "cancelled"
+            assert job["progress"]["cancelled"] == 2
+            assert not queue.cancel("missing-job")
+        finally:
+            queue.close()
+
+    def test_jobs_survive_restart(self, classify_fn, db_path):
+        """Test that queued and interrupted items are processed after a restart"""
+        queue = JobQueue(classify_fn, db_path=db_path)
+        job_id = queue.submit([{"kind": "text", "text": "a"}, {"kind": "text", "text": "b"}])
+        # Simulate a crash mid-item
+        queue._claim_next()
+        queue.close()
+
+        restarted = JobQueue(classify_fn, db_path=db_path, poll_interval=0.01)
+        restarted.start()
+        try:
+            job = wait_for(restarted, job_id, "completed")
+            assert job["progress"]["done"] == 2
+        finally:
+            restarted.close()
+
+    def test_live_lease_is_not_taken_over(self, db_path):
+        """Test that a second process does not re-run an item whose owner keeps renewing it"""
+        calls, started = [], threading.Event()
+
+        def slow_classify(owner):
+            def classify(text, filename, item_id=None):
+                calls.append(owner)
+                started.set()
+                time.sleep(0.6)
+                return {"document_type": text}
+            return classify
+
+        first = JobQueue(slow_classify("first"), db_path=db_path, poll_interval=0.01, lease_seconds=0.3)
+        second = JobQueue(slow_classify("second"), db_path=db_path, poll_interval=0.01, lease_seconds=0.3)
+        first.start()
+        try:
+            job_id = first.submit([{"kind": "text", "text": "a"}])
+            assert started.wait(5)
+            second.start()
+            job = wait_for(first, job_id, "completed")
+            assert job["progress"]["done"] == 1
+            assert calls == ["first"]
+        finally:
+            second.close()
+            first.close()
+
+    def test_expired_lease_is_resumed_and_late_result_dropped(self, classify_fn, db_path):
+        """Test that a crashed owner's item is picked up again and its late result ignored"""
+        crashed = JobQueue(classify_fn, db_path=db_path, lease_seconds=0.1)
+        job_id = crashed.submit([{"kind": "text", "text": "a"}])
+        claimed = crashed._claim_next()
+        time.sleep(0.15)
+
+        survivor = JobQueue(classify_fn, db_path=db_path, poll_interval=0.01)
+        survivor.start()
+        try:
+            job = wait_for(survivor, job_id, "completed")
+            crashed._finish(claimed[0], claimed[1], FAILED, None, "late")
+            job = survivor.get_job(job_id)
+            assert job["progress"]["done"] == 1 and job["progress"]["failed"] == 0
+        finally:
+            survivor.close()
+            crashed._conn.close()
+
+    def test_cancelled_running_items_are_not_requeued(self, classify_fn, db_path):
+        """Test that cancel, then stop or lease expiry, does not run cancelled work again"""
+        stopped = JobQueue(classify_fn, db_path=db_path)
+        released_job = stopped.submit([{"kind": "text", "text": "a"}])
+        stopped._claim_next()
+        stopped.cancel(released_job)
+        assert stopped.get_job(released_job)["status"] == "cancelling"
+        stopped.close()
+
+        crashed = JobQueue(classify_fn, db_path=db_path, lease_seconds=0.1)
+        expired_job = crashed.submit([{"kind": "text", "text": "b"}])
+        crashed._claim_next()
+        crashed.cancel(expired_job)
+        time.sleep(0.15)
+
+        survivor = JobQueue(classify_fn, db_path=db_path, poll_interval=0.01)
+        try:
+            assert survivor._claim_next() is None
+            for job_id in (released_job, expired_job):
+                job = survivor.get_job(job_id)
+                assert job["status"] == "cancelled"
+                assert job["progress"]["cancelled"] == 1 and job["progress"]["done"] == 0
+        finally:
+            survivor.close()
+            crashed._conn.close()
+
+    def test_sharepoint_items_use_resolver(self, classify_fn, db_path):
+        """Test that SharePoint item IDs are resolved to text before classification"""
+        queue = JobQueue(
+            classify_fn,
+            resolve_fn=lambda item_id: (f"text-{item_id}", f"{item_id}.pdf", f"drive-{item_id}"),
+            db_path=db_path,
+            poll_interval=0.01
+        )
+        queue.start()
+        try:
+            job_id = queue.submit([{"kind": "sharepoint", "item_id": "42"}])
+            job = wait_for(queue, job_id, "completed")
+            result = job["results"][0]
+            assert result["item_id"] == "42"
+            assert result["filename"] == "42.pdf"
+            assert result["document_type"] == "TEXT-42"
+            # The classifier gets the driveItem ID, which delta deletions are keyed on
+            assert result["drive_item_id"] == "drive-42"
+        finally:
+            queue.close()
+
+    def test_submit_rejects_empty_and_unknown_items(self, classify_fn, db_path):
+        """Test input validation on submit"""
+        queue = JobQueue(classify_fn, db_path=db_path)
+        try:
+            with pytest.raises(ValueError):
+                queue.submit([])
+            with pytest.raises(ValueError):
+                queue.submit([{"kind": "video"}])
+        finally:
+            queue.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared model server and its worker-side client
+"""
+
+import pytest
+import asyncio
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from core.inference_scheduler import BULK, INTERACTIVE, InferenceScheduler
+from core.model_server import ModelClient, ModelServer, ModelServerError
+
+
+class FakeClassifier:
+    """One resident "model" that records every call it serves"""
+
+    def __init__(self):
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def classify_with_rag(self, text, filename, item_id=None):
+        self.gate.wait(5)
+        if text == "boom":
+            raise ValueError("model exploded")
+        self.calls.append(filename)
+        return {"doc_type": text.upper(), "doc_category": "Civil", "filename": filename,
+                "served_by": os.getpid(), "confidence_score": 0.9}
+
+
+def run_server(server):
+    """Start a ModelServer on its own event loop thread; returns a stop function"""
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+    return stop
+
+
+def worker_process(socket_path, worker, results):
+    """An API worker process: its own client, several requests in flight"""
+    client = ModelClient(socket_path, timeout=10)
+    futures = [client.submit_classification(f"doc{worker}{n}", f"w{worker}-{n}.pdf", BULK) for n in range(4)]
+    results.put([(f.result(timeout=10)["filename"], f.result()["served_by"]) for f in futures])
+    client.close()
+
+
+class TestModelServer:
+    """Test suite for multi-process serving over a Unix socket"""
+
+    @pytest.fixture
+    def classifier(self):
+        return FakeClassifier()
+
+    @pytest.fixture
+    def server(self, classifier, tmp_path):
+        server = ModelServer(classifier.classify_with_rag, socket_path=str(tmp_path / "models.sock"))
+        stop = run_server(server)
+        yield server
+        stop()
+
+    def test_round_trip_errors_and_metrics(self, server):
+        """Test sync and async classification, remote errors and the metrics op"""
+        client = ModelClient(server.socket_path, timeout=5)
+        try:
+            assert client.classify("motion", "a.pdf")["doc_type"] == "MOTION"
+            assert asyncio.run(client.classify_async("order", "b.pdf"))["doc_type"] == "ORDER"
+            with pytest.raises(ModelServerError, match="model exploded"):
+                client.classify("boom", "c.pdf")
+            with pytest.raises(ModelServerError, match="Unknown operation"):
+                client.call("train").result(timeout=5)
+
+            metrics = client.metrics()
+            assert metrics["connections"] == 1
+            assert metrics["classes"][INTERACTIVE]["completed"] == 1
+            assert metrics["classes"][BULK]["completed"] == 1 and metrics["classes"][BULK]["failed"] == 1
+        finally:
+            client.close()
+
+    def test_worker_processes_share_one_resident_model(self, server, classifier):
+        """Test that several worker processes are served by the single model host"""
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        workers = [context.Process(target=worker_process, args=(server.socket_path, w, results)) for w in range(3)]
+        for process in workers:
+            process.start()
+        replies = [results.get(timeout=20) for _ in workers]
+        for process in workers:
+            process.join(timeout=10)
+
+        served = [reply for worker_replies in replies for reply in worker_replies]
+        assert sorted(name for name, _ in served) == sorted(f"w{w}-{n}.pdf" for w in range(3) for n in range(4))
+        assert {pid for _, pid in served} == {os.getpid()}
+        assert len(classifier.calls) == 12
+
+    def test_interactive_request_from_another_worker_goes_first(self, classifier, tmp_path):
+        """Test that priorities apply across workers, not per worker"""
+        scheduler = InferenceScheduler(weights={INTERACTIVE: 8, BULK: 1})
+        server = ModelServer(classifier.classify_with_rag, scheduler=scheduler,
+                             socket_path=str(tmp_path / "models.sock"))
+        scheduler.start()
+        stop = run_server(server)
+        batch_worker, upload_worker = ModelClient(server.socket_path), ModelClient(server.socket_path)
+        try:
+            classifier.gate.clear()
+            bulk = [batch_worker.submit_classification(f"bulk{n}", f"bulk{n}.pdf", BULK) for n in range(20)]
+            while scheduler.metrics()[BULK]["running"] == 0:
+                time.sleep(0.001)
+            upload = upload_worker.submit_classification("motion", "upload.pdf", INTERACTIVE)
+            while scheduler.metrics()[INTERACTIVE]["queued"] == 0:
+                time.sleep(0.001)
+            classifier.gate.set()
+
+            upload.result(timeout=5)
+            for future in bulk:
+                future.result(timeout=5)
+        finally:
+            batch_worker.close()
+            upload_worker.close()
+            stop()
+            scheduler.stop()
+
+        assert classifier.calls[:2] == ["bulk0.pdf", "upload.pdf"]
+
+    def test_lost_connection_fails_pending_and_reconnects(self, classifier, tmp_path):
+        """Test client behaviour across a model server restart"""
+        socket_path = str(tmp_path / "models.sock")
+        client = ModelClient(socket_path, timeout=5)
+        with pytest.raises(ModelServerError, match="unavailable"):
+            client.classify("motion", "a.pdf")
+
+        classifier.gate.clear()
+        scheduler = InferenceScheduler()
+        scheduler.start()
+        stop = run_server(ModelServer(classifier.classify_with_rag, scheduler=scheduler, socket_path=socket_path))
+        pending = client.submit_classification("motion", "a.pdf")
+        time.sleep(0.1)
+        stop()
+        classifier.gate.set()
+        scheduler.stop()
+        with pytest.raises(ModelServerError, match="lost"):
+            pending.result(timeout=5)
+
+        stop = run_server(ModelServer(classifier.classify_with_rag, socket_path=socket_path))
+        try:
+            assert client.classify("order", "b.pdf")["doc_type"] == "ORDER"
+        finally:
+            client.close()
+            stop()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-page PDF extraction engine
+"""
+
+import pytest
+import io
+import os
+import sys
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+fitz = pytest.importorskip("fitz")
+import numpy as np
+from PIL import Image
+
+from core import page_extraction
+from core.page_extraction import IMAGE_ONLY, MIXED, TEXT_LAYER, extract_pdf_pages, iter_pdf_pages
+from core.page_render import PageRenderer, render_page_image
+
+
+def _png(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def mixed_pdf(tmp_path):
+    """PDF with a text page, a scanned page, a blank page and a text page with a large exhibit image"""
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Embedded text layer for this page. " * 4)
+    page = doc.new_page()
+    page.insert_image(page.rect, stream=_png(1240, 1754))
+    doc.new_page()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Exhibit A - stamped copy of the bond notice. " * 3, fontsize=7)
+    page.insert_image(fitz.Rect(72, 100, 520, 700), stream=_png(900, 1200))
+    path = tmp_path / "packet.pdf"
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+class TestPageExtraction:
+    """Test suite for per-page hybrid extraction decisions"""
+
+    def test_pages_are_classified(self, mixed_pdf):
+        """Test text-layer, image-only and mixed classification"""
+        doc = fitz.open(mixed_pdf)
+        plans = page_extraction.plan_document(doc)
+        doc.close()
+
+        assert [plan.kind for plan in plans] == [TEXT_LAYER, IMAGE_ONLY, TEXT_LAYER, MIXED]
+        assert [plan.needs_ocr for plan in plans] == [False, True, False, True]
+
+    def test_only_pages_needing_ocr_are_ocrd(self, mixed_pdf):
+        """Test that the OCR callable only receives image-only and mixed pages"""
+        seen = []
+
+        def fake_ocr(doc, plans):
+            seen.extend(plan.page_num for plan in plans)
+            return {plan.page_num: f"ocr text for page {plan.page_num} " * 10 for plan in plans}
+
+        pages = extract_pdf_pages(mixed_pdf, ocr_pages=fake_ocr)
+
+        assert seen == [1, 3]
+        assert pages[0][1].startswith("Embedded text layer")
+        assert pages[1][1].startswith("ocr text for page 1")
+        assert pages[3][1].startswith("ocr text for page 3")
+
+    def test_mixed_page_keeps_richer_embedded_text(self, mixed_pdf):
+        """Test that a weak OCR result does not replace the embedded text of a mixed page"""
+        pages = extract_pdf_pages(mixed_pdf, ocr_pages=lambda doc, plans: {p.page_num: "x" for p in plans})
+
+        assert pages[1][1] == "x"
+        assert pages[3][1].startswith("Exhibit A")
+
+    def test_dpi_follows_native_resolution_and_font_size(self, mixed_pdf):
+        """Test adaptive DPI selection"""
+        doc = fitz.open(mixed_pdf)
+        plans = page_extraction.plan_document(doc)
+        doc.close()
+
+        # 1240 px across an A4 page is ~150 DPI
+        assert abs(plans[1].dpi - 150) <= 5
+        # Small print on the mixed page forces a sharper render
+        assert plans[3].dpi >= 300
+
+    def test_dpi_is_capped_by_page_size(self):
+        """Test that large pages stay within the pixel budget"""
+        doc = fitz.open()
+        page = doc.new_page(width=17 * 72, height=22 * 72)
+        dpi = page_extraction.choose_dpi(page, native_dpi=600)
+        doc.close()
+
+        assert (17 * dpi) * (22 * dpi) <= page_extraction.MAX_RENDER_PIXELS
+        assert dpi >= page_extraction.MIN_DPI
+
+    def test_streaming_stops_before_later_ocr_windows(self, mixed_pdf):
+        """Test that pages are OCR'd a window at a time and only as far as the consumer reads"""
+        seen = []
+
+        def fake_ocr(doc, plans):
+            seen.extend(plan.page_num for plan in plans)
+            return {plan.page_num: "ocr text" for plan in plans}
+
+        pages = iter_pdf_pages(mixed_pdf, ocr_pages=fake_ocr, window=2)
+        first_plan, first_text = next(pages)
+        pages.close()
+
+        assert first_text.startswith("Embedded text layer")
+        assert seen == [1]
+
+    def test_clean_pages_rejoin_hyphenation_across_page_breaks(self):
+        """Test that streamed cleaning matches whole-document cleaning"""
+        from scripts.utils.extract_all import clean_text, iter_clean_pages
+
+        raw_pages = ["Notice  to appear for the immi-\n", "gration hearing.\n\nBond  set.", ""]
+        pages = list(iter_clean_pages(raw_pages))
+
+        assert pages == ["Notice to appear for the immigration", "hearing. Bond set.", ""]
+        assert " ".join(p for p in pages if p) == clean_text("\n\n".join(raw_pages))
+
+    def test_classify_mode_stops_at_character_target(self, tmp_path, monkeypatch):
+        """Test that classification extraction stops analyzing pages once it has enough text"""
+        from scripts.utils import extract_all
+
+        doc = fitz.open()
+        for n in range(20):
+            doc.new_page().insert_text((72, 72), f"Page {n} of the FOIA response. " * 5)
+        path = tmp_path / "foia.pdf"
+        doc.save(str(path))
+        doc.close()
+
+        analyzed = []
+        original = page_extraction.analyze_page
+        monkeypatch.setenv("EXTRACTION_CACHE", "off")
+        monkeypatch.setattr(page_extraction, "analyze_page",
+                            lambda page: analyzed.append(page.number) or original(page))
+
+        text = extract_all.extract_text_from_file(str(path), mode=extract_all.CLASSIFY_MODE,
+                                                  target_chars=400)
+        assert 400 <= len(text) < 1000
+        assert len(analyzed) <= 6
+
+        analyzed.clear()
+        full = extract_all.extract_text_from_file(str(path))
+        assert len(analyzed) == 20
+        assert full.startswith(text)
+
+
+    def test_classify_mode_caches_the_prefix_it_read(self, tmp_path, monkeypatch):
+        """Test that an early-stopping classification still populates the cache"""
+        from core import extraction_cache
+        from core.extraction_cache import file_digest
+        from scripts.utils import extract_all
+
+        doc = fitz.open()
+        for n in range(20):
+            doc.new_page().insert_text((72, 72), f"Page {n} of the FOIA response. " * 5)
+        path = tmp_path / "foia.pdf"
+        doc.save(str(path))
+        doc.close()
+
+        monkeypatch.setenv("EXTRACTION_CACHE_DIR", str(tmp_path / "cache"))
+        monkeypatch.setattr(extraction_cache, "_cache_instance", None)
+        monkeypatch.setattr(extract_all, "CLASSIFY_TARGET_CHARS", 400)
+        analyzed = []
+        original = page_extraction.analyze_page
+        monkeypatch.setattr(page_extraction, "analyze_page",
+                            lambda page: analyzed.append(page.number) or original(page))
+
+        first = extract_all.extract_text_from_file(str(path), mode=extract_all.CLASSIFY_MODE)
+        assert 0 < len(analyzed) < 20
+
+        analyzed.clear()
+        again = extract_all.extract_text_from_file(str(path), mode=extract_all.CLASSIFY_MODE)
+        assert again == first and analyzed == []
+
+        digest = file_digest(str(path))
+        assert extract_all.cached_text_for_digest(digest, extract_all.CLASSIFY_MODE) == first
+        # The prefix never stands in for a full extraction
+        assert extract_all.cached_text_for_digest(digest) is None
+
+class TestPageRender:
+    """Test suite for pixmap-backed page rendering"""
+
+    def test_grayscale_render_without_png_round_trip(self, mixed_pdf):
+        """Test that pages render to single-channel images at the requested DPI"""
+        doc = fitz.open(mixed_pdf)
+        image = render_page_image(doc.load_page(0), 144)
+        doc.close()
+
+        assert image.mode == "L"
+        assert image.size == (1190, 1684)
+
+    def test_renderer_views_pixmap_samples_without_copying(self, mixed_pdf):
+        """Test that renderer output shares memory with the pixmap and matches a standalone render"""
+        doc = fitz.open(mixed_pdf)
+        renderer = PageRenderer()
+
+        first = renderer.render(doc.load_page(0), 100).copy()
+        array = renderer.render_array(doc.load_page(3), 100)
+        samples = np.frombuffer(renderer._pix.samples_mv, dtype=np.uint8)
+        expected = render_page_image(doc.load_page(3), 100)
+
+        assert np.shares_memory(array, samples)
+        assert array.shape == (expected.height, expected.width)
+        assert array.tobytes() == expected.tobytes()
+        assert first.size == expected.size
+        doc.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the inter-process file lock
+"""
+
+import pytest
+import multiprocessing
+import os
+import sys
+import threading
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from core.process_lock import ProcessLock
+
+
+def _hold_lock(path, acquired, release):
+    lock = ProcessLock(path)
+    lock.acquire()
+    acquired.set()
+    release.wait(10)
+
+
+class TestProcessLock:
+    """Test suite for leader election between API workers"""
+
+    def test_only_one_process_holds_the_lock(self, tmp_path):
+        """Test that a second process cannot take the lock until the holder exits"""
+        path = str(tmp_path / "background.lock")
+        context = multiprocessing.get_context("spawn")
+        acquired, release = context.Event(), context.Event()
+        holder = context.Process(target=_hold_lock, args=(path, acquired, release))
+        holder.start()
+        try:
+            assert acquired.wait(30)
+            lock = ProcessLock(path)
+            assert not lock.acquire(blocking=False) and not lock.held
+        finally:
+            # The holder exits without releasing: the OS drops the lock with the process
+            release.set()
+            holder.join(30)
+
+        assert lock.acquire(blocking=False) and lock.held
+        with open(path) as fh:
+            assert fh.read() == str(os.getpid())
+        lock.release()
+        assert not lock.held
+
+    def test_threads_of_one_process_take_turns(self, tmp_path):
+        """Test that the lock also excludes other threads of the holding process"""
+        lock = ProcessLock(str(tmp_path / "delta.lock"))
+        inside, overlaps = [], []
+
+        def critical_section():
+            with lock:
+                inside.append(1)
+                overlaps.append(len(inside))
+                threading.Event().wait(0.02)
+                inside.pop()
+
+        threads = [threading.Thread(target=critical_section) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        assert overlaps == [1] * 5
+        assert lock.acquire(blocking=False)
+        assert not lock.acquire(blocking=False)
+        lock.release()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Tests for the $batch metadata writer
+"""
+
+import pytest
+import os
+import sys
+from unittest.mock import Mock, patch
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from core import sharepoint_integration
+from core.graph_client import GraphClient
+from core.sharepoint_batch import FieldUpdate, MetadataWriter
+from tests.graph_stub import GraphStub
+
+
+def batch_handler(outcomes):
+    """$batch endpoint answering each sub-request from outcomes[item_id] (a list, popped per try)"""
+    def handle(request):
+        requests = request["json"]["requests"]
+        if any("poison" in r["url"] for r in requests):
+            return 400, {"error": {"code": "BadRequest", "message": "Invalid batch payload"}}
+        responses = []
+        for r in requests:
+            item_id = r["url"].split("/items/")[1].split("/")[0]
+            status = outcomes.get(item_id, [200]).pop(0) if len(outcomes.get(item_id, [])) > 1 \
+                else outcomes.get(item_id, [200])[0]
+            reply = {"id": r["id"], "status": status, "body": {}}
+            if status == 429:
+                reply["headers"] = {"Retry-After": "0"}
+            elif status >= 400:
+                reply["body"] = {"error": {"code": "err", "message": f"status {status}"}}
+            responses.append(reply)
+        return 200, {"responses": list(reversed(responses))}  # Graph does not keep order
+    return handle
+
+
+class TestMetadataWriter:
+    """Test suite for batched SharePoint write-back"""
+
+    @pytest.fixture
+    def graph(self):
+        with GraphStub() as stub:
+            yield stub
+
+    def make_writer(self, graph, **kwargs):
+        app = Mock()
+        app.acquire_token_for_client.return_value = {"access_token": "t1", "expires_in": 3600}
+        client = GraphClient("tenant-batch", "client", "secret", graph_root=graph.url, app=app,
+                             backoff_base=0.01)
+        return MetadataWriter("s1", "l1", graph=client, **kwargs)
+
+    def test_updates_are_packed_twenty_per_batch(self, graph):
+        """Test packing, request shape and per-item results in input order"""
+        graph.add("POST", "/$batch", batch_handler({}))
+        writer = self.make_writer(graph)
+
+        results = writer.write(FieldUpdate(str(n), {"Document_x0020_Type": "Motion"}, f"{n}.pdf")
+                               for n in range(45))
+
+        batches = [r["json"]["requests"] for r in graph.calls("/$batch")]  # sent concurrently
+        assert sorted(len(batch) for batch in batches) == [5, 20, 20]
+        first = next(batch[0] for batch in batches if batch[0]["url"].endswith("/items/0/fields"))
+        assert first["method"] == "PATCH"
+        assert first["url"] == "/sites/s1/lists/l1/items/0/fields"
+        assert first["body"] == {"Document_x0020_Type": "Motion"}
+        assert [r.item_id for r in results] == [str(n) for n in range(45)]
+        assert all(r.success and r.attempts == 1 for r in results)
+
+    def test_failed_items_are_retried_individually(self, graph):
+        """Test that throttled items are re-sent alone and permanent errors are not retried"""
+        graph.add("POST", "/$batch", batch_handler({"b": [429, 200], "c": [503, 503, 503, 503], "d": [404]}))
+        writer = self.make_writer(graph, max_attempts=3)
+
+        results = {r.item_id: r for r in writer.write(FieldUpdate(i, {"x": 1}) for i in "abcd")}
+
+        assert results["a"].success and results["a"].attempts == 1
+        assert results["b"].success and results["b"].attempts == 2
+        assert not results["c"].success and results["c"].attempts == 3 and results["c"].status == 503
+        assert not results["d"].success and results["d"].attempts == 1 and results["d"].error == "status 404"
+        assert [len(r["json"]["requests"]) for r in graph.calls("/$batch")] == [4, 2, 1]
+
+    def test_rejected_batch_is_split_to_isolate_bad_item(self, graph):
+        """Test bisection of a batch rejected as a whole"""
+        graph.add("POST", "/$batch", batch_handler({}))
+        writer = self.make_writer(graph)
+
+        results = writer.write(FieldUpdate(i, {"x": 1}) for i in ["a", "b", "poison", "c", "d"])
+
+        assert [r.success for r in results] == [True, True, False, True, True]
+        assert results[2].status == 400
+        assert writer.stats["split"] >= 2
+
+    def test_throttled_batch_is_resent_whole(self, graph):
+        """Test that a 503 or connection failure of the whole batch backs off instead of splitting"""
+        graph.add("POST", "/$batch", (503, {"error": {"message": "busy"}}, {"Retry-After": "0"}),
+                  batch_handler({}))
+        writer = self.make_writer(graph)
+        writer.graph.max_retries = 0
+
+        results = writer.write(FieldUpdate(i, {"x": 1}) for i in "abcd")
+
+        assert all(r.success and r.attempts == 2 for r in results)
+        assert [len(r["json"]["requests"]) for r in graph.calls("/$batch")] == [4, 4]
+        assert writer.stats["split"] == 0
+
+        writer = MetadataWriter("s1", "l1", graph=GraphClient(
+            "tenant-batch", "client", "secret", graph_root="http://127.0.0.1:9", app=writer.graph._app,
+            max_retries=0, backoff_base=0.01), max_attempts=2)
+        results = writer.write(FieldUpdate(i, {"x": 1}) for i in "ab")
+
+        assert [(r.success, r.attempts) for r in results] == [(False, 2), (False, 2)]
+        assert "ConnectionError" in results[0].error
+        assert writer.stats == {"batches": 2, "retried": 2, "split": 0}
+
+    def test_unreadable_batch_response_is_resent_whole(self, graph):
+        """Test that a 200 with a body that is not JSON is retried as a transient failure"""
+        graph.add("POST", "/$batch", (200, None), batch_handler({}))
+        writer = self.make_writer(graph)
+
+        results = writer.write(FieldUpdate(i, {"x": 1}) for i in "abcd")
+
+        assert all(r.success and r.attempts == 2 for r in results)
+        assert [len(r["json"]["requests"]) for r in graph.calls("/$batch")] == [4, 4]
+        assert writer.stats["split"] == 0
+
+    def test_batch_update_metadata_reports_per_item_results(self, graph):
+        """Test the sharepoint_integration entry point on top of the writer"""
+        graph.add("POST", "/$batch", batch_handler({"2": [404]}))
+        client = self.make_writer(graph).graph
+        updates = [{"item_id": str(n), "filename": f"{n}.pdf", "doc_type": "Motion", "doc_category": "Civil"}
+                   for n in range(3)]
+
+        with patch.object(sharepoint_integration, "get_graph_client", return_value=client), \
+             patch.dict(os.environ, {"SITE_ID": "s1", "LIST_ID": "l1"}):
+            summary = sharepoint_integration.batch_update_metadata(updates)
+
+        assert summary["success"] == 2 and summary["failed"] == 1
+        assert summary["errors"] == ["Failed to update 2.pdf: 404 - status 404"]
+        assert [r["success"] for r in summary["results"]] == [True, True, False]
+        body = graph.calls("/$batch")[0]["json"]["requests"][0]["body"]
+        assert body == {"Document_x0020_Type": "Motion", "Document_x0020_Category": "Civil"}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
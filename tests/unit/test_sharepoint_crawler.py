@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Tests for the concurrent SharePoint folder crawler
+"""
+
+import pytest
+import asyncio
+import os
+import sys
+import threading
+from unittest.mock import Mock
+
+from aiohttp import web
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from core.graph_client import GraphClient
+from core.sharepoint_crawler import FolderCrawler
+
+# root -> A (2 pages), B; A -> A1; A1 -> A2 (depth 3)
+TREE = {
+    "root": [{"id": "A", "folder": {}}, {"id": "B", "folder": {}}, {"id": "r.pdf", "file": {}}],
+    "A": [{"id": "a1.pdf", "file": {}}, {"id": "A1", "folder": {}}, {"id": "a2.pdf", "file": {}}],
+    "B": [{"id": "b.pdf", "file": {}}],
+    "A1": [{"id": "a1x.pdf", "file": {}}, {"id": "A2", "folder": {}}],
+    "A2": [{"id": "deep.pdf", "file": {}}],
+}
+
+
+def make_graph(base_url, tenant="tenant-crawl", tokens=("test-token",)):
+    """GraphClient against the local stand-in, handing out `tokens` in turn"""
+    app = Mock()
+    app.acquire_token_for_client.side_effect = [{"access_token": token, "expires_in": 3600} for token in tokens]
+    return GraphClient(tenant, "c", "s", graph_root=base_url, backoff_base=0.01, app=app)
+
+
+@pytest.fixture
+def graph_stub():
+    """Local Graph stand-in: paginates folder A, throttles folder B once, fails "broken" folders"""
+    state = {"in_flight": 0, "max_in_flight": 0, "requests": [], "throttled": False,
+             "token": "test-token", "retry_after": "0"}
+
+    async def children(request):
+        item_id = request.match_info["item_id"]
+        state["requests"].append(item_id)
+        if request.headers["Authorization"] != f"Bearer {state['token']}":
+            return web.Response(status=401)
+        if item_id == "B" and not state["throttled"]:
+            state["throttled"] = True
+            return web.Response(status=429, headers={"Retry-After": state["retry_after"]})
+        if item_id in TREE.get("broken", []):
+            return web.Response(status=403)
+
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        await asyncio.sleep(0.02)
+        state["in_flight"] -= 1
+
+        value = TREE[item_id]
+        body = {"value": value}
+        if item_id == "A" and "page" not in request.query:
+            body = {"value": value[:2], "@odata.nextLink": f"{request.url.origin()}{request.path}?page=2"}
+        elif item_id == "A":
+            body = {"value": value[2:]}
+        return web.json_response(body)
+
+    app = web.Application()
+    app.router.add_get("/drives/d1/items/{item_id}/children", children)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{port}", state
+
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+class TestFolderCrawler:
+    """Test suite for breadth-first folder crawling"""
+
+    def test_crawl_finds_all_files_breadth_first(self, graph_stub):
+        """Test pagination, throttling retry, bounded concurrency and BFS order"""
+        base_url, state = graph_stub
+        crawler = FolderCrawler(make_graph(base_url), concurrency=2)
+
+        files = [item["id"] for item in crawler.iter_files([("drives/d1", "root")])]
+
+        assert sorted(files) == sorted(["r.pdf", "a1.pdf", "a2.pdf", "b.pdf", "a1x.pdf", "deep.pdf"])
+        assert files.index("deep.pdf") == len(files) - 1
+        assert files.index("b.pdf") < files.index("a1x.pdf")
+        assert state["max_in_flight"] <= 2
+        assert state["requests"].count("B") == 2
+        assert crawler.stats["throttled"] == 1
+        assert crawler.complete
+
+    def test_max_depth_limits_descent(self, graph_stub):
+        """Test the optional depth cap"""
+        base_url, _ = graph_stub
+        crawler = FolderCrawler(make_graph(base_url), concurrency=4, max_depth=1)
+
+        files = {item["id"] for item in crawler.iter_files([("drives/d1", "root")])}
+
+        assert files == {"r.pdf", "a1.pdf", "a2.pdf", "b.pdf"}
+
+    def test_consumer_can_stop_early(self, graph_stub):
+        """Test that files stream before the crawl ends and closing stops it"""
+        base_url, state = graph_stub
+        crawler = FolderCrawler(make_graph(base_url), concurrency=1)
+
+        files = crawler.iter_files([("drives/d1", "root")])
+        first = next(files)
+        files.close()
+
+        assert first["id"] == "r.pdf"
+        assert "A2" not in state["requests"]
+
+    def test_expired_token_is_refreshed(self, graph_stub):
+        """Test that a 401 fetches a new token from the client and retries"""
+        base_url, state = graph_stub
+        graph = make_graph(base_url, tenant="tenant-crawl-401", tokens=("stale", "test-token"))
+        crawler = FolderCrawler(graph, concurrency=1, max_depth=0)
+
+        files = {item["id"] for item in crawler.iter_files([("drives/d1", "B")])}
+
+        assert files == {"b.pdf"}
+        assert graph.stats["token_refreshes"] == 2
+
+    def test_http_date_retry_after_uses_tenant_pause(self, graph_stub):
+        """Test that an HTTP-date Retry-After is honoured and pauses the tenant"""
+        base_url, state = graph_stub
+        state["retry_after"] = "Wed, 21 Oct 2015 07:28:00 GMT"
+        graph = make_graph(base_url, tenant="tenant-crawl-date")
+        crawler = FolderCrawler(graph, concurrency=1, max_depth=0)
+
+        files = {item["id"] for item in crawler.iter_files([("drives/d1", "B")])}
+
+        assert files == {"b.pdf"}
+        assert state["requests"].count("B") == 2
+        assert graph.limiter.resume_at > 0  # the throttle paused the whole tenant
+
+    def test_failed_folders_are_reported(self, graph_stub, monkeypatch):
+        """Test that a folder that cannot be listed marks the listing incomplete"""
+        base_url, _ = graph_stub
+        monkeypatch.setitem(TREE, "broken", ["A1"])
+        crawler = FolderCrawler(make_graph(base_url), concurrency=2)
+
+        files = {item["id"] for item in crawler.iter_files([("drives/d1", "root")])}
+
+        assert files == {"r.pdf", "a1.pdf", "a2.pdf", "b.pdf"}
+        assert not crawler.complete
+        assert [folder for folder, _ in crawler.failed_folders] == [("drives/d1", "A1")]
+        assert crawler.stats["errors"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Tests for SharePoint delta-query sync
+"""
+
+import pytest
+import os
+import sys
+from unittest.mock import Mock
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from core.graph_client import GraphClient
+from core.sharepoint_delta import DeltaSync, delete_item_points
+
+
+def graph_response(status=200, body=None, headers=None):
+    response = Mock(status_code=status, headers=headers or {})
+    response.json.return_value = body or {}
+    response.raise_for_status = Mock()
+    return response
+
+
+class FakeSession:
+    """Serves canned Graph pages keyed by URL prefix"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.urls = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.urls.append(url)
+        for prefix, responses in self.pages.items():
+            if url.startswith(prefix):
+                return responses.pop(0)
+        raise AssertionError(f"Unexpected URL {url}")
+
+
+class TestDeltaSync:
+    """Test suite for incremental sync"""
+
+    @pytest.fixture
+    def state_path(self, tmp_path):
+        return str(tmp_path / "delta_state.json")
+
+    def test_first_run_enumerates_and_next_run_uses_token(self, state_path):
+        """Test pagination, token persistence and change classification"""
+        root = "https://graph.microsoft.com/v1.0/sites/site-1/drive/root/delta"
+        session = FakeSession({
+            root: [graph_response(body={
+                "value": [{"id": "f1", "name": "a.pdf", "file": {}}, {"id": "d1", "folder": {}}],
+                "@odata.nextLink": "https://next/page2"
+            })],
+            "https://next/page2": [graph_response(body={
+                "value": [{"id": "f2", "name": "b.pdf", "file": {}}],
+                "@odata.deltaLink": "https://delta/token1"
+            })],
+            "https://delta/token1": [graph_response(body={
+                "value": [{"id": "f1", "name": "a.pdf", "file": {}, "eTag": "v2"},
+                          {"id": "f2", "deleted": {"state": "deleted"}}],
+                "@odata.deltaLink": "https://delta/token2"
+            })],
+        })
+        sync = DeltaSync("site-1", "token", state_path=state_path, session=session)
+
+        first = sync.fetch_changes()
+        assert first.full_resync
+        assert [item["id"] for item in first.changed] == ["f1", "f2"]
+        assert sync.saved_delta_link() is None  # not saved until the caller applied it
+        sync.save_delta_link(first.delta_link)
+
+        second = DeltaSync("site-1", "token", state_path=state_path, session=session).fetch_changes()
+        assert not second.full_resync
+        assert [item["eTag"] for item in second.changed] == ["v2"]
+        assert second.deleted == ["f2"]
+        assert session.urls[-1] == "https://delta/token1"
+
+    def test_expired_token_falls_back_to_full_enumeration(self, state_path):
+        """Test 410 resync and Retry-After handling"""
+        root = "https://graph.microsoft.com/v1.0/sites/site-1/drive/root/delta"
+        session = FakeSession({
+            "https://delta/old": [graph_response(status=429, headers={"Retry-After": "0"}),
+                                  graph_response(status=410)],
+            root: [graph_response(body={"value": [{"id": "f1", "file": {}}],
+                                        "@odata.deltaLink": "https://delta/new"})],
+        })
+        sync = DeltaSync("site-1", "token", state_path=state_path, session=session)
+        sync.save_delta_link("https://delta/old")
+
+        changes = sync.fetch_changes()
+
+        assert changes.full_resync
+        assert changes.delta_link == "https://delta/new"
+        assert len(session.urls) == 3
+
+    def test_http_date_retry_after_is_honoured(self, state_path):
+        """Test that a Retry-After given as an HTTP date does not break the retry"""
+        session = FakeSession({
+            "https://delta/old": [graph_response(status=503, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}),
+                                  graph_response(body={"value": [], "@odata.deltaLink": "https://delta/new"})],
+        })
+        sync = DeltaSync("site-1", "token", state_path=state_path, session=session)
+        sync.save_delta_link("https://delta/old")
+
+        changes = sync.fetch_changes()
+
+        assert changes.delta_link == "https://delta/new"
+        assert len(session.urls) == 2
+
+    def test_graph_client_session_retries_once(self, state_path):
+        """Test that throttling is retried by the GraphClient only, not again by DeltaSync"""
+        graph = Mock(spec=GraphClient)
+        graph.get.return_value = graph_response(status=429)
+        sync = DeltaSync("site-1", "token", state_path=state_path, session=graph)
+
+        response = sync._get("https://delta/old")
+
+        assert response.status_code == 429
+        graph.get.assert_called_once_with("https://delta/old", timeout=sync.timeout)
+
+    def test_deleted_items_are_removed_from_qdrant(self):
+        """Test payload item_id based deletion across collections"""
+        client = QdrantClient(":memory:")
+        for name in ("documents", "complete_project_library"):
+            client.create_collection(name, vectors_config=VectorParams(size=2, distance=Distance.COSINE))
+            client.upsert(name, [PointStruct(id=n, vector=[1.0, float(n)], payload={"item_id": f"f{n % 3}"})
+                                 for n in range(6)])
+
+        cleaned = delete_item_points(client, ["f0", "f2"], ["documents", "complete_project_library", "missing"])
+
+        assert cleaned == ["documents", "complete_project_library"]
+        for name in cleaned:
+            remaining = client.scroll(name, limit=10)[0]
+            assert {point.payload["item_id"] for point in remaining} == {"f1"}
+
+    def test_replaced_version_points_are_removed_after_reindex(self):
+        """Test that keep_doc_ids spares the new version while old points of the item go"""
+        client = QdrantClient(":memory:")
+        client.create_collection("library", vectors_config=VectorParams(size=2, distance=Distance.COSINE))
+        client.upsert("library", [
+            PointStruct(id=n, vector=[1.0, float(n)], payload={"item_id": item_id, "doc_id": doc_id})
+            for n, (item_id, doc_id) in enumerate([("f1", "old"), ("f1", "old"), ("f1", "new"), ("f2", "old")])
+        ])
+
+        delete_item_points(client, ["f1"], ["library"], keep_doc_ids=["new"])
+
+        remaining = client.scroll("library", limit=10)[0]
+        assert sorted((p.payload["item_id"], p.payload["doc_id"]) for p in remaining) == [("f1", "new"), ("f2", "old")]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
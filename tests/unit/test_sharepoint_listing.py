@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for trimmed SharePoint listing queries
+"""
+
+import pytest
+import os
+import sys
+from datetime import datetime, timezone
+from unittest.mock import Mock, patch
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from core.graph_client import GraphClient
+from core.sharepoint_crawler import FolderCrawler
+from core.sharepoint_listing import DRIVE_ITEM_SELECT, ListingFilter, iter_list_items, list_items_query
+from tests.graph_stub import GraphStub
+
+
+class TestSharePointListing:
+    """Test suite for $select/$expand/$filter listing"""
+
+    @pytest.fixture
+    def graph(self):
+        with GraphStub() as stub:
+            yield stub
+
+    def test_list_items_expand_drive_item_in_one_query(self, graph):
+        """Test that case listing pages carry fields and driveItem parents (no N+1)"""
+        page2 = {"value": [{"id": "2", "fields": {"FileLeafRef": "B"},
+                            "driveItem": {"id": "d2", "parentReference": {"driveId": "x", "id": "p"}}}]}
+        graph.add("GET", "/sites/s1/lists/l1/items",
+                  lambda request: (200, page2) if "page" in request["query"] else
+                  (200, {"value": [{"id": "1", "fields": {"FileLeafRef": "A"},
+                                    "driveItem": {"id": "d1", "parentReference": {"driveId": "x", "id": "p"}}}],
+                         "@odata.nextLink": f"{graph.url}/sites/s1/lists/l1/items?page=2"}))
+        app = Mock()
+        app.acquire_token_for_client.return_value = {"access_token": "t1", "expires_in": 3600}
+        client = GraphClient("tenant-list", "c", "s", graph_root=graph.url, app=app)
+
+        items = list(iter_list_items(client, "s1", "l1"))
+
+        assert [item["driveItem"]["id"] for item in items] == ["d1", "d2"]
+        query = graph.requests[0]["query"]
+        assert query["$select"] == ["id"]
+        assert query["$expand"] == ["fields($select=FileLeafRef,Title),driveItem($select=id,name,parentReference)"]
+        assert "$filter" not in query and "Prefer" not in graph.requests[0]["headers"]
+        assert len(graph.requests) == 2
+
+    def test_filters_are_sent_server_side_for_list_items(self):
+        """Test the OData filter and the non-indexed query header"""
+        listing_filter = ListingFilter(frozenset({".pdf", ".docx"}), datetime(2025, 1, 1, tzinfo=timezone.utc))
+
+        path, headers = list_items_query("s1", "l1", listing_filter=listing_filter)
+
+        assert path.endswith("&$filter=fields/Modified ge '2025-01-01T00:00:00Z' and "
+                             "(fields/File_x0020_Type eq 'docx' or fields/File_x0020_Type eq 'pdf')")
+        assert headers == {"Prefer": "HonorNonIndexedQueriesWarningMayFailRandomly"}
+        assert list_items_query("s1", "l1", listing_filter=ListingFilter())[1] == {}
+
+    def test_filter_from_env_and_client_side_check(self):
+        """Test env parsing and the check applied to drive children"""
+        with patch.dict(os.environ, {"LISTING_EXTENSIONS": "PDF, .docx", "LISTING_MODIFIED_SINCE": "2025-06-01"}):
+            listing_filter = ListingFilter.from_env()
+
+        assert listing_filter.extensions == {".pdf", ".docx"}
+        assert listing_filter.accepts({"name": "a.PDF", "file": {}, "lastModifiedDateTime": "2025-06-02T00:00:00Z"})
+        assert not listing_filter.accepts({"name": "a.pdf", "file": {}, "lastModifiedDateTime": "2025-05-31T23:00:00Z"})
+        assert not listing_filter.accepts({"name": "a.xlsx", "file": {}})
+        assert listing_filter.accepts({"name": "Case 1", "folder": {}})
+        assert not ListingFilter()
+
+    def test_crawler_selects_properties_and_skips_filtered_files(self, graph):
+        """Test $select on children and filtering before files reach the consumer"""
+        graph.add("GET", "/drives/d1/items/root/children",
+                  (200, {"value": [{"id": "1", "name": "a.pdf", "file": {}},
+                                   {"id": "2", "name": "b.xlsx", "file": {}},
+                                   {"id": "F", "name": "sub", "folder": {}}]}))
+        graph.add("GET", "/drives/d1/items/F/children", (200, {"value": [{"id": "3", "name": "c.pdf", "file": {}}]}))
+        app = Mock()
+        app.acquire_token_for_client.return_value = {"access_token": "t1", "expires_in": 3600}
+        client = GraphClient("tenant-crawl-filter", "c", "s", graph_root=graph.url, app=app)
+        crawler = FolderCrawler(client, listing_filter=ListingFilter(frozenset({".pdf"})))
+
+        files = [item["id"] for item in crawler.iter_files([("drives/d1", "root")])]
+
+        assert files == ["1", "3"]
+        assert crawler.stats["filtered"] == 1
+        assert graph.requests[0]["query"]["$select"] == [DRIVE_ITEM_SELECT]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Tests for Graph change notifications (webhook receiver, debounced delta, subscriptions)
+"""
+
+import pytest
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from core.change_index import CLASSIFY, ChangeIndex
+from core.graph_client import GraphClient
+from core.job_queue import JobQueue
+from core.process_lock import ProcessLock
+from core.sharepoint_delta import DeltaSync
+from core.sharepoint_webhook import ChangeFeed, SubscriptionManager, WebhookReceiver, verify_notifications
+from tests.graph_stub import GraphStub
+
+DELTA_PATH = "/sites/s1/drive/root/delta"
+
+
+def drive_item(item_id, list_item_id, etag="e1", qxh="h1", name="a.pdf"):
+    return {"id": item_id, "name": name, "eTag": etag, "cTag": "c1", "size": 10,
+            "file": {"hashes": {"quickXorHash": qxh}}, "sharepointIds": {"listItemId": list_item_id}}
+
+
+def expires_in(seconds):
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class TestSharePointWebhook:
+    """Test suite for webhook-driven classification"""
+
+    @pytest.fixture
+    def graph(self):
+        with GraphStub() as stub:
+            yield stub
+
+    @pytest.fixture
+    def client(self, graph):
+        app = Mock()
+        app.acquire_token_for_client.return_value = {"access_token": "t1", "expires_in": 3600}
+        return GraphClient("tenant-webhook", "c", "s", graph_root=graph.url, app=app, backoff_base=0.01)
+
+    def delta_pages(self, graph, pages):
+        """Serve `pages[token]` for each delta token, chaining to the next token"""
+        def reply(request):
+            token = request["query"].get("token", ["start"])[0]
+            value, next_token = pages[token]
+            return 200, {"value": value, "@odata.deltaLink": f"{graph.url}{DELTA_PATH}?token={next_token}"}
+        graph.add("GET", DELTA_PATH, reply)
+
+    def test_client_state_is_checked_and_lifecycle_renews(self):
+        """Test that forged notifications are dropped and lifecycle events renew"""
+        feed, subscriptions = Mock(), Mock()
+        receiver = WebhookReceiver(feed, subscriptions, "secret")
+
+        valid, rejected = verify_notifications(
+            {"value": [{"clientState": "secret"}, {"clientState": "guess"}, {}]}, "secret")
+        assert len(valid) == 1 and rejected == 2
+        assert receiver.handle({"value": [{"clientState": "nope"}]}) == 0
+        assert feed.notify.call_count == 0
+
+        assert receiver.handle({"value": [{"clientState": "secret", "lifecycleEvent": "reauthorizationRequired"}]}) == 1
+        deadline = time.time() + 2
+        while not subscriptions.ensure.called and time.time() < deadline:
+            time.sleep(0.01)
+        subscriptions.ensure.assert_called_once_with(force_renew=True)
+        assert feed.notify.call_count == 1
+
+    def test_subscription_is_created_adopted_and_renewed(self, graph, client):
+        """Test POST when missing, PATCH near expiry, and re-create after a 404"""
+        resource, hook = "sites/s1/drive/root", "https://example.org/webhooks/sharepoint"
+        graph.add("GET", "/subscriptions", (200, {"value": [
+            {"id": "other", "resource": "sites/s2/drive/root", "notificationUrl": hook,
+             "expirationDateTime": expires_in(10 ** 6)}]}))
+        graph.add("POST", "/subscriptions",
+                  (201, {"id": "sub1", "expirationDateTime": expires_in(3600)}),
+                  (201, {"id": "sub2", "expirationDateTime": expires_in(10 ** 6)}))
+        graph.add("PATCH", "/subscriptions/sub1", (200, {"id": "sub1", "expirationDateTime": expires_in(10 ** 6)}))
+        manager = SubscriptionManager(client, resource, hook, "secret", renew_margin=24 * 3600)
+
+        assert manager.ensure()["id"] == "sub1"
+        created = graph.calls("/subscriptions")[1]["json"]
+        assert created["resource"] == resource and created["clientState"] == "secret"
+        assert created["changeType"] == "updated"
+
+        # Expires within the margin: renewed in place
+        assert manager.ensure()["id"] == "sub1"
+        assert len(graph.calls("/subscriptions/sub1")) == 1
+        manager.ensure()
+        assert len(graph.calls("/subscriptions/sub1")) == 1  # now far from expiry
+
+        # Graph dropped it: renewal 404s and a new one is created
+        graph.add("PATCH", "/subscriptions/sub1", (404, {}))
+        assert manager.ensure(force_renew=True)["id"] == "sub2"
+
+    def test_burst_is_debounced_into_one_delta_round(self, graph, client, tmp_path):
+        """Test that notifications collapse into one round that queues only changed files"""
+        self.delta_pages(graph, {
+            "latest": ([], "t0"),
+            "t0": ([drive_item("d1", "11"), drive_item("d2", "12", qxh="h2", name="b.xlsx"),
+                    {"id": "gone", "deleted": {}}, {"id": "fold", "folder": {}}], "t1"),
+        })
+        delta = DeltaSync("s1", "", session=client, graph_root=graph.url,
+                          state_path=str(tmp_path / "delta.json"))
+        index = ChangeIndex(str(tmp_path / "index.db"))
+        index.record(CLASSIFY, {"id": "gone"})
+        jobs = []
+        feed = ChangeFeed(delta, lambda items: jobs.append(items) or "job1", change_index=index,
+                          debounce=0.2, max_delay=5)
+        feed.listing_filter = Mock(accepts=lambda item: not item["name"].endswith(".xlsx"))
+
+        feed.start()
+        try:
+            assert delta.saved_delta_link().endswith("token=t0")  # no backlog enumeration
+            for _ in range(20):
+                feed.notify()
+                time.sleep(0.01)
+            deadline = time.time() + 5
+            while feed.stats["rounds"] < 1 and time.time() < deadline:
+                time.sleep(0.02)
+            time.sleep(0.3)
+        finally:
+            feed.stop()
+
+        assert feed.stats["rounds"] == 1 and feed.stats["notifications"] == 20
+        assert len(graph.calls(DELTA_PATH)) == 2
+        assert [[(i["item_id"], i["update_metadata"]) for i in items] for items in jobs] == [[("11", True)]]
+        assert jobs[0][0]["drive_item"]["id"] == "d1"
+        assert feed.stats["filtered"] == 1
+        assert delta.saved_delta_link().endswith("token=t1")
+        assert index.check(CLASSIFY, {"id": "gone"}).status == "new"
+
+    def test_own_write_back_does_not_requeue(self, graph, client, tmp_path):
+        """Test the queue write-back records the version so its notification is skipped"""
+        self.delta_pages(graph, {
+            "t0": ([drive_item("d1", "11")], "t1"),
+            "t1": ([drive_item("d1", "11", etag="e2")], "t2"),   # our metadata update
+            "t2": ([drive_item("d1", "11", etag="e3", qxh="h9")], "t3"),  # a new upload
+        })
+        delta = DeltaSync("s1", "", session=client, graph_root=graph.url,
+                          state_path=str(tmp_path / "delta.json"))
+        delta.save_delta_link(f"{graph.url}{DELTA_PATH}?token=t0")
+        index = ChangeIndex(str(tmp_path / "index.db"))
+        written = []
+
+        def write_back(item, result):
+            written.append((item["item_id"], result["document_type"]))
+            index.record(CLASSIFY, item["drive_item"], {"doc_type": result["document_type"]})
+
+        queue = JobQueue(lambda text, filename, item_id: {"filename": filename, "document_type": "Motion"},
+                         resolve_fn=lambda item_id: ("text", "a.pdf", "d1"), writeback_fn=write_back,
+                         db_path=str(tmp_path / "jobs.db"), poll_interval=0.01)
+        feed = ChangeFeed(delta, queue.submit, change_index=index)
+        queue.start()
+        try:
+            job_id = feed.sync_once()
+            deadline = time.time() + 5
+            while queue.get_job(job_id)["status"] != "completed" and time.time() < deadline:
+                time.sleep(0.02)
+            assert written == [("11", "Motion")]
+
+            assert feed.sync_once() is None
+            assert feed.stats["unchanged"] == 1
+            assert feed.sync_once() is not None
+        finally:
+            queue.close()
+
+    def test_feeds_in_several_workers_queue_each_change_once(self, graph, client, tmp_path):
+        """Test that concurrent rounds sharing the token file take turns instead of both enqueuing"""
+        self.delta_pages(graph, {
+            "t0": ([drive_item("d1", "11")], "t1"),
+            "t1": ([], "t1"),
+        })
+        state_path = str(tmp_path / "delta.json")
+        jobs = []
+
+        def slow_enqueue(items):
+            time.sleep(0.2)  # the other round would read the old token meanwhile
+            jobs.append(items)
+            return "job"
+
+        feeds = []
+        for _ in range(2):
+            delta = DeltaSync("s1", "", session=client, graph_root=graph.url, state_path=state_path)
+            # A separate lock object per feed behaves like a separate process
+            feeds.append(ChangeFeed(delta, slow_enqueue, lock=ProcessLock(str(tmp_path / "delta.lock"))))
+        feeds[0].delta.save_delta_link(f"{graph.url}{DELTA_PATH}?token=t0")
+
+        rounds = [threading.Thread(target=feed.sync_once) for feed in feeds]
+        for thread in rounds:
+            thread.start()
+        for thread in rounds:
+            thread.join(timeout=5)
+
+        assert [[item["item_id"] for item in items] for items in jobs] == [["11"]]
+        assert feeds[1].delta.saved_delta_link().endswith("token=t1")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming, resumable file downloads
+"""
+
+import pytest
+import asyncio
+import hashlib
+import os
+import sys
+import threading
+
+from aiohttp import web
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from core.streaming_download import DownloadError, DownloadTooLarge, StreamingDownloader
+
+BODY = bytes(range(256)) * 4096  # 1 MiB
+
+
+@pytest.fixture
+def file_server():
+    """Serves BODY with Range support; `flaky` drops the first connection half way"""
+    state = {"ranges": [], "active": 0, "max_active": 0, "dropped": set()}
+
+    async def handler(request):
+        name = request.match_info["name"]
+        state["ranges"].append((name, request.headers.get("Range"), request.headers.get("If-Range")))
+        if name == "big.pdf":
+            return web.Response(body=b"x" * (len(BODY) + 1))
+        start = 0
+        if request.headers.get("Range") and name != "norange.pdf":
+            start = int(request.headers["Range"].split("=")[1].rstrip("-"))
+        response = web.StreamResponse(status=206 if start else 200, headers={"ETag": '"v1"'})
+        if start:
+            response.headers["Content-Range"] = f"bytes {start}-{len(BODY) - 1}/{len(BODY)}"
+        response.content_length = len(BODY) - start
+        await response.prepare(request)
+
+        state["active"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        try:
+            body = BODY[start:]
+            drop = name in ("flaky.pdf", "norange.pdf") and name not in state["dropped"]
+            for offset in range(0, len(body), 65536):
+                if drop and offset >= len(body) // 2:
+                    state["dropped"].add(name)
+                    request.transport.close()
+                    return response
+                await response.write(body[offset:offset + 65536])
+                await asyncio.sleep(0.001)
+            await response.write_eof()
+            return response
+        finally:
+            state["active"] -= 1
+
+    app = web.Application()
+    app.router.add_get("/{name}", handler)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{port}", state
+
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+class TestStreamingDownloader:
+    """Test suite for chunked downloads with limits and resume"""
+
+    def test_interrupted_download_resumes_with_range(self, file_server, tmp_path):
+        """Test Range resume (sync) keeps one continuous hash"""
+        base_url, state = file_server
+        downloader = StreamingDownloader(chunk_size=32768, backoff_base=0.01)
+
+        result = downloader.download(f"{base_url}/flaky.pdf", tmp_path / "flaky.pdf")
+
+        assert result.resumed == 1
+        assert result.size == len(BODY)
+        assert result.sha256 == hashlib.sha256(BODY).hexdigest()
+        assert (tmp_path / "flaky.pdf").read_bytes() == BODY
+        assert state["ranges"][1][1].startswith("bytes=") and state["ranges"][1][2] == '"v1"'
+        assert not (tmp_path / "flaky.pdf.part").exists()
+
+    def test_server_ignoring_range_restarts_cleanly(self, file_server, tmp_path):
+        """Test that a 200 reply to a Range request rewrites the file from the start"""
+        base_url, _ = file_server
+        downloader = StreamingDownloader(backoff_base=0.01)
+
+        result = downloader.download(f"{base_url}/norange.pdf", tmp_path / "norange.pdf")
+
+        assert result.resumed == 0
+        assert result.sha256 == hashlib.sha256(BODY).hexdigest()
+        assert (tmp_path / "norange.pdf").read_bytes() == BODY
+
+    def test_size_limit_aborts_without_leaving_files(self, file_server, tmp_path):
+        """Test max_bytes enforcement from Content-Length"""
+        base_url, _ = file_server
+        downloader = StreamingDownloader(max_bytes=len(BODY))
+
+        with pytest.raises(DownloadTooLarge):
+            downloader.download(f"{base_url}/big.pdf", tmp_path / "big.pdf")
+        with pytest.raises(DownloadError):
+            StreamingDownloader(timeout=-1).download(f"{base_url}/ok.pdf", tmp_path / "ok.pdf")
+        assert list(tmp_path.iterdir()) == []
+
+    def test_async_pool_is_bounded_and_resumes(self, file_server, tmp_path):
+        """Test concurrent downloads on the async pool, including a resumed one"""
+        base_url, state = file_server
+        downloader = StreamingDownloader(concurrency=2, backoff_base=0.01)
+        jobs = [(f"{base_url}/doc{n}.pdf", tmp_path / f"doc{n}.pdf") for n in range(5)]
+        jobs.append((f"{base_url}/flaky.pdf", tmp_path / "flaky.pdf"))
+        jobs.append((f"{base_url}/big.pdf", tmp_path / "big.pdf"))
+        downloader.max_bytes = len(BODY)
+
+        results = asyncio.run(downloader.fetch_all(jobs))
+
+        assert all(r.sha256 == hashlib.sha256(BODY).hexdigest() for r in results[:6])
+        assert results[5].resumed == 1
+        assert state["max_active"] <= 2
+        assert isinstance(results[6], DownloadTooLarge)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
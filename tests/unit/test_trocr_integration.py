@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Tests for line segmentation, batched recognition and page-parallel OCR in the
+TrOCR integration module
+"""
+
+import pytest
+import multiprocessing
+import multiprocessing.pool
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+import fitz
+import numpy as np
+from PIL import Image
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import core.trocr_integration as trocr_integration
+from core.page_extraction import IMAGE_ONLY, PagePlan
+from core.trocr_integration import HybridOCRProcessor, TrOCRProcessor, segment_text_lines
+
+# Page widths identify pages in the rendered payloads (72 dpi renders 1pt = 1px)
+PAGE_WIDTHS = [100, 110, 120, 130, 140]
+
+
+def fake_page_worker(samples, width, height, channels, stride, timeout):
+    # Later pages finish first, so collection order is not completion order
+    time.sleep(0.02 * (PAGE_WIDTHS[-1] - width) / 10)
+    return f"page {width}"
+
+
+class FakeResult:
+    def __init__(self, pool, fn, args):
+        self.pool, self.fn, self.args = pool, fn, args
+
+    def get(self, timeout=None):
+        if self.args[1] in self.pool.hang:
+            raise multiprocessing.TimeoutError()
+        return self.fn(*self.args)
+
+
+class FakePool:
+    """Records submitted pages; pages whose width is in `hang` never finish"""
+
+    def __init__(self, hang):
+        self.hang = hang
+        self.pages = []
+        self.terminated = False
+
+    def apply_async(self, fn, args):
+        self.pages.append(args[1])
+        return FakeResult(self, fn, args)
+
+    def terminate(self):
+        self.terminated = True
+
+    def join(self):
+        pass
+
+
+def page_with_lines(bands, size=(400, 300)):
+    """White page with black bars at the given (top, bottom, left, right) bands"""
+    pixels = np.full((size[1], size[0]), 255, dtype=np.uint8)
+    for top, bottom, left, right in bands:
+        pixels[top:bottom, left:right] = 0
+    return Image.fromarray(pixels)
+
+
+class FakeLineModel:
+    """TrOCR processor/model stand-in; a crop's width stands for its text"""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, images, return_tensors):
+        self.batches.append(len(images))
+        return SimpleNamespace(pixel_values=[image.width for image in images])
+
+    def generate(self, pixel_values, max_new_tokens):
+        return pixel_values
+
+    def batch_decode(self, ids, skip_special_tokens):
+        return [f"line {width}" for width in ids]
+
+
+class TestLineRecognition:
+    """Test suite for the line segmenter and batched TrOCR recognition"""
+
+    def test_projection_segmenter_finds_lines_in_reading_order(self, monkeypatch):
+        """Test line crops from the profile segmenter, without a Tesseract pass"""
+        monkeypatch.setattr(trocr_integration, "_tesseract_line_boxes",
+                            lambda image: pytest.fail("default segmentation ran Tesseract"))
+        # Three text lines, plus a 2px speck too short to be a line
+        image = page_with_lines([(20, 40, 50, 350), (60, 75, 50, 200), (100, 102, 10, 390),
+                                 (150, 180, 80, 300)])
+
+        crops = segment_text_lines(image)
+
+        padding = trocr_integration.LINE_PADDING
+        assert [crop.size for crop in crops] == [
+            (300 + 2 * padding, 20 + 2 * padding),
+            (150 + 2 * padding, 15 + 2 * padding),
+            (220 + 2 * padding, 30 + 2 * padding),
+        ]
+        assert all(crop.mode == "RGB" for crop in crops)
+        assert segment_text_lines(page_with_lines([])) == []
+
+    def test_lines_are_recognized_in_batches(self, monkeypatch):
+        """Test that TROCR_BATCH_SIZE bounds each generate call and order is kept"""
+        monkeypatch.setattr(TrOCRProcessor, "_initialize_model", lambda self: None)
+        monkeypatch.setenv("TROCR_BATCH_SIZE", "4")
+        trocr = TrOCRProcessor()
+        trocr.processor = trocr.model = FakeLineModel()
+
+        crops = [Image.new("RGB", (10 + i, 8), "white") for i in range(10)]
+
+        assert trocr.batch_size == 4
+        assert trocr.recognize_lines(crops) == [f"line {10 + i}" for i in range(10)]
+        assert trocr.model.batches == [4, 4, 2]
+
+
+class TestParallelOCR:
+    """Test suite for the page-parallel OCR pool"""
+
+    @pytest.fixture
+    def processor(self, monkeypatch):
+        monkeypatch.setattr(TrOCRProcessor, "_initialize_model", lambda self: None)
+        monkeypatch.setattr(trocr_integration, "_ocr_page_worker", fake_page_worker)
+        processor = HybridOCRProcessor(parallel=True, max_workers=2, max_in_flight=2, page_timeout=5)
+        yield processor
+        processor.close()
+
+    @pytest.fixture
+    def doc(self):
+        doc = fitz.open()
+        for width in PAGE_WIDTHS:
+            doc.new_page(width=width, height=100)
+        yield doc
+        doc.close()
+
+    @pytest.fixture
+    def plans(self):
+        return [PagePlan(page_num, IMAGE_ONLY, "", dpi=72) for page_num in range(len(PAGE_WIDTHS))]
+
+    def test_results_come_back_in_page_order(self, processor, doc, plans, monkeypatch):
+        """Test that pages finishing out of order are still mapped and collected in order"""
+        methods = []
+
+        class Context:
+            def Pool(self, processes, initializer=None, initargs=()):
+                return multiprocessing.pool.ThreadPool(processes)
+
+        monkeypatch.setattr(trocr_integration.multiprocessing, "get_context",
+                            lambda method: methods.append(method) or Context())
+
+        results = processor._ocr_pages(doc, plans, "tesseract")
+
+        assert methods == ["spawn"]
+        assert list(results.items()) == [(n, f"page {width}") for n, width in enumerate(PAGE_WIDTHS)]
+
+    def test_timed_out_page_recycles_the_pool_immediately(self, processor, doc, plans, monkeypatch):
+        """Test that a hung page is skipped and the pages queued behind it move to a new pool"""
+        pools = []
+
+        class Context:
+            def Pool(self, processes, initializer=None, initargs=()):
+                pools.append(FakePool(hang={110} if not pools else set()))
+                return pools[-1]
+
+        monkeypatch.setattr(trocr_integration.multiprocessing, "get_context", lambda method: Context())
+
+        results = processor._ocr_pages(doc, plans, "tesseract")
+
+        assert sorted(results) == [0, 2, 3, 4]
+        assert results[2] == "page 120"
+        assert len(pools) == 2 and pools[0].terminated and not pools[1].terminated
+        # Page 2 was waiting behind the hung page and is resubmitted, not lost
+        assert pools[1].pages == [120, 130, 140]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])